@@ -20,9 +20,22 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+
+    # WAL, pragmas, serialized writer and reader engine for file-based SQLite
+    from app.utils.db_utils import init_sqlite_profile
+    init_sqlite_profile(app)
+
+    # Opt-in per-request SQL profiling (SQL_PROFILER=1)
+    from app.utils.sql_profiler import init_sql_profiler
+    init_sql_profiler(app)
     login_manager.init_app(app)
     bcrypt.init_app(app)
 
+    # Registers the user cache's invalidation listeners (password/role change, logout)
+    from app.utils import user_cache # noqa: F401
+    # Keeps Buyer.name_key current for name matching (bank statement import)
+    from app.utils import name_keys # noqa: F401
+
     # Register Blueprints (routes)
     from app.routes.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -39,6 +52,13 @@ def create_app(config_class=Config):
     from app.routes.reports import bp as reports_bp
     app.register_blueprint(reports_bp, url_prefix='/reports')
 
+    from app.routes.auction import bp as auction_bp
+    app.register_blueprint(auction_bp, url_prefix='/auction')
+
+    # Register CLI commands (flask bench-startup, ...)
+    from app.commands import register_commands
+    register_commands(app)
+
     # Create database tables if they don't exist (useful for initial setup/simple cases)
     # For production/complex changes, use Flask-Migrate: flask db init, flask db migrate, flask db upgrade
     with app.app_context():
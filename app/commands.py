@@ -0,0 +1,340 @@
+# file: app/commands.py
+# Flask CLI commands (run with `flask <command>`).
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from flask.cli import with_appcontext
+
+# Libraries that should only be imported on first use (see pdf_utils / barcode_utils)
+HEAVY_MODULES = ('reportlab', 'barcode', 'openpyxl', 'hdate', 'bidi', 'PIL', 'pandas')
+
+# Runs in a fresh interpreter: time the app import + create_app, then report RSS
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024 # macOS reports bytes
+except ImportError: # Windows
+    rss_kb = 0
+heavy = sorted(m for m in %r if m in sys.modules)
+print(json.dumps({'seconds': elapsed, 'rss_mb': rss_kb / 1024, 'heavy': heavy}))
+"""
+
+
+def register_commands(app):
+    app.cli.add_command(bench_startup)
+    app.cli.add_command(generate_season)
+    app.cli.add_command(archive_year)
+    app.cli.add_command(refresh_balances)
+    app.cli.add_command(import_statement)
+    app.cli.add_command(annual_statements)
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(bench_sqlite)
+    app.cli.add_command(seed_synthetic)
+    app.cli.add_command(bench_hot_paths)
+
+
+@click.command('bench-startup')
+@click.option('--runs', default=5, show_default=True, help='Number of fresh interpreters to start.')
+def bench_startup(runs):
+    """Measures worker startup: app import time, RSS and heavy modules loaded."""
+    probe = _STARTUP_PROBE % (HEAVY_MODULES,)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', probe], capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        samples.append(json.loads(output))
+
+    seconds = [s['seconds'] * 1000 for s in samples]
+    rss = [s['rss_mb'] for s in samples]
+    click.echo(f"Startup over {runs} runs:")
+    click.echo(f"  import + create_app: median {statistics.median(seconds):.0f} ms "
+               f"(min {min(seconds):.0f}, max {max(seconds):.0f})")
+    click.echo(f"  max RSS per worker:  median {statistics.median(rss):.1f} MB")
+    heavy = samples[-1]['heavy']
+    click.echo(f"  heavy modules loaded at startup: {', '.join(heavy) if heavy else 'none'}")
+
+
+@click.command('generate-season')
+@click.argument('hebrew_year', type=int)
+@click.option('--shabbat/--no-shabbat', default=True, show_default=True, help='Create an event for every Shabbat.')
+@click.option('--holidays/--no-holidays', default=True, show_default=True, help='Create events for weekday holidays.')
+@click.option('--dry-run', is_flag=True, help='List the events without saving them.')
+@with_appcontext
+def generate_season(hebrew_year, shabbat, holidays, dry_run):
+    """Creates the Shabbat and holiday events of HEBREW_YEAR (e.g. 5786), skipping existing dates."""
+    from app.utils.event_utils import generate_season_events
+
+    start = time.perf_counter()
+    created, skipped = generate_season_events(hebrew_year, shabbat, holidays, dry_run=dry_run)
+    elapsed = (time.perf_counter() - start) * 1000
+    for plan in created:
+        click.echo(f"  {plan.gregorian_date:%Y-%m-%d}  {plan.hebrew_date}  {plan.event_name}")
+    verb = 'Would create' if dry_run else 'Created'
+    click.echo(f"{verb} {len(created)} events, skipped {len(skipped)} existing dates ({elapsed:.0f} ms).")
+
+
+@click.command('archive-year')
+@click.argument('hebrew_year', type=int)
+@click.option('--vacuum', is_flag=True, help='VACUUM the main database afterwards to reclaim space.')
+@with_appcontext
+def archive_year(hebrew_year, vacuum):
+    """Moves the purchases of a closed HEBREW_YEAR into its archive file."""
+    from app.utils.archive_utils import ArchiveError, archive_hebrew_year
+
+    start = time.perf_counter()
+    try:
+        archive = archive_hebrew_year(hebrew_year, vacuum=vacuum)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+    click.echo(f"Hebrew year {hebrew_year}: {archive.purchase_count} purchases "
+               f"(₪{archive.total_amount:,.2f}) archived to {archive.filename} in {elapsed:.1f} s.")
+
+
+@click.command('refresh-balances')
+@with_appcontext
+def refresh_balances():
+    """Recomputes every buyer's pledged, paid and outstanding totals (and missing name keys)."""
+    from app import db
+    from app.utils import payment_utils
+    from app.utils.name_keys import fill_missing_name_keys
+
+    start = time.perf_counter()
+    conn = db.session.connection()
+    keys = fill_missing_name_keys(conn)
+    payment_utils.refresh_if_stale(conn, force=True)
+    db.session.commit()
+    elapsed = (time.perf_counter() - start) * 1000
+    click.echo(f"Balances refreshed, {keys} buyer name keys filled ({elapsed:.0f} ms).")
+
+
+@click.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def import_statement(path):
+    """Imports a CSV/XLSX bank statement into the payments ledger (like Admin -> Payments)."""
+    import os
+    from app import db
+    from app.models import BankImport
+    from app.utils import bank_import
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        lines, skipped = bank_import.read_statement(path, data)
+        import_id = bank_import.import_statement(os.path.basename(path), lines)
+    except bank_import.BankImportError as e:
+        raise click.ClickException(str(e))
+    statement = db.session.get(BankImport, import_id)
+    elapsed = time.perf_counter() - start
+    click.echo(f"Import {import_id}: {statement.line_count} lines ({skipped} other rows skipped) in {elapsed:.1f} s: "
+               f"{statement.matched_count} matched, {statement.review_count} to review, "
+               f"{statement.duplicate_count} already imported, {statement.ignored_count} ignored.")
+
+
+@click.command('annual-statements')
+@click.argument('hebrew_year', type=int)
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True),
+              help='ZIP file to write (default: Statements_<year>.zip).')
+@click.option('--workers', type=int, default=0, help='PDF rendering processes (default: STATEMENT_WORKERS or one per CPU).')
+@with_appcontext
+def annual_statements(hebrew_year, output, workers):
+    """Writes one PDF statement per buyer for HEBREW_YEAR into a ZIP file."""
+    from app.utils.hebrew_date_utils import num_to_gematria
+    from app.utils.report_utils import get_season_events
+    from app.utils.statement_utils import iter_statements_zip
+
+    events = get_season_events(hebrew_year=hebrew_year)
+    if not events:
+        raise click.ClickException(f"No events found in Hebrew year {hebrew_year}.")
+    output = output or f"Statements_{hebrew_year}.zip"
+    title = f"דוח שנתי ה׳{num_to_gematria(hebrew_year % 1000)}"
+    start = time.perf_counter()
+    with click.progressbar(length=0, label='Rendering statements') as bar, open(output, 'wb') as f:
+        def progress(done, total, finished):
+            bar.length = total
+            bar.update(done - bar.pos)
+
+        for chunk in iter_statements_zip([e.id for e in events], title, workers=workers or None, progress=progress):
+            f.write(chunk)
+    elapsed = time.perf_counter() - start
+    click.echo(f"{bar.pos} statements written to {output} in {elapsed:.1f} s.")
+
+
+@click.command('check-query-plans')
+@click.option('--current-db', is_flag=True, help="Check the app's database instead of a freshly seeded one.")
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every query, not only failures.')
+@with_appcontext
+def check_query_plans(current_db, verbose):
+    """Fails if a hot query's plan scans a whole table or sorts via a temp B-tree."""
+    import os
+    import tempfile
+    from app import db
+    from app.utils import query_plans
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = db.engine if current_db else query_plans.seeded_engine(os.path.join(tmp, 'plans.db'))
+        with engine.connect() as conn:
+            results = query_plans.check_query_plans(conn)
+        if not current_db:
+            engine.dispose()
+
+    for result in results:
+        click.echo(f"{'ok  ' if result.ok else 'FAIL'}  {result.name}")
+        if verbose or not result.ok:
+            for line in result.plan:
+                click.echo(f"        {line}")
+    failed = sum(1 for r in results if not r.ok)
+    if failed:
+        raise click.ClickException(f"{failed} of {len(results)} hot queries have a regressed plan.")
+    click.echo(f"All {len(results)} hot query plans use indexes.")
+
+
+@click.command('bench-sqlite')
+@click.option('--duration', default=10.0, show_default=True, help='Seconds per configuration.')
+@click.option('--scan-workers', default=4, show_default=True, help='Worker processes scanning purchases.')
+@click.option('--report-workers', default=1, show_default=True, help='Worker processes generating the heavy report.')
+@click.option('--purchases', default=200000, show_default=True, help='Purchases seeded before the run.')
+def bench_sqlite(duration, scan_workers, report_workers, purchases):
+    """Compares scan throughput during a heavy report: today's SQLite setup vs the WAL profile."""
+    import os
+    import tempfile
+    from functools import partial
+    from app.utils import db_bench
+    from app.utils.query_plans import seeded_engine
+
+    events, buyers, items = 60, 400, 80
+    seed = partial(seeded_engine, events=events, buyers=buyers, items=items, purchases=purchases)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in (db_bench.BASELINE, db_bench.PROFILE):
+            path = os.path.join(tmp, f'{mode}.db')
+            click.echo(f"Seeding {purchases} purchases for '{mode}'...")
+            db_bench.prepare_database(path, mode, seed)
+            click.echo(f"Running '{mode}' for {duration:.0f} s ({scan_workers} scanners, {report_workers} report)...")
+            results.append(db_bench.run_benchmark(
+                path, mode, duration, scan_workers, report_workers, buyers, items, events
+            ))
+
+    click.echo(f"\n{'mode':<10}{'scans/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'locked':>8}{'reports':>9}")
+    for r in results:
+        click.echo(f"{r.mode:<10}{r.scans_per_s:>10.1f}{r.p50_ms:>10.1f}{r.p95_ms:>10.1f}"
+                   f"{r.max_ms:>10.0f}{r.locked_errors:>8}{r.reports:>9}")
+
+
+@click.command('seed-synthetic')
+@click.option('--events', default=60, show_default=True, help='Shabbat/holiday events, from --first-year on.')
+@click.option('--buyers', default=400, show_default=True)
+@click.option('--items', default=80, show_default=True)
+@click.option('--purchases', default=20000, show_default=True, help='Up to ~1M is fine.')
+@click.option('--first-year', default=5780, show_default=True, help='Hebrew year of the first event.')
+@click.option('--seed', default=5786, show_default=True, help='Random seed (same seed, same data).')
+@click.option('--yes', is_flag=True, help="Don't ask for confirmation.")
+@with_appcontext
+def seed_synthetic(events, buyers, items, purchases, first_year, seed, yes):
+    """Adds synthetic buyers, items, events and purchases to the app's database."""
+    from app import db
+    from app.utils.synthetic_data import seed_synthetic as seed_rows
+
+    if not yes:
+        click.confirm(f"Add {events} events, {buyers} buyers, {items} items and {purchases} purchases "
+                      f"of synthetic data to {db.engine.url}?", abort=True)
+    start = time.perf_counter()
+    counts = seed_rows(db.engine, events=events, buyers=buyers, items=items, purchases=purchases,
+                       first_year=first_year, seed=seed)
+    click.echo(f"Added {counts.events} events, {counts.buyers} buyers, {counts.items} items and "
+               f"{counts.purchases} purchases in {time.perf_counter() - start:.1f} s.")
+
+
+@click.command('bench-hot-paths')
+@click.option('--rounds', default=20, show_default=True, help='Timed rounds per path (PDF and card sheets run 1/5).')
+@click.option('--buyers', default=400, show_default=True)
+@click.option('--items', default=80, show_default=True)
+@click.option('--events', default=60, show_default=True)
+@click.option('--purchases', default=20000, show_default=True)
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=None,
+              help='Baseline JSON file [default: bench_baselines.json in the project root].')
+@click.option('--save', is_flag=True, help='Store this run as the new baseline.')
+@click.option('--tolerance', default=0.25, show_default=True, help='Allowed slowdown of a median (0.25 = 25%).')
+@click.option('--only', multiple=True, help='Run only paths whose name contains this text (repeatable).')
+@click.option('--alloc', is_flag=True, help='Also measure peak Python allocations per call (tracemalloc).')
+def bench_hot_paths(rounds, buyers, items, events, purchases, baseline_path, save, tolerance, only, alloc):
+    """Times the hot paths on a fresh synthetic database and flags regressions against the baseline."""
+    import os
+    import tempfile
+    from app import create_app, db
+    from app.models import User
+    from app.utils import hot_path_bench
+    from app.utils.synthetic_data import seed_synthetic as seed_rows
+    from config import Config, basedir
+
+    baseline_path = baseline_path or os.path.join(basedir, 'bench_baselines.json')
+    volumes = {'events': events, 'buyers': buyers, 'items': items, 'purchases': purchases}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+            WTF_CSRF_ENABLED = False
+            SQL_PROFILER = False
+            SCAN_DUPLICATE_WINDOW_MS = {} # The scan cycle repeats the same barcodes within milliseconds
+            EVENT_ARCHIVE_DIR = os.path.join(tmp, 'archives')
+            PURCHASE_ARCHIVE_DIR = os.path.join(tmp, 'archives', 'purchases')
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            click.echo(f"Seeding {purchases} purchases...")
+            seed_rows(db.engine, **volumes)
+            admin = User(username='bench', is_admin=True)
+            admin.set_password(os.urandom(8).hex())
+            db.session.add(admin)
+            db.session.commit()
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(admin.id)
+                sess['_fresh'] = True
+            results = hot_path_bench.run_hot_path_benchmarks(app, client, rounds, only, alloc)
+            db.session.remove()
+            db.engine.dispose()
+            if app.extensions.get('sqlite_reader') is not None:
+                app.extensions['sqlite_reader'].dispose()
+
+    baseline = hot_path_bench.load_baseline(baseline_path)
+    base_results = baseline.get('results', {})
+    if baseline and baseline.get('volumes') != volumes:
+        click.echo(f"Note: the baseline was measured on {baseline.get('volumes')}, not {volumes}.")
+    click.echo(f"\n{'path':<34}{'rounds':>7}{'median ms':>11}{'p95 ms':>10}{'cpu ms':>9}"
+               f"{'peak KiB':>10}{'baseline':>10}")
+    for r in results:
+        base = base_results.get(r.name, {}).get('median_ms')
+        click.echo(f"{r.name:<34}{r.rounds:>7}{r.median_ms:>11.2f}{r.p95_ms:>10.2f}{r.cpu_ms:>9.2f}"
+                   f"{(f'{r.alloc_kb:.0f}' if r.alloc_kb is not None else '-'):>10}"
+                   f"{(f'{base:.2f}' if base is not None else '-'):>10}")
+
+    if save:
+        hot_path_bench.save_baseline(baseline_path, results, volumes)
+        click.echo(f"Baseline saved to {baseline_path}.")
+        return
+    regressions = hot_path_bench.find_regressions(baseline, results, tolerance)
+    for reg in regressions:
+        click.echo(f"REGRESSION  {reg.name}: {reg.baseline_ms:.2f} ms -> {reg.median_ms:.2f} ms ({reg.ratio:.2f}x)")
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} hot paths are slower than the baseline allows.")
+    if baseline:
+        click.echo(f"No regressions (tolerance {tolerance:.0%}).")
+    else:
+        click.echo(f"No baseline at {baseline_path} yet; run with --save to create one.")
@@ -1,5 +1,6 @@
 # file: app/forms.py
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import (
     StringField, PasswordField, BooleanField, SubmitField,
     SelectField, FloatField, IntegerField, TextAreaField,
@@ -10,7 +11,8 @@ from wtforms.validators import (
     Optional, NumberRange
 )
 from flask import request
-from app.models import User, Buyer, Item, Event
+from app.models import User, Buyer, BuyerAlias, Item, Event
+from app.utils.payment_utils import PAYMENT_METHODS
 
 
 class LoginForm(FlaskForm):
@@ -89,6 +91,10 @@ class BuyerForm(FlaskForm):
             raise ValidationError(
                 'Barcode ID already exists for another buyer.'
             )
+        if BuyerAlias.query.filter_by(barcode_id=barcode_id.data).first():
+            raise ValidationError(
+                'Barcode ID belongs to a buyer that was merged (it still scans as the merged buyer).'
+            )
 
 
 class ItemForm(FlaskForm):
@@ -180,7 +186,9 @@ class ReportSelectionForm(FlaskForm):
             ('buyer_excel', 'Buyer Summary (Excel)'),
             ('buyer_csv', 'Buyer Summary (CSV)'),
             ('item_excel', 'Item Summary (Excel)'),
-            ('item_csv', 'Item Summary (CSV)')
+            ('item_csv', 'Item Summary (CSV)'),
+            ('event_excel', 'Full Event Workbook (Excel, multi-sheet)'),
+            ('ledger_csv', 'Raw Purchase Ledger (CSV)')
         ],
         default='pdf_summary', # Default to the original PDF
         validators=[DataRequired()]
@@ -196,8 +204,139 @@ class ReportSelectionForm(FlaskForm):
         # If no events, disable selection? Or handle in template. Choices handled here.
 
 
+class SeasonReportForm(FlaskForm):
+    range_type = RadioField(
+        'Season',
+        choices=[
+            ('hebrew_year', 'Hebrew Year'),
+            ('date_range', 'Date Range')
+        ],
+        default='hebrew_year',
+        validators=[DataRequired()]
+    )
+    hebrew_year = IntegerField(
+        'Hebrew Year (e.g., 5785)',
+        validators=[Optional(), NumberRange(min=5700, max=6000)]
+    )
+    start_date = DateField(
+        'From (YYYY-MM-DD)',
+        format='%Y-%m-%d',
+        validators=[Optional()]
+    )
+    end_date = DateField(
+        'To (YYYY-MM-DD)',
+        format='%Y-%m-%d',
+        validators=[Optional()]
+    )
+    holiday_set = SelectField(
+        'Events',
+        choices=[
+            ('', 'All Events'),
+            ('high_holidays', 'High Holidays (Tishrei)'),
+            ('pesach', 'Pesach'),
+            ('shavuot', 'Shavuot'),
+            ('all_holidays', 'All Holidays')
+        ],
+        default='',
+        validators=[Optional()]
+    )
+    report_type = RadioField(
+        'Report Type',
+        choices=[
+            ('season_excel', 'Season Workbook (Excel, multi-sheet)'),
+            ('season_buyer_csv', 'Buyers x Events (CSV)'),
+            ('season_item_csv', 'Items x Events (CSV)'),
+            ('season_pdf', 'Season Statement (PDF)'),
+            ('season_ledger_csv', 'Raw Purchase Ledger (CSV)'),
+            ('season_statements_zip', 'Buyer Statements (ZIP, one PDF per buyer)')
+        ],
+        default='season_excel',
+        validators=[DataRequired()]
+    )
+    progress_token = HiddenField() # Set by the page to follow a statements download
+    submit = SubmitField('Generate Season Report')
+
+    def validate(self, extra_validators=None):
+        if not super(SeasonReportForm, self).validate(extra_validators):
+            return False
+        if self.range_type.data == 'hebrew_year' and not self.hebrew_year.data:
+            self.hebrew_year.errors.append('Enter a Hebrew year.')
+            return False
+        if self.range_type.data == 'date_range':
+            if not self.start_date.data or not self.end_date.data:
+                self.start_date.errors.append('Enter both a start and an end date.')
+                return False
+            if self.start_date.data > self.end_date.data:
+                self.end_date.errors.append('End date must be on or after the start date.')
+                return False
+        return True
+
+
+class GenerateSeasonForm(FlaskForm):
+    hebrew_year = IntegerField(
+        'Hebrew Year (e.g., 5786)',
+        validators=[DataRequired(), NumberRange(min=5700, max=6000)]
+    )
+    include_shabbat = BooleanField('Every Shabbat (named after the Parsha)', default=True)
+    include_holidays = BooleanField('Holidays (Rosh Hashana, Yom Kippur, Sukkot, Pesach, Shavuot)', default=True)
+    dry_run = BooleanField('Preview only (do not save)')
+    submit = SubmitField('Generate Events')
+
+
+class PaymentForm(FlaskForm):
+    buyer_id = SelectField('Buyer', coerce=int, validators=[DataRequired()])
+    amount = FloatField('Amount (₪)', validators=[DataRequired(), NumberRange(min=0.01)])
+    paid_on = DateField('Date', validators=[DataRequired()])
+    method = SelectField('Method', validators=[DataRequired()])
+    reference = StringField('Reference / Check No.', validators=[Optional(), Length(max=100)])
+    notes = StringField('Notes', validators=[Optional(), Length(max=300)])
+    submit = SubmitField('Record Payment')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buyer_id.choices = [(b.id, b.name) for b in Buyer.query.order_by(Buyer.name).all()]
+        self.method.choices = PAYMENT_METHODS
+
+
+class BankImportForm(FlaskForm):
+    statement = FileField(
+        'Bank statement (CSV or XLSX)',
+        validators=[FileRequired(), FileAllowed(['csv', 'txt', 'xlsx', 'xlsm'], 'Upload a CSV or XLSX file.')]
+    )
+    submit = SubmitField('Import Statement')
+
+
+class ReviewLineForm(FlaskForm):
+    buyer_id = IntegerField('Buyer', validators=[Optional()])
+    buyer_barcode = StringField('Buyer barcode', validators=[Optional(), Length(max=50)])
+    assign = SubmitField('Assign')
+    ignore = SubmitField('Ignore')
+
+
+class MergeBuyersForm(FlaskForm):
+    target_barcode = StringField('Keep buyer (barcode)', validators=[DataRequired(), Length(max=50)])
+    # The duplicates page posts one checkbox per buyer; the form below it one text field
+    source_barcodes = StringField(
+        'Merge into it (barcodes)',
+        validators=[DataRequired(), Length(max=1000)],
+        description='Barcodes separated by spaces or commas. Their purchases and payments move to the kept buyer.'
+    )
+    submit = SubmitField('Merge Buyers')
+
+
+class UndoMergeForm(FlaskForm):
+    submit = SubmitField(
+        'Undo',
+        render_kw={'class': 'btn btn-sm btn-outline-danger'}
+    )
+
+
 class DeleteForm(FlaskForm):
     submit = SubmitField(
         'Delete',
         render_kw={'class': 'btn btn-sm btn-danger'}
     )
+
+
+class DeleteEventForm(DeleteForm):
+    archive = BooleanField('Archive purchases to CSV first', default=True)
@@ -2,12 +2,14 @@
 from datetime import datetime
 from app import db, login_manager, bcrypt
 from flask_login import UserMixin
-from sqlalchemy import Index # Import Index
+from sqlalchemy import Index, func # Import Index
 
 # User loader required by Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id)) # Use db.session.get for primary key lookup
+    # Cached snapshot (see utils/user_cache): no users query on most requests
+    from app.utils.user_cache import load_cached_user
+    return load_cached_user(int(user_id))
 
 # Basic User model for authentication
 class User(UserMixin, db.Model):
@@ -32,7 +34,7 @@ class Event(db.Model):
     __tablename__ = 'events'
     id = db.Column(db.Integer, primary_key=True)
     event_name = db.Column(db.String(120), nullable=False)
-    gregorian_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    gregorian_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     hebrew_date = db.Column(db.String(100)) # e.g., "15 Nisan 5784"
     details = db.Column(db.String(200)) # Torah portion or Holiday type
     purchases = db.relationship('Purchase', backref='event', lazy='dynamic', cascade='all, delete-orphan')
@@ -45,9 +47,16 @@ class Buyer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     barcode_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Scanner catalog deltas
+    name_key = db.Column(db.String(120), index=True) # Normalized name for matching (see app/utils/name_keys.py)
     purchases = db.relationship('Purchase', backref='buyer', lazy='dynamic') # Don't cascade delete buyers if purchase exists
 
-    __table_args__ = (Index('ix_buyers_barcode_id', 'barcode_id'), ) # Explicit index
+    # barcode_id is indexed by unique=True/index=True above; lower(name) serves case-insensitive lookups
+    __table_args__ = (
+        Index('ix_buyers_name_lower', func.lower(name)),
+        # Ids are never reused: undoing a buyer merge restores the merged buyers under their ids
+        {'sqlite_autoincrement': True},
+    )
 
     def __repr__(self):
         return f'<Buyer {self.name} ({self.barcode_id})>'
@@ -58,9 +67,11 @@ class Item(db.Model):
     name = db.Column(db.String(120), nullable=False)
     barcode_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
     is_unique = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Scanner catalog deltas
     purchases = db.relationship('Purchase', backref='item', lazy='dynamic') # Don't cascade delete items
 
-    __table_args__ = (Index('ix_items_barcode_id', 'barcode_id'), ) # Explicit index
+    # barcode_id is indexed by unique=True/index=True above; lower(name) serves case-insensitive lookups
+    __table_args__ = (Index('ix_items_name_lower', func.lower(name)), )
 
     def __repr__(self):
         return f'<Item {self.name} ({self.barcode_id})>'
@@ -68,18 +79,222 @@ class Item(db.Model):
 class Purchase(db.Model):
     __tablename__ = 'purchases'
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False, index=True)
-    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False, index=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False, index=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1)
     total_price = db.Column(db.Float, nullable=False) # Use Float or Numeric/Decimal depending on precision needs
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_manual_entry = db.Column(db.Boolean, default=False)
     manual_entry_notes = db.Column(db.String(300))
 
+    # Composite indexes matching the hot queries (checked by `flask check-query-plans`).
+    # Each one's leading column also serves plain lookups by event/buyer/item.
+    __table_args__ = (
+        Index('ix_purchases_event_timestamp', 'event_id', 'timestamp'), # Scan list, event ledger
+        Index('ix_purchases_event_item_price', 'event_id', 'item_id', 'total_price'), # Unique-item checks, item totals
+        Index('ix_purchases_event_buyer_price', 'event_id', 'buyer_id', 'total_price'), # Buyer totals per event
+        Index('ix_purchases_buyer_timestamp', 'buyer_id', 'timestamp'), # Buyer card
+        Index('ix_purchases_item_timestamp', 'item_id', 'timestamp'), # Item history
+        # Ids are never reused: payments and archive files keep them, and a new purchase
+        # must not take a deleted one's id (it also makes count + max(id) a change mark)
+        {'sqlite_autoincrement': True},
+    )
+
     # Relationships defined via backref in Event, Buyer, Item
 
     def __repr__(self):
         return f'<Purchase {self.id} - Event: {self.event_id}, Buyer: {self.buyer_id}, Item: {self.item_id}>'
 
-# No separate PurchaseDetail model needed, we can construct this info via queries/joins
\ No newline at end of file
+# No separate PurchaseDetail model needed, we can construct this info via queries/joins
+
+# --- Scanner Stations ---
+# Server-side scan state of an offline-capable scanner page (see scanning.replay_scans).
+
+class ScanStation(db.Model):
+    __tablename__ = 'scan_stations'
+    station_id = db.Column(db.String(64), primary_key=True) # Random id kept by the browser
+    event_id = db.Column(db.Integer) # Event of the stored state (no FK: a station outlives its events)
+    last_seq = db.Column(db.Integer, nullable=False, default=0) # Highest scan sequence number applied
+    state = db.Column(db.JSON) # Buyer/item/price state, same keys as the scanning session
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ScanStation {self.station_id} (seq {self.last_seq})>'
+
+class CatalogTombstone(db.Model):
+    """A buyer/item barcode that left the scanner catalog (row deleted or barcode changed)."""
+    __tablename__ = 'catalog_tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False) # 'buyer' or 'item'
+    barcode_id = db.Column(db.String(50), nullable=False)
+    removed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CatalogTombstone {self.kind} {self.barcode_id}>'
+
+# --- Auctions ---
+# Live bidding on a unique item at an event. Bids are taken in memory (see
+# app/utils/auction_book.py) and written here in batches; closing a lot writes
+# the winning Purchase in the same transaction.
+
+class AuctionLot(db.Model):
+    __tablename__ = 'auction_lots'
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False, index=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='open') # open, sold, cancelled
+    high_bid = db.Column(db.Float) # Kept up to date by the bid flusher
+    high_bidder_id = db.Column(db.Integer, db.ForeignKey('buyers.id'))
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id')) # Set when sold
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<AuctionLot {self.id} item {self.item_id} ({self.status})>'
+
+class AuctionBid(db.Model):
+    __tablename__ = 'auction_bids'
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('auction_lots.id'), nullable=False, index=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    placed_at = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id')) # Gabbai who entered the bid
+
+    def __repr__(self):
+        return f'<AuctionBid lot {self.lot_id}: {self.amount} by {self.buyer_id}>'
+
+# --- Payments ---
+# Purchases are pledges; payments are recorded against a buyer and, when it is
+# known, the pledge they pay. Bank statements are imported in batches (see
+# app/utils/bank_import.py); lines that can't be matched wait in a review queue.
+
+class Payment(db.Model):
+    __tablename__ = 'payments'
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False)
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id'), index=True) # The pledge paid, if known
+    amount = db.Column(db.Float, nullable=False)
+    paid_on = db.Column(db.Date, nullable=False)
+    method = db.Column(db.String(20), nullable=False, default='bank') # bank, cash, check, card
+    reference = db.Column(db.String(100)) # Bank reference / check number
+    payer_name = db.Column(db.String(200)) # As written on the statement
+    payer_key = db.Column(db.String(200), index=True) # name_key of payer_name: later transfers from the same payer
+    notes = db.Column(db.String(300))
+    bank_import_id = db.Column(db.Integer, db.ForeignKey('bank_imports.id'), index=True)
+    fingerprint = db.Column(db.String(40), unique=True) # Statement line identity; a re-imported line is skipped
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    buyer = db.relationship('Buyer', backref=db.backref('payments', lazy='dynamic'))
+
+    __table_args__ = (Index('ix_payments_buyer_paid_on', 'buyer_id', 'paid_on'), )
+
+    def __repr__(self):
+        return f'<Payment {self.id}: {self.amount} from buyer {self.buyer_id}>'
+
+class BuyerBalance(db.Model):
+    """Materialized pledged/paid totals per buyer (see payment_utils.refresh_balances)."""
+    __tablename__ = 'buyer_balances'
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), primary_key=True, autoincrement=False)
+    pledged = db.Column(db.Float, nullable=False, default=0.0) # Current and archived purchases
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    balance = db.Column(db.Float, nullable=False, default=0.0, index=True) # pledged - paid
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BankImport(db.Model):
+    __tablename__ = 'bank_imports'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    imported_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    matched_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    duplicate_count = db.Column(db.Integer, nullable=False, default=0)
+    ignored_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<BankImport {self.id} {self.filename}>'
+
+class BankImportLine(db.Model):
+    __tablename__ = 'bank_import_lines'
+    id = db.Column(db.Integer, primary_key=True)
+    import_id = db.Column(db.Integer, db.ForeignKey('bank_imports.id'), nullable=False)
+    line_no = db.Column(db.Integer, nullable=False) # Row in the statement file
+    paid_on = db.Column(db.Date)
+    amount = db.Column(db.Float)
+    payer_name = db.Column(db.String(200))
+    reference = db.Column(db.String(100))
+    description = db.Column(db.String(300))
+    fingerprint = db.Column(db.String(40), index=True) # Re-imported lines are recognized by it
+    status = db.Column(db.String(10), nullable=False) # matched, review, duplicate, ignored
+    match_rule = db.Column(db.String(10)) # reference, name, history, amount, manual
+    candidates = db.Column(db.String(200)) # Comma-separated buyer ids suggested for review
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'))
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'))
+
+    __table_args__ = (Index('ix_bank_import_lines_import_status', 'import_id', 'status'), )
+
+# --- Buyer Merges ---
+# Duplicate buyers are merged into one (see app/utils/buyer_merge.py). The
+# merged buyers' barcodes stay as aliases so printed cards still scan.
+
+class BuyerMerge(db.Model):
+    __tablename__ = 'buyer_merges'
+    id = db.Column(db.Integer, primary_key=True)
+    target_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False, index=True) # The buyer kept
+    target_name = db.Column(db.String(120), nullable=False)
+    source_summary = db.Column(db.String(500), nullable=False) # "B1005 name; B1010 name" of the merged buyers
+    purchase_count = db.Column(db.Integer, nullable=False, default=0) # Purchases moved
+    undo_data = db.Column(db.Text, nullable=False) # JSON: merged buyer rows and the ids of every row moved
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    merged_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    undone_at = db.Column(db.DateTime)
+    undone_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    def __repr__(self):
+        return f'<BuyerMerge {self.id} into buyer {self.target_id}>'
+
+class BuyerAlias(db.Model):
+    """A merged buyer's barcode, resolved to the buyer it was merged into."""
+    __tablename__ = 'buyer_aliases'
+    barcode_id = db.Column(db.String(50), primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), nullable=False, index=True)
+    old_buyer_id = db.Column(db.Integer, nullable=False, index=True) # Id of the merged buyer (archived purchases keep it)
+    merge_id = db.Column(db.Integer, db.ForeignKey('buyer_merges.id'), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<BuyerAlias {self.barcode_id} -> {self.buyer_id}>'
+
+# --- Archived Purchases (closed Hebrew years) ---
+# Detail rows of an archived year live in a separate SQLite file (see archive_utils);
+# the main database keeps one row per archive plus per-event aggregates.
+
+class PurchaseArchive(db.Model):
+    __tablename__ = 'purchase_archives'
+    hebrew_year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    filename = db.Column(db.String(255), nullable=False) # Relative to PURCHASE_ARCHIVE_DIR
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PurchaseArchive {self.hebrew_year} ({self.purchase_count} purchases)>'
+
+class ArchivedBuyerTotal(db.Model):
+    __tablename__ = 'archived_buyer_totals'
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), primary_key=True, autoincrement=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id'), primary_key=True, autoincrement=False, index=True)
+    hebrew_year = db.Column(db.Integer, nullable=False, index=True)
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+class ArchivedItemTotal(db.Model):
+    __tablename__ = 'archived_item_totals'
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), primary_key=True, autoincrement=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), primary_key=True, autoincrement=False, index=True)
+    hebrew_year = db.Column(db.Integer, nullable=False, index=True)
+    purchase_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
\ No newline at end of file
@@ -1,6 +1,5 @@
 # file: app/routes/admin.py
-import io
-import pandas as pd
+import re
 from flask import (
     Blueprint, render_template, redirect, url_for, flash, request,
     abort, make_response, jsonify, current_app
@@ -9,9 +8,28 @@ from flask_login import login_required, current_user # Keep login_required if us
 from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError # Needed for bulk routes
 from app import db
-from app.models import Buyer, Item, Purchase, Event
-from app.forms import BuyerForm, ItemForm, DeleteForm
+from app.models import (
+    Buyer, BuyerAlias, BuyerMerge, Item, Purchase, Event, Payment, BuyerBalance, BankImport, BankImportLine
+)
+from app.forms import (
+    BuyerForm, ItemForm, DeleteForm, GenerateSeasonForm, PaymentForm, BankImportForm, ReviewLineForm, MergeBuyersForm,
+    UndoMergeForm
+)
 from app.utils.barcode_utils import generate_barcode_uri, generate_next_barcode_id
+from app.utils.card_codes import make_card_code, format_price
+from app.utils.export_utils import send_workbook, Sheet, stream_csv_response
+from app.utils.event_utils import generate_season_events
+from app.utils.archive_utils import archived_buyer_purchases, archived_totals, has_archived_purchases
+from app.utils import sql_profiler
+from app.utils.user_cache import cache_stats
+from app.utils.scan_dedupe import dedupe_stats
+from app.utils.hebrew_date_utils import get_hebrew_year
+from app.utils.db_utils import retry_on_busy
+from app.utils.payment_utils import add_payment, buyer_paid, refresh_if_stale, EPSILON
+from app.utils.bank_import import BankImportError, import_statement, read_statement, resolve_line, review_candidates
+from app.utils.buyer_merge import (
+    BuyerMergeError, find_buyer, find_duplicate_groups, merge_buyers, resolve_buyer_barcodes, undo_merge
+)
 # --- Import the decorator ---
 from app.decorators import admin_required, api_key_required # <-- Import new one
 
@@ -19,12 +37,71 @@ bp = Blueprint('admin', __name__)
 
 # Decorator for admin-only access (Example)
 from functools import wraps
+from datetime import datetime
 
 @bp.route('/')
 @admin_required
 def index():
     return render_template('admin/index.html', title='Admin Panel')
 
+# --- Season Event Generation ---
+@bp.route('/generate_season', methods=['GET', 'POST'])
+@admin_required
+def generate_season():
+    form = GenerateSeasonForm()
+    created = skipped = None
+    if form.validate_on_submit():
+        try:
+            created, skipped = generate_season_events(
+                form.hebrew_year.data,
+                include_shabbat=form.include_shabbat.data,
+                include_holidays=form.include_holidays.data,
+                dry_run=form.dry_run.data
+            )
+        except Exception as e:
+            current_app.logger.error(f"Error generating season {form.hebrew_year.data}: {e}", exc_info=True)
+            flash('An error occurred while generating the events. No events were saved.', 'danger')
+            return redirect(url_for('admin.generate_season'))
+        if form.dry_run.data:
+            flash(f'Preview: {len(created)} events would be created, {len(skipped)} dates already have events.', 'info')
+        else:
+            flash(f'Created {len(created)} events ({len(skipped)} dates already had events).', 'success')
+    elif request.method == 'GET':
+        form.hebrew_year.data = get_hebrew_year(datetime.utcnow())
+    return render_template(
+        'admin/generate_season.html', title='Generate Season Events',
+        form=form, created=created, skipped=skipped
+    )
+
+# --- SQL Profiler ---
+@bp.route('/sql_profile')
+@admin_required
+def sql_profile():
+    """Worst routes by SQL time / query count (JSON). Needs SQL_PROFILER=1."""
+    if not current_app.config.get('SQL_PROFILER'):
+        return jsonify({'enabled': False, 'message': 'Set SQL_PROFILER=1 to enable profiling.'})
+    limit = request.args.get('limit', 20, type=int)
+    sort = request.args.get('sort', 'sql_ms')
+    return jsonify({'enabled': True, 'sort': sort, 'routes': sql_profiler.worst_routes(limit, sort)})
+
+@bp.route('/sql_profile/reset', methods=['POST'])
+@admin_required
+def reset_sql_profile():
+    sql_profiler.reset_stats()
+    return jsonify({'success': True})
+
+@bp.route('/cache_stats')
+@admin_required
+def cache_statistics():
+    """Hit counters of the in-process caches (per worker), as JSON."""
+    return jsonify({'user_cache': cache_stats()})
+
+@bp.route('/scan_stats')
+@admin_required
+def scan_statistics():
+    """Suppressed duplicate scans (per worker), as JSON."""
+    return jsonify({'duplicate_scans': dedupe_stats()})
+
 # --- Buyer CRUD ---
 # ... (create_buyer, list_buyers, edit_buyer, delete_buyer remain the same) ...
 @bp.route('/buyers')
@@ -46,18 +123,8 @@ def create_buyer():
     if form.validate_on_submit():
         # Auto-generate barcode if left blank
         if not form.barcode_id.data:
-            # Query the last created buyer that has a barcode starting with 'B'
-            last_buyer = Buyer.query.filter(Buyer.barcode_id.like('B%')).order_by(Buyer.id.desc()).first()
-            if last_buyer:
-                # Extract the numeric part and increment it. Ensure to handle non-integer cases.
-                try:
-                    last_number = int(last_buyer.barcode_id.lstrip('B'))
-                    new_number = last_number + 1
-                except ValueError:
-                    new_number = 1001  # Fallback if the previous barcode isn't in the expected format
-            else:
-                new_number = 1001  # Start sequence if no buyer exists
-            generated_barcode = f'B{new_number}'
+            # Highest 'B' barcode + 1, counting the barcodes of merged buyers
+            generated_barcode = generate_next_barcode_id('B', starting_num=1001)
         else:
             generated_barcode = form.barcode_id.data
 
@@ -104,8 +171,8 @@ def delete_buyer(buyer_id):
         abort(404)
 
     # Check if buyer has purchases - prevent deletion if they do (based on model relationship)
-    if buyer.purchases.first():
-         flash('Cannot delete buyer because they have associated purchases. Consider marking as inactive instead (feature not implemented).', 'danger')
+    if buyer.purchases.first() or has_archived_purchases(buyer_id=buyer_id):
+         flash('Cannot delete buyer because they have associated purchases. If it is a duplicate, merge it into the other buyer instead.', 'danger')
          return redirect(url_for('admin.list_buyers'))
 
     form = DeleteForm()
@@ -119,6 +186,78 @@ def delete_buyer(buyer_id):
     return redirect(url_for('admin.list_buyers'))
 
 
+# --- Duplicate Buyers ---
+@bp.route('/buyers/duplicates')
+@admin_required
+def duplicate_buyers():
+    """Buyers whose names match once normalized, for merging; plus a merge by barcodes."""
+    groups, more = find_duplicate_groups(db.session.connection())
+    db.session.commit() # Name keys filled in for buyers saved without one
+    return render_template(
+        'admin/duplicate_buyers.html', title='Duplicate Buyers', groups=groups, more=more, form=MergeBuyersForm()
+    )
+
+@bp.route('/buyers/merge', methods=['POST'])
+@admin_required
+def merge_duplicate_buyers():
+    form = MergeBuyersForm()
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            flash(' '.join(errors), 'danger')
+        return redirect(request.referrer or url_for('admin.duplicate_buyers'))
+    target_barcode = form.target_barcode.data.strip()
+    barcodes = [barcode for value in request.form.getlist('source_barcodes')
+                for barcode in re.split(r'[\s,]+', value) if barcode]
+    found = resolve_buyer_barcodes(db.session.connection(), [target_barcode] + barcodes)
+    unknown = [barcode for barcode in [target_barcode] + barcodes if barcode not in found]
+    if unknown:
+        flash(f"Unknown buyer barcode(s): {', '.join(unknown)}.", 'warning')
+        return redirect(request.referrer or url_for('admin.duplicate_buyers'))
+    try:
+        merge = merge_buyers(found[target_barcode], [found[barcode] for barcode in barcodes], current_user.id)
+    except BuyerMergeError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(request.referrer or url_for('admin.duplicate_buyers'))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error merging buyers {barcodes} into {target_barcode}: {e}", exc_info=True)
+        flash('An error occurred while merging the buyers. Nothing was changed.', 'danger')
+        return redirect(request.referrer or url_for('admin.duplicate_buyers'))
+    current_app.logger.info(f"Merged buyers {merge.source_summary} into {merge.target_id} (merge {merge.id}).")
+    flash(f"Merged {merge.source_summary} into {merge.target_name} ({merge.purchase_count} purchases moved).", 'success')
+    return redirect(url_for('admin.buyer_card', buyer_id=merge.target_id))
+
+@bp.route('/buyers/merges')
+@admin_required
+def buyer_merges():
+    """Merges, newest first, with undo."""
+    page = request.args.get('page', 1, type=int)
+    merges = BuyerMerge.query.order_by(BuyerMerge.id.desc()).paginate(page=page, per_page=50)
+    return render_template('admin/buyer_merges.html', title='Buyer Merges', merges=merges, undo_form=UndoMergeForm())
+
+@bp.route('/buyers/merges/<int:merge_id>/undo', methods=['POST'])
+@admin_required
+def undo_buyer_merge(merge_id):
+    form = UndoMergeForm()
+    if not form.validate_on_submit():
+        flash('Invalid undo request.', 'danger')
+        return redirect(url_for('admin.buyer_merges'))
+    try:
+        merge = undo_merge(merge_id, current_user.id)
+    except BuyerMergeError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error undoing buyer merge {merge_id}: {e}", exc_info=True)
+        flash('An error occurred while undoing the merge. Nothing was changed.', 'danger')
+    else:
+        current_app.logger.info(f"Undid buyer merge {merge_id} ({merge.source_summary}).")
+        flash(f"Restored {merge.source_summary}.", 'success')
+    return redirect(url_for('admin.buyer_merges'))
+
+
 # --- Item CRUD ---
 # ... (create_item, list_items, edit_item, delete_item remain the same) ...
 @bp.route('/items')
@@ -195,7 +334,7 @@ def delete_item(item_id):
         abort(404)
 
     # Check if item has purchases - prevent deletion if they do (based on model relationship)
-    if item.purchases.first():
+    if item.purchases.first() or has_archived_purchases(item_id=item_id):
          flash('Cannot delete item because it has associated purchases. Consider marking as inactive instead (feature not implemented).', 'danger')
          return redirect(url_for('admin.list_items'))
 
@@ -210,6 +349,9 @@ def delete_item(item_id):
     return redirect(url_for('admin.list_items'))
 
 # --- Barcode Card Generation Page ---
+# Bound on one batch of composite cards (each is an SVG barcode on the page)
+MAX_COMPOSITE_CARDS = 600
+
 @bp.route('/print_cards', methods=['GET', 'POST'])
 @admin_required
 def print_cards():
@@ -218,8 +360,11 @@ def print_cards():
     default_prices = [10, 20, 30, 40, 50]
     custom_prices = []
     copies = 1
+    composite = request.method == 'POST' and request.form.get('card_type') == 'composite'
 
-    if request.method == 'POST':
+    if composite:
+        custom_prices = default_prices
+    elif request.method == 'POST':
         custom_prices_str = request.form.get('custom_prices', '')
         copies_str = request.form.get('copies', '1')
         try: copies = max(1, int(copies_str)) # Ensure at least 1 copy
@@ -236,37 +381,41 @@ def print_cards():
     else:
         custom_prices = default_prices
 
-    cards_data = [] # Store dicts with all needed info
-
-    # Generate buyer cards data
-    for buyer in buyers:
-        barcode_data = f"BUYER:{buyer.barcode_id}"
-        cards_data.append({
-            'label': buyer.name,
-            'barcode_uri': generate_barcode_uri(barcode_data),
-            'raw_barcode': barcode_data # *** Add raw data for JS ***
-        })
-
-    # Generate item cards data
-    for item in items:
-        barcode_data = f"ITEM:{item.barcode_id}"
-        cards_data.append({
-            'label': item.name,
-            'barcode_uri': generate_barcode_uri(barcode_data),
-            'raw_barcode': barcode_data # *** Add raw data for JS ***
-         })
-
-    # Generate price cards data
-    for price in custom_prices:
-        for _ in range(copies):
-            barcode_data = f"PRICE:{price:.2f}"
-            price_label = f"₪{price:.2f}"
+    if composite:
+        # A composite batch prints only the requested cards, not the whole sheet
+        cards_data = _composite_cards(request.form)
+    else:
+        cards_data = [] # Store dicts with all needed info
+
+        # Generate buyer cards data
+        for buyer in buyers:
+            barcode_data = f"BUYER:{buyer.barcode_id}"
             cards_data.append({
-                'label': price_label,
+                'label': buyer.name,
                 'barcode_uri': generate_barcode_uri(barcode_data),
                 'raw_barcode': barcode_data # *** Add raw data for JS ***
             })
 
+        # Generate item cards data
+        for item in items:
+            barcode_data = f"ITEM:{item.barcode_id}"
+            cards_data.append({
+                'label': item.name,
+                'barcode_uri': generate_barcode_uri(barcode_data),
+                'raw_barcode': barcode_data # *** Add raw data for JS ***
+             })
+
+        # Generate price cards data
+        for price in custom_prices:
+            for _ in range(copies):
+                barcode_data = f"PRICE:{price:.2f}"
+                price_label = f"₪{price:.2f}"
+                cards_data.append({
+                    'label': price_label,
+                    'barcode_uri': generate_barcode_uri(barcode_data),
+                    'raw_barcode': barcode_data # *** Add raw data for JS ***
+                })
+
     # Filter out any cards where barcode generation failed (unlikely with SVG but good practice)
     valid_cards_data = [card for card in cards_data if card['barcode_uri']]
 
@@ -274,7 +423,47 @@ def print_cards():
                            title='Print Barcode Cards',
                            cards=valid_cards_data, # Pass the list of dictionaries
                            default_prices=",".join([str(p) for p in default_prices]),
-                           copies=copies)
+                           copies=copies,
+                           buyers=buyers, items=items)
+
+
+def _composite_cards(form) -> list:
+    """
+    Card dicts for every selected item x price (x buyer, for pre-sold honors),
+    each copies times. Flashes and returns [] on bad input.
+    """
+    item_ids = form.getlist('composite_items', type=int)
+    buyer_ids = form.getlist('composite_buyers', type=int)
+    try:
+        prices = [float(x.strip()) for x in form.get('composite_prices', '').split(',') if x.strip()]
+        copies = max(1, int(form.get('composite_copies', '1')))
+    except ValueError:
+        flash('Error processing composite card prices or copies.', 'warning')
+        return []
+    if not item_ids or not prices:
+        flash('Select at least one item and enter at least one price for composite cards.', 'warning')
+        return []
+    if any(price <= 0 for price in prices):
+        flash('Composite card prices must be greater than zero (the scanner refuses the others).', 'warning')
+        return []
+
+    chosen_items = Item.query.filter(Item.id.in_(item_ids)).order_by(Item.name).all()
+    chosen_buyers = Buyer.query.filter(Buyer.id.in_(buyer_ids)).order_by(Buyer.name).all() if buyer_ids else [None]
+    total = len(chosen_items) * len(prices) * len(chosen_buyers) * copies
+    if total > MAX_COMPOSITE_CARDS:
+        flash(f'{total} composite cards requested; print at most {MAX_COMPOSITE_CARDS} at a time.', 'warning')
+        return []
+
+    cards = []
+    for buyer in chosen_buyers:
+        for item in chosen_items:
+            for price in prices:
+                barcode_data = make_card_code(item.barcode_id, price, buyer.barcode_id if buyer else None)
+                label = f"{item.name} ₪{format_price(price)}" + (f" – {buyer.name}" if buyer else '')
+                card = {'label': label, 'barcode_uri': generate_barcode_uri(barcode_data),
+                        'raw_barcode': barcode_data, 'wide': True}
+                cards.extend([card] * copies)
+    return cards
 
 
 # --- NEW ROUTE: Download Selected Barcodes as Excel ---
@@ -289,32 +478,10 @@ def download_excel():
             # Return a JSON error response perhaps?
             return jsonify({"error": "Invalid data received"}), 400
 
-        # Create DataFrame using pandas
-        df = pd.DataFrame(selected_data)
-        if df.empty:
-             flash('No items were selected for download.', 'warning')
-             # Or handle differently
-             return jsonify({"error": "No items selected"}), 400
-
-        # Ensure columns exist and rename if necessary (df columns match keys in JS object)
-        df = df.rename(columns={'label': 'Label', 'raw_barcode': 'Barcode Data'})
-
-        # Create an in-memory Excel file
-        output = io.BytesIO()
-        # Use openpyxl engine explicitly
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-        df.to_excel(writer, index=False, sheet_name='Selected Barcodes')
-        # Don't close the writer with 'with' statement if using BytesIO directly like this
-        # writer.save() # save is deprecated, use close
-        writer.close() # Correct way to finalize the Excel data in buffer
-        output.seek(0)
-
-        # Create response
-        response = make_response(output.getvalue())
-        response.headers['Content-Disposition'] = 'attachment; filename=selected_barcodes.xlsx'
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-
-        return response
+        # Keys match the objects built by the print cards JS
+        rows = ((card.get('label'), card.get('raw_barcode')) for card in selected_data if isinstance(card, dict))
+        return send_workbook([Sheet('Selected Barcodes', ['Label', 'Barcode Data'], rows, None)],
+                             'selected_barcodes.xlsx', rtl=False)
 
     except Exception as e:
         # Log the error for debugging
@@ -342,18 +509,27 @@ def buyer_card(buyer_id):
     ).filter(Purchase.buyer_id == buyer_id)\
      .order_by(Purchase.timestamp.desc())\
         .all()
+    # Purchases of archived (closed) years follow the current ones
+    purchases.extend(archived_buyer_purchases(buyer_id))
 
     # Calculate total spent by this buyer (optional but useful)
     total_spent = db.session.query(db.func.sum(Purchase.total_price))\
                             .filter(Purchase.buyer_id == buyer_id)\
                             .scalar() or 0.0
+    total_spent += archived_totals(buyer_id=buyer_id)[1]
+    total_paid = buyer_paid(db.session.connection(), buyer_id)
+    payments = buyer.payments.order_by(Payment.paid_on.desc(), Payment.id.desc()).limit(100).all()
+    aliases = BuyerAlias.query.filter_by(buyer_id=buyer_id).order_by(BuyerAlias.barcode_id).all()
 
     return render_template(
         'admin/buyer_card.html',
         title=f"Buyer Card: {buyer.name}",
         buyer=buyer,
         purchases=purchases,
-        total_spent=total_spent
+        total_spent=total_spent,
+        total_paid=total_paid,
+        payments=payments,
+        aliases=aliases
     )
 
 
@@ -383,6 +559,9 @@ def item_history(item_id):
                               .filter(Purchase.item_id == item_id)\
                               .scalar() or 0.0
     purchase_count = Purchase.query.filter(Purchase.item_id == item_id).count()
+    archived_count, archived_revenue = archived_totals(item_id=item_id)
+    purchase_count += archived_count
+    total_revenue += archived_revenue
 
 
     return render_template(
@@ -395,6 +574,132 @@ def item_history(item_id):
         limit=limit
     )
 
+# --- Payments ---
+@bp.route('/payments', methods=['GET', 'POST'])
+@admin_required
+def payments():
+    """Payments ledger: manual payments, statement imports and the latest payments."""
+    form = PaymentForm()
+    if form.validate_on_submit():
+        try:
+            _record_payment(form)
+        except Exception as e:
+            current_app.logger.error(f"Error recording payment: {e}", exc_info=True)
+            flash('An error occurred while recording the payment.', 'danger')
+        else:
+            flash(f'Payment of ₪{form.amount.data:.2f} recorded.', 'success')
+            return redirect(url_for('admin.payments'))
+    elif request.method == 'GET':
+        form.paid_on.data = datetime.utcnow().date()
+    page = request.args.get('page', 1, type=int)
+    ledger = Payment.query.options(joinedload(Payment.buyer))\
+        .order_by(Payment.paid_on.desc(), Payment.id.desc()).paginate(page=page, per_page=50)
+    imports = BankImport.query.order_by(BankImport.id.desc()).limit(20).all()
+    return render_template(
+        'admin/payments.html', title='Payments', form=form, import_form=BankImportForm(),
+        ledger=ledger, imports=imports
+    )
+
+@retry_on_busy
+def _record_payment(form):
+    add_payment(
+        db.session.connection(), buyer_id=form.buyer_id.data, amount=round(form.amount.data, 2),
+        paid_on=form.paid_on.data, method=form.method.data, reference=form.reference.data or None,
+        notes=form.notes.data or None, user_id=current_user.id
+    )
+    db.session.commit()
+
+@bp.route('/payments/import', methods=['POST'])
+@admin_required
+def import_bank_statement():
+    form = BankImportForm()
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            flash(' '.join(errors), 'danger')
+        return redirect(url_for('admin.payments'))
+    upload = form.statement.data
+    try:
+        lines, skipped = read_statement(upload.filename, upload.read())
+        import_id = import_statement(upload.filename, lines, current_user.id)
+    except BankImportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.payments'))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error importing bank statement '{upload.filename}': {e}", exc_info=True)
+        flash('An error occurred while importing the statement. Nothing was saved.', 'danger')
+        return redirect(url_for('admin.payments'))
+    current_app.logger.info(f"Imported bank statement '{upload.filename}' ({len(lines)} lines, {skipped} skipped) as import {import_id}.")
+    return redirect(url_for('admin.bank_import', import_id=import_id))
+
+@bp.route('/payments/import/<int:import_id>')
+@admin_required
+def bank_import(import_id):
+    """An import's summary and its lines; review lines can be assigned to a buyer or ignored."""
+    statement = db.session.get(BankImport, import_id)
+    if not statement:
+        flash(f"Import {import_id} not found.", "warning")
+        return redirect(url_for('admin.payments'))
+    status = request.args.get('status', 'review' if statement.review_count else 'matched')
+    page = request.args.get('page', 1, type=int)
+    lines = BankImportLine.query.filter_by(import_id=import_id, status=status)\
+        .order_by(BankImportLine.line_no).paginate(page=page, per_page=100)
+    buyer_ids = {line.buyer_id for line in lines.items if line.buyer_id}
+    buyer_names = dict(db.session.query(Buyer.id, Buyer.name).filter(Buyer.id.in_(buyer_ids)).all()) if buyer_ids else {}
+    return render_template(
+        'admin/bank_import.html', title=f'Statement Import: {statement.filename}', statement=statement,
+        status=status, lines=lines, buyer_names=buyer_names,
+        candidates=review_candidates(db.session.connection(), lines.items) if status == 'review' else {},
+        review_form=ReviewLineForm()
+    )
+
+@bp.route('/payments/line/<int:line_id>/resolve', methods=['POST'])
+@admin_required
+def resolve_bank_line(line_id):
+    form = ReviewLineForm()
+    line = db.session.get(BankImportLine, line_id)
+    if not line or not form.validate_on_submit():
+        flash('Invalid review request.', 'danger')
+        return redirect(request.referrer or url_for('admin.payments'))
+    buyer_id = None
+    if form.assign.data:
+        barcode = (form.buyer_barcode.data or '').strip()
+        buyer = find_buyer(barcode) if barcode else db.session.get(Buyer, form.buyer_id.data or 0)
+        if not buyer:
+            flash(f"Buyer '{barcode or form.buyer_id.data}' not found.", 'warning')
+            return redirect(request.referrer or url_for('admin.bank_import', import_id=line.import_id))
+        buyer_id = buyer.id
+    try:
+        resolve_line(line_id, buyer_id, current_user.id)
+    except BankImportError as e:
+        flash(str(e), 'warning')
+    return redirect(request.referrer or url_for('admin.bank_import', import_id=line.import_id))
+
+@bp.route('/balances')
+@admin_required
+def balances():
+    """Outstanding balances (pledged minus paid), largest first; ?format=csv downloads them."""
+    try:
+        if refresh_if_stale(db.session.connection(), force=request.args.get('refresh') == '1'):
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error refreshing buyer balances: {e}", exc_info=True)
+        flash('Balances could not be refreshed; showing the last computed figures.', 'warning')
+    query = db.session.query(BuyerBalance, Buyer.name, Buyer.barcode_id)\
+        .join(Buyer, Buyer.id == BuyerBalance.buyer_id)\
+        .filter(BuyerBalance.balance > EPSILON).order_by(BuyerBalance.balance.desc())
+    if request.args.get('format') == 'csv':
+        rows = ((name, barcode, f'{b.pledged:.2f}', f'{b.paid:.2f}', f'{b.balance:.2f}') for b, name, barcode in query.yield_per(1000))
+        return stream_csv_response(['Buyer', 'Barcode', 'Pledged', 'Paid', 'Outstanding'], rows, 'outstanding_balances.csv')
+    page = request.args.get('page', 1, type=int)
+    totals = db.session.query(db.func.sum(BuyerBalance.pledged), db.func.sum(BuyerBalance.paid)).one()
+    return render_template(
+        'admin/balances.html', title='Outstanding Balances',
+        balances=query.paginate(page=page, per_page=100), total_pledged=totals[0] or 0.0, total_paid=totals[1] or 0.0
+    )
+
+
 # --- NEW: Bulk Buyer Creation API ---
 @bp.route('/buyers/bulk', methods=['POST'])
 @api_key_required # <-- USE API KEY DECORATOR
@@ -446,7 +751,7 @@ def bulk_add_buyers():
         if barcode_to_use:
             # Check if provided barcode already exists
             existing_barcode = Buyer.query.filter(Buyer.barcode_id == barcode_to_use).first()
-            if existing_barcode:
+            if existing_barcode or db.session.get(BuyerAlias, barcode_to_use):
                 results['failed_count'] += 1
                 results['errors'].append({"input": buyer_data, "error": f"Barcode ID '{barcode_to_use}' already exists."})
                 continue
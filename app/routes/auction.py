@@ -0,0 +1,138 @@
+# file: app/routes/auction.py
+# Live auction of an event's unique items: the gabbaim's control page, the bid
+# endpoint and a big-screen display that follows the bids over Server-Sent
+# Events. Bids are kept in memory (app/utils/auction_book.py), so run the
+# auction from a single worker process; each open display holds a thread.
+
+import json
+import logging
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, Response
+from flask_login import login_required, current_user
+from app import db
+from app.models import Event, Buyer, Item, Purchase
+from sqlalchemy import select
+from app.utils import auction_book
+from app.utils.auction_book import AuctionError
+
+bp = Blueprint('auction', __name__)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keepalive comments on an idle stream (proxies drop silent connections)
+STREAM_KEEPALIVE = 15
+
+
+def _error(e: AuctionError):
+    """JSON error response; 409 when the lot moved on (outbid, closed), with its current state."""
+    body = {'status': 'error', 'message': str(e)}
+    if e.lot:
+        body['lot'] = e.lot
+        return jsonify(body), 409
+    return jsonify(body), 400
+
+
+def _get_event(event_id):
+    event = db.session.get(Event, event_id)
+    if not event:
+        flash(f"Event {event_id} not found.", "danger")
+    return event
+
+
+@bp.route('/event/<int:event_id>', methods=['GET'])
+@login_required
+def control(event_id):
+    event = _get_event(event_id)
+    if not event:
+        return redirect(url_for('main.list_events'))
+    sold = select(Purchase.item_id).where(Purchase.event_id == event_id)
+    items = Item.query.filter(Item.is_unique.is_(True), Item.id.notin_(sold)).order_by(Item.name).all()
+    buyers = db.session.query(Buyer.barcode_id, Buyer.name).order_by(Buyer.name).all()
+    return render_template('auction/control.html', event=event, items=items, buyers=buyers,
+                           min_increment=current_app.config.get('AUCTION_MIN_INCREMENT', 1))
+
+
+@bp.route('/event/<int:event_id>/display', methods=['GET'])
+@login_required
+def display(event_id):
+    event = _get_event(event_id)
+    if not event:
+        return redirect(url_for('main.list_events'))
+    return render_template('auction/display.html', event=event)
+
+
+@bp.route('/event/<int:event_id>/stream', methods=['GET'])
+@login_required
+def stream(event_id):
+    """The event's board as Server-Sent Events: a snapshot now and after every change."""
+    if not db.session.get(Event, event_id):
+        return jsonify({'status': 'error', 'message': f'Event {event_id} not found.'}), 404
+    snapshot = auction_book.board_snapshot(event_id) # Loads the board while the app context is up
+    db.session.remove() # Don't hold a connection for the life of the stream
+
+    def events(snapshot):
+        # No app context in here: only the in-memory board is read, never reloaded
+        yield "retry: 2000\n\n"
+        while snapshot is not None:
+            yield f"id: {snapshot['version']}\nevent: board\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            changed = auction_book.wait_for_change(event_id, snapshot['version'], STREAM_KEEPALIVE)
+            while changed is False:
+                yield ": keepalive\n\n"
+                changed = auction_book.wait_for_change(event_id, snapshot['version'], STREAM_KEEPALIVE)
+            snapshot = auction_book.loaded_snapshot(event_id) if changed else None
+        yield "event: closed\ndata: {}\n\n" # The event was deleted; the display stops listening
+
+    response = Response(events(snapshot), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Unbuffered behind nginx
+    return response
+
+
+@bp.route('/event/<int:event_id>/lots', methods=['POST'])
+@login_required
+def open_lot(event_id):
+    data = request.get_json() or {}
+    if not db.session.get(Event, event_id):
+        return jsonify({'status': 'error', 'message': f'Event {event_id} not found.'}), 404
+    try:
+        lot = auction_book.open_lot(event_id, int(data.get('item_id') or 0))
+    except AuctionError as e:
+        return _error(e)
+    logger.info(f"Auction lot {lot['id']} opened for '{lot['item_name']}' (event {event_id}) by {current_user.username}.")
+    return jsonify({'status': 'success', 'lot': lot})
+
+
+@bp.route('/lot/<int:lot_id>/bid', methods=['POST'])
+@login_required
+def bid(lot_id):
+    data = request.get_json() or {}
+    try:
+        amount = float(data.get('amount') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': f"Invalid amount: '{data.get('amount')}'."}), 400
+    try:
+        lot = auction_book.place_bid(lot_id, str(data.get('buyer') or ''), amount, current_user.id)
+    except AuctionError as e:
+        return _error(e)
+    return jsonify({'status': 'success', 'lot': lot})
+
+
+@bp.route('/lot/<int:lot_id>/close', methods=['POST'])
+@login_required
+def close_lot(lot_id):
+    return _close(lot_id, sell=True)
+
+
+@bp.route('/lot/<int:lot_id>/cancel', methods=['POST'])
+@login_required
+def cancel_lot(lot_id):
+    return _close(lot_id, sell=False)
+
+
+def _close(lot_id: int, sell: bool):
+    try:
+        lot = auction_book.close_lot(lot_id, sell=sell)
+    except AuctionError as e:
+        return _error(e)
+    logger.info(f"Auction lot {lot_id} {lot['status']} by {current_user.username}: "
+                f"{lot['high_bid']} by {lot['high_bidder']}.")
+    return jsonify({'status': 'success', 'lot': lot})
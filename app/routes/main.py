@@ -1,11 +1,15 @@
 # file: app/routes/main.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models import Event
-from app.forms import EventForm, DeleteForm
+from app.forms import EventForm, DeleteEventForm
 from app.utils.hebrew_date_utils import get_hebrew_date_string
+from app.utils.event_utils import (
+    EventArchiveMismatch, EventHasOpenLot, archive_event_ledger, delete_event_with_purchases, has_open_lot
+)
 from datetime import datetime
+import os
 # --- Import the decorator (needed if used anywhere in this file) ---
 from app.decorators import admin_required
 
@@ -24,7 +28,7 @@ def index():
 def list_events():
     page = request.args.get('page', 1, type=int)
     events = Event.query.order_by(Event.gregorian_date.desc()).paginate(page=page, per_page=10)
-    delete_form = DeleteForm()
+    delete_form = DeleteEventForm()
     return render_template(
         'main/events_list.html',
         title='Events',
@@ -92,11 +96,32 @@ def delete_event(event_id):
     if not event:
         abort(404)
 
-    form = DeleteForm()
+    form = DeleteEventForm()
     if form.validate_on_submit():
-        db.session.delete(event)
-        db.session.commit()
-        flash('Event and associated purchases deleted successfully!', 'success')
+        if has_open_lot(event_id):
+            flash('This event has an auction lot open. Close or cancel it before deleting the event.', 'warning')
+            return redirect(url_for('main.list_events'))
+        archive_path, archived = None, None
+        try:
+            if form.archive.data:
+                archive_path, archived = archive_event_ledger(event, current_app.config['EVENT_ARCHIVE_DIR'])
+            deleted = delete_event_with_purchases(event_id, expected_purchases=archived)
+        except EventHasOpenLot as e:
+            current_app.logger.warning(str(e))
+            flash('An auction lot was opened meanwhile. Close or cancel it before deleting the event.', 'warning')
+            return redirect(url_for('main.list_events'))
+        except EventArchiveMismatch as e:
+            current_app.logger.warning(str(e))
+            flash('New purchases were recorded while archiving. Nothing was deleted - please try again.', 'warning')
+            return redirect(url_for('main.list_events'))
+        except Exception as e:
+            current_app.logger.error(f"Error deleting event {event_id}: {e}", exc_info=True)
+            flash('Error deleting event. Nothing was deleted.', 'danger')
+            return redirect(url_for('main.list_events'))
+        if archive_path:
+            flash(f'Event and {deleted} purchases deleted. Archived to {os.path.basename(archive_path)}.', 'success')
+        else:
+            flash(f'Event and {deleted} purchases deleted successfully!', 'success')
     else:
         flash('Error deleting event. Please try again.', 'danger')
 
@@ -1,22 +1,36 @@
 # file: app/routes/reports.py
-import io
-import pandas as pd
+import re
+from datetime import datetime
+from itertools import chain
 # --- Import quote from urllib.parse ---
 from urllib.parse import quote
 from flask import (
     Blueprint, render_template, redirect, url_for, flash, request,
-    make_response, current_app
+    make_response, current_app, jsonify
 )
 from flask_login import login_required
 from sqlalchemy import func
 from app import db
 from app.models import Event, Purchase, Buyer, Item
-from app.forms import ReportSelectionForm
-from app.utils.pdf_utils import generate_pdf_report
-from app.utils.hebrew_date_utils import get_hebrew_date_string
+from app.forms import ReportSelectionForm, SeasonReportForm
+from app.utils.pdf_utils import generate_pdf_report, generate_season_pdf_report
+from app.utils.report_utils import (
+    get_event_report_rows, get_season_events, build_season_report, stream_rows,
+    buyer_summary_select, item_summary_select, ledger_select, event_detail_select,
+    BUYER_SUMMARY_HEADER, ITEM_SUMMARY_HEADER, LEDGER_HEADER, EVENT_DETAIL_HEADER
+)
+from app.utils.export_utils import (
+    stream_csv_response, stream_zip_response, send_workbook, Sheet, SHEKEL_FORMAT, DATETIME_FORMAT, DATE_FORMAT
+)
+from app.utils.statement_utils import iter_statements_zip, progress_tracker, statement_progress
+from app.utils.archive_utils import archived_ledger_rows
+from app.utils.hebrew_date_utils import get_hebrew_date_string, get_hebrew_year, num_to_gematria
 
 bp = Blueprint('reports', __name__)
 
+# Progress tokens are made by the season report page
+_PROGRESS_TOKEN = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
 @bp.route('/', methods=['GET', 'POST'])
 @login_required
 def select_report():
@@ -34,6 +48,126 @@ def select_report():
                            form=form,
                            events_exist=events_exist)
 
+@bp.route('/season', methods=['GET', 'POST'])
+@login_required
+def select_season_report():
+    """Allows user to select a season (Hebrew year or date range) and report type."""
+    form = SeasonReportForm()
+    if request.method == 'GET' and not form.hebrew_year.data:
+        form.hebrew_year.data = get_hebrew_year(datetime.utcnow())
+    if form.validate_on_submit():
+        params = {'range_type': form.range_type.data}
+        if form.range_type.data == 'hebrew_year':
+            params['hebrew_year'] = form.hebrew_year.data
+        else:
+            params['start'] = form.start_date.data.isoformat()
+            params['end'] = form.end_date.data.isoformat()
+        if form.holiday_set.data:
+            params['holidays'] = form.holiday_set.data
+        if _PROGRESS_TOKEN.match(form.progress_token.data or ''):
+            params['progress'] = form.progress_token.data
+        return redirect(url_for('reports.generate_season_report',
+                                report_type=form.report_type.data, **params))
+    return render_template('reports/select_season_report.html',
+                           title='Season Report',
+                           form=form)
+
+@bp.route('/season/<report_type>')
+@login_required
+def generate_season_report(report_type):
+    """Generates a report across all events of a Hebrew year or date range."""
+    holiday_set = request.args.get('holidays') or None
+    try:
+        if request.args.get('range_type') == 'date_range':
+            start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+            events = get_season_events(start_date=start_date, end_date=end_date, holiday_set=holiday_set)
+            title = f"דוח תקופתי {start_date.isoformat()} - {end_date.isoformat()}"
+            filename_base = f"Season_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+        else:
+            hebrew_year = int(request.args['hebrew_year'])
+            events = get_season_events(hebrew_year=hebrew_year, holiday_set=holiday_set)
+            title = f"דוח שנתי ה׳{num_to_gematria(hebrew_year % 1000)}"
+            filename_base = f"Season_{hebrew_year}"
+    except (KeyError, ValueError):
+        flash("Invalid season selection.", "danger")
+        return redirect(url_for('reports.select_season_report'))
+
+    if not events:
+        flash("No events found in the selected season.", "warning")
+        return redirect(url_for('reports.select_season_report'))
+    if holiday_set:
+        filename_base += f"_{holiday_set}"
+
+    try:
+        if report_type == 'season_ledger_csv':
+            # Raw rows are streamed straight from the cursor (archived years first); no pivots needed
+            event_ids = [e.id for e in events]
+            rows = chain(archived_ledger_rows(event_ids), stream_rows(ledger_select(event_ids=event_ids)))
+            return stream_csv_response(LEDGER_HEADER, rows, f"{filename_base}_Ledger.csv")
+
+        if report_type == 'season_statements_zip':
+            # One PDF per buyer, rendered by worker processes and streamed as they complete
+            token = request.args.get('progress', '')
+            progress = progress_tracker(token if _PROGRESS_TOKEN.match(token) else None)
+            chunks = iter_statements_zip([e.id for e in events], title, progress=progress)
+            return stream_zip_response(chunks, f"{filename_base}_Statements.zip")
+
+        report = build_season_report(title, events)
+        event_columns = [f"{e.event_name} ({e.gregorian_date.strftime('%Y-%m-%d')})" for e in report.events]
+
+        if report_type == 'season_pdf':
+            pdf_buffer = generate_season_pdf_report(report)
+            if not pdf_buffer:
+                flash("Failed to generate PDF report.", "danger")
+                return redirect(url_for('reports.select_season_report'))
+            response = make_response(pdf_buffer.getvalue())
+            response.headers['Content-Type'] = 'application/pdf'
+            response.headers['Content-Disposition'] = f"inline; filename*=UTF-8''{filename_base}_Statement.pdf"
+            return response
+
+        buyer_header = ['Buyer Name'] + event_columns + ['Events', 'Total (NIS)']
+        buyer_table = [[row.name] + [row.per_event.get(e.id, 0.0) for e in report.events] + [row.count, row.total]
+                       for row in report.buyer_rows]
+        item_header = ['Item Name'] + event_columns + ['Times Purchased', 'Total (NIS)']
+        item_table = [[row.name] + [row.per_event.get(e.id, 0.0) for e in report.events] + [row.count, row.total]
+                      for row in report.item_rows]
+
+        if report_type == 'season_excel':
+            event_count = len(report.events)
+            pivot_formats = {i: SHEKEL_FORMAT for i in range(1, event_count + 1)}
+            return send_workbook([
+                Sheet('Events', ['Event', 'Date', 'Hebrew Date', 'Total Raised (NIS)'],
+                      ((e.event_name, e.gregorian_date, e.hebrew_date or '', report.event_totals.get(e.id, 0.0))
+                       for e in report.events),
+                      {1: DATE_FORMAT, 3: SHEKEL_FORMAT}),
+                Sheet('Buyers x Events', buyer_header, buyer_table,
+                      {**pivot_formats, event_count + 2: SHEKEL_FORMAT}),
+                Sheet('Items x Events', item_header, item_table,
+                      {**pivot_formats, event_count + 2: SHEKEL_FORMAT}),
+            ], f"{filename_base}_Workbook.xlsx")
+        elif report_type == 'season_buyer_csv':
+            return stream_csv_response(buyer_header, buyer_table, f"{filename_base}_Buyers.csv")
+        elif report_type == 'season_item_csv':
+            return stream_csv_response(item_header, item_table, f"{filename_base}_Items.csv")
+        else:
+            flash(f"Unknown report type: {report_type}", "danger")
+            return redirect(url_for('reports.select_season_report'))
+
+    except Exception as e:
+        current_app.logger.error(f"Error generating season report ({report_type}): {e}", exc_info=True)
+        flash(f"An error occurred while generating the report: {e}", "danger")
+        return redirect(url_for('reports.select_season_report'))
+
+@bp.route('/season/statements/progress/<token>')
+@login_required
+def statements_progress(token):
+    """Progress of a buyer statements download as JSON (only known to the worker process serving it)."""
+    progress = statement_progress(token)
+    if progress is None:
+        return jsonify({'status': 'unknown'}), 404
+    return jsonify(progress)
+
 def rfc2231_encode(s):
     # This is a very basic illustration. In production, look for a robust solution.
     import urllib.parse
@@ -47,23 +181,11 @@ def view_report(event_id):
         flash(f"Event with ID {event_id} not found.", "danger")
         return redirect(url_for('reports.select_report'))
 
-    # Query purchase details for the report (similar to ReportDao)
-    purchase_details = db.session.query(
-            Buyer.name.label('buyer_name'),
-            Item.name.label('item_name'),
-            Purchase.total_price.label('price'),
-            Item.is_unique.label('is_unique_item')
-        ).join(Buyer, Purchase.buyer_id == Buyer.id)\
-         .join(Item, Purchase.item_id == Item.id)\
-         .filter(Purchase.event_id == event_id)\
-         .order_by(Buyer.name, Purchase.timestamp)\
-         .all() # Returns a list of Row objects (like named tuples)
-
-    # Convert Row objects to dictionaries for easier handling in PDF util if needed
-    details_list = [row._asdict() for row in purchase_details]
+    # Rows arrive grouped by buyer with subtotals computed in SQL
+    report_rows = get_event_report_rows(event_id)
 
     # Generate PDF using the utility function
-    pdf_buffer = generate_pdf_report(event, details_list)
+    pdf_buffer = generate_pdf_report(event, report_rows)
 
     if pdf_buffer:
         response = make_response(pdf_buffer.getvalue())
@@ -93,19 +215,14 @@ def generate_report(report_type, event_id):
     # Use quote() to percent-encode non-ASCII chars for the header value
     encoded_event_name = quote(event.event_name.encode('utf-8'))
     encoded_filename_base = f"Report_{encoded_event_name}_{event.gregorian_date.strftime('%Y%m%d')}"
+    # Unencoded variant for streamed downloads (content_disposition() encodes it)
+    filename_base = f"Report_{event.event_name}_{event.gregorian_date.strftime('%Y%m%d')}"
 
     try:
         if report_type == 'pdf_summary':
             # --- Original PDF Summary ---
-            purchase_details = db.session.query(
-                    Buyer.name.label('buyer_name'), Item.name.label('item_name'),
-                    Purchase.total_price.label('price'), Item.is_unique.label('is_unique_item')
-                ).join(Buyer, Purchase.buyer_id == Buyer.id)\
-                 .join(Item, Purchase.item_id == Item.id)\
-                 .filter(Purchase.event_id == event_id)\
-                 .order_by(Buyer.name, Purchase.timestamp).all()
-            details_list = [row._asdict() for row in purchase_details]
-            pdf_buffer = generate_pdf_report(event, details_list)
+            report_rows = get_event_report_rows(event_id)
+            pdf_buffer = generate_pdf_report(event, report_rows)
 
             if pdf_buffer:
                 response = make_response(pdf_buffer.getvalue())
@@ -120,33 +237,47 @@ def generate_report(report_type, event_id):
                 return redirect(url_for('reports.select_report'))
 
 
-        elif report_type.startswith('buyer_'):
-            # --- Buyer Summary Report (Excel/CSV) ---
-            # ... (query remains the same) ...
-            summary_data = db.session.query( Buyer.name.label('Buyer Name'), db.func.sum(Purchase.total_price).label('Total Pledged/Purchased (NIS)') ).join(Purchase, Buyer.id == Purchase.buyer_id).filter(Purchase.event_id == event_id).group_by(Buyer.id, Buyer.name).order_by(Buyer.name).all()
-
-            if not summary_data: # ... (error handling) ...
-                flash(f"No purchase data found for event '{event.event_name}' to generate Buyer Summary.", "warning")
+        elif report_type.startswith('buyer_') or report_type.startswith('item_'):
+            # --- Buyer / Item Summary Report (Excel/CSV) ---
+            if not db.session.query(Purchase.id).filter(Purchase.event_id == event_id).first():
+                summary_name = 'Buyer Summary' if report_type.startswith('buyer_') else 'Item Summary'
+                flash(f"No purchase data found for event '{event.event_name}' to generate {summary_name}.", "warning")
                 return redirect(url_for('reports.select_report'))
 
-            df = pd.DataFrame(summary_data)
+            if report_type.startswith('buyer_'):
+                header, query, suffix = BUYER_SUMMARY_HEADER, buyer_summary_select(event_id), 'BuyerSummary'
+                formats = {1: SHEKEL_FORMAT}
+            else:
+                header, query, suffix = ITEM_SUMMARY_HEADER, item_summary_select(event_id), 'ItemSummary'
+                formats = {2: SHEKEL_FORMAT}
+
             file_format = report_type.split('_')[1]
-            # Pass the UTF-8 encoded base filename to the helper
-            return _create_file_response(df, f"{encoded_filename_base}_BuyerSummary", file_format)
+            # Both formats stream straight from the cursor
+            if file_format == 'csv':
+                return stream_csv_response(header, stream_rows(query), f"{filename_base}_{suffix}.csv")
+            return send_workbook([Sheet('Summary', header, stream_rows(query), formats)],
+                                 f"{filename_base}_{suffix}.xlsx")
 
-        elif report_type.startswith('item_'):
-             # --- Item Summary Report (Excel/CSV) ---
-             # ... (query remains the same) ...
-            summary_data = db.session.query( Item.name.label('Item Name'), db.func.count(Purchase.id).label('Times Purchased'), db.func.sum(Purchase.total_price).label('Total Raised (NIS)') ).join(Purchase, Item.id == Purchase.item_id).filter(Purchase.event_id == event_id).group_by(Item.id, Item.name).order_by(Item.name).all()
+        elif report_type == 'event_excel':
+            # --- Full Event Workbook (Excel, multi-sheet) ---
+            detail_formats = {5: SHEKEL_FORMAT, 6: DATETIME_FORMAT}
+            return send_workbook([
+                Sheet('Buyer Summary', BUYER_SUMMARY_HEADER, stream_rows(buyer_summary_select(event_id)),
+                      {1: SHEKEL_FORMAT}),
+                Sheet('Item Summary', ITEM_SUMMARY_HEADER, stream_rows(item_summary_select(event_id)),
+                      {2: SHEKEL_FORMAT}),
+                Sheet('By Buyer', EVENT_DETAIL_HEADER, stream_rows(event_detail_select(event_id, 'buyer')),
+                      detail_formats),
+                Sheet('By Item', EVENT_DETAIL_HEADER, stream_rows(event_detail_select(event_id, 'item')),
+                      detail_formats),
+                Sheet('Manual Entries', EVENT_DETAIL_HEADER,
+                      stream_rows(event_detail_select(event_id, manual_only=True)), detail_formats),
+            ], f"{filename_base}_Workbook.xlsx")
 
-            if not summary_data: # ... (error handling) ...
-                flash(f"No purchase data found for event '{event.event_name}' to generate Item Summary.", "warning")
-                return redirect(url_for('reports.select_report'))
-
-            df = pd.DataFrame(summary_data)
-            file_format = report_type.split('_')[1]
-            # Pass the UTF-8 encoded base filename to the helper
-            return _create_file_response(df, f"{encoded_filename_base}_ItemSummary", file_format)
+        elif report_type == 'ledger_csv':
+            # --- Raw Purchase Ledger (CSV) ---
+            return stream_csv_response(LEDGER_HEADER, stream_rows(ledger_select(event_id=event_id)),
+                                       f"{filename_base}_Ledger.csv")
 
         else: # ... (error handling) ...
             flash(f"Unknown report type: {report_type}", "danger")
@@ -157,36 +288,3 @@ def generate_report(report_type, event_id):
         flash(f"An error occurred while generating the report: {e}", "danger")
         return redirect(url_for('reports.select_report'))
 
-
-def _create_file_response(df: pd.DataFrame, encoded_filename_base: str, format: str):
-    """Helper to generate CSV or Excel response from a DataFrame using correctly encoded filename."""
-    output = io.BytesIO()
-    filename_suffix = f".{format}"
-    filename_header = f"{encoded_filename_base}{filename_suffix}" # This already has % encoding
-
-    if format == 'csv':
-        df.to_csv(output, index=False, encoding='utf-8-sig')
-        mime_type = 'text/csv; charset=utf-8' # Explicitly state charset
-    elif format == 'excel':
-        try:
-            writer = pd.ExcelWriter(output, engine='openpyxl')
-            df.to_excel(writer, index=False, sheet_name='Summary')
-            writer.close()
-            mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        except Exception as e:
-             current_app.logger.error(f"Error writing Excel file using openpyxl: {e}", exc_info=True)
-             raise
-    else:
-        raise ValueError("Unsupported file format specified")
-
-    output.seek(0)
-    response = make_response(output.getvalue())
-    # --- Create RFC 6266 compliant header ---
-    # Use filename* for UTF-8 encoding. The filename_header is already percent-encoded.
-    disposition = f'attachment; filename*={filename_header}'
-    # Some older browsers might need the plain filename as fallback (without non-ASCII)
-    # You could create a simplified ascii_filename_base here if needed.
-    # disposition += f'; filename="{ascii_filename_base}{filename_suffix}"' # Optional fallback
-    response.headers['Content-Disposition'] = disposition
-    response.headers['Content-Type'] = mime_type
-    return response
\ No newline at end of file
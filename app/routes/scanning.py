@@ -1,18 +1,24 @@
 # file: app/routes/scanning.py
 
 import logging
+import time
+from datetime import datetime, timedelta
 from flask import (
     Blueprint, render_template, request, jsonify,
-    session, flash, redirect, url_for, current_app
+    session, flash, redirect, url_for, current_app, make_response
 )
 from flask_login import login_required
 from app import db
 from app.forms import ManualPurchaseForm, DeleteForm
-from app.models import Event, Buyer, Item, Purchase
-# Use joinedload for efficient querying
-from sqlalchemy.orm import joinedload
+from app.models import Event, Buyer, BuyerAlias, Item, Purchase, ScanStation
 # Import func for lowercase comparison if needed
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.utils.db_utils import retry_on_busy
+from app.utils.payment_utils import refresh_balances, release_pledges
+from app.utils.scan_catalog import catalog_head, catalog_rows
+from app.utils.card_codes import CARD_PREFIX, parse_card_code
+from app.utils import scan_dedupe
 
 bp = Blueprint('scanning', __name__)
 
@@ -21,6 +27,63 @@ logger = logging.getLogger(__name__)
 # Configure logger further if needed (e.g., level, handler)
 # logging.basicConfig(level=logging.DEBUG) # Example: Set level for debugging
 
+# --- Scan Loop Queries ---
+# Built once on the tables (not the mapped classes) and run on the session's
+# connection: rows come back as plain tuples, with no ORM objects, identity
+# map or attribute instrumentation, and SQLAlchemy reuses the compiled SQL.
+_events, _buyers, _aliases, _items, _purchases, _stations = (
+    Event.__table__, Buyer.__table__, BuyerAlias.__table__, Item.__table__, Purchase.__table__, ScanStation.__table__
+)
+
+_EVENT_EXISTS = select(_events.c.id).where(_events.c.id == bindparam('event_id'))
+
+# Cards of buyers merged into another one (see buyer_merge) scan as that buyer
+_BUYER_BY_BARCODE = select(_buyers.c.id, _buyers.c.name)\
+    .where(_buyers.c.barcode_id == bindparam('barcode'))\
+    .union_all(select(_buyers.c.id, _buyers.c.name)
+               .join(_aliases, _aliases.c.buyer_id == _buyers.c.id)
+               .where(_aliases.c.barcode_id == bindparam('barcode')))\
+    .limit(1)
+
+_ITEM_BY_BARCODE = select(_items.c.id, _items.c.name, _items.c.is_unique)\
+    .where(_items.c.barcode_id == bindparam('barcode')).limit(1)
+
+_ITEM_BY_ID = select(_items.c.name, _items.c.is_unique).where(_items.c.id == bindparam('item_id'))
+
+# First buyer of a unique item at an event (with the name, for the warning)
+_UNIQUE_ITEM_OWNER = select(_purchases.c.buyer_id, _buyers.c.name)\
+    .join(_buyers, _buyers.c.id == _purchases.c.buyer_id)\
+    .where(_purchases.c.event_id == bindparam('event_id'), _purchases.c.item_id == bindparam('item_id'))\
+    .limit(1)
+
+_UNIQUE_ITEM_OTHER_BUYER = select(_purchases.c.buyer_id)\
+    .where(_purchases.c.event_id == bindparam('event_id'), _purchases.c.item_id == bindparam('item_id'),
+           _purchases.c.buyer_id != bindparam('buyer_id'))\
+    .limit(1)
+
+_PURCHASE_LIST = select(
+    _purchases.c.id, _buyers.c.name, _items.c.name, _purchases.c.total_price, _purchases.c.quantity,
+    _purchases.c.manual_entry_notes, _purchases.c.timestamp, _purchases.c.is_manual_entry, _purchases.c.item_id
+).outerjoin(_buyers, _buyers.c.id == _purchases.c.buyer_id)\
+ .outerjoin(_items, _items.c.id == _purchases.c.item_id)\
+ .where(_purchases.c.event_id == bindparam('event_id'))\
+ .order_by(_purchases.c.timestamp.asc()) # Oldest first
+
+_INSERT_PURCHASE = insert(_purchases)
+
+_STATION_BY_ID = select(_stations.c.event_id, _stations.c.last_seq, _stations.c.state)\
+    .where(_stations.c.station_id == bindparam('station_id'))
+
+# Offline replay limits: scans per request, and how old a client scan time may be
+# before the replay time is used instead (a wrong device clock)
+REPLAY_MAX_BATCH = 200
+REPLAY_MAX_AGE = timedelta(days=7)
+
+
+def _first(statement, **params):
+    """First row of a scan-loop query as a plain tuple (or None)."""
+    return db.session.connection().execute(statement, params).first()
+
 @bp.route('/event/<int:event_id>', methods=['GET'])
 @login_required
 def start_scanning(event_id):
@@ -49,104 +112,90 @@ def start_scanning(event_id):
     )
 
 
-@bp.route('/process_scan', methods=['POST'])
-@login_required
-def process_scan():
-    data     = request.get_json() or {}
-    barcode  = data.get('barcode', '').strip()
-    event_id = session.get('scan_event_id')
-
-    logger.debug(f"Processing scan. Barcode: '{barcode}', Event ID from session: {event_id}")
-
-    # Start response with current state
-    response = {'status':'error', 'message':'', 'state': get_current_scan_state()}
-
-    if not barcode:
-        response['message'] = 'No barcode received.'
-        logger.warning("Process scan called with empty barcode.")
-        return jsonify(response)
-
-    if not event_id:
-        response['message'] = 'Error: No active event session. Please select an event.'
-        logger.error("Process scan called but no 'scan_event_id' in session.")
-        clear_scan_session_keys()
-        response['state'] = get_current_scan_state()
-        return jsonify(response), 400
-
-    event = db.session.get(Event, event_id)
-    if not event:
-        response['message'] = f'Error: Event {event_id} not found in database.'
-        logger.error(f"Event ID {event_id} from session not found in database.")
-        clear_scan_session_keys()
-        response['state'] = get_current_scan_state()
-        return jsonify(response), 400
+def _apply_scan(state, barcode: str, scanned_at=None, commit: bool = True) -> dict:
+    """
+    The scan state machine: applies one barcode to a scan state (the Flask
+    session, or a station's stored state when replaying queued scans) and
+    returns {'status', 'message'}. A completed purchase is saved before the
+    buyer or item changes; with commit=False it joins the caller's transaction
+    and errors propagate instead of being reported per scan.
+    """
+    event_id = state.get('scan_event_id')
+    response = {'status': 'error', 'message': ''}
 
     try:
+        # --- Clear Command ---
+        if barcode == 'BUYER:__CLEAR__':
+            logger.info("Received clear state command.")
+            # *** Save any pending purchase before clearing ***
+            save_pending_purchase(state, scanned_at, commit)
+            clear_scan_session_keys(clear_event=False, state=state) # Keep event id
+            response.update(status='success', message='State cleared. Scan buyer.')
+
         # --- Buyer Scan ---
-        if barcode.startswith('BUYER:'):
+        elif barcode.startswith('BUYER:'):
             # *** Save any pending purchase from the *previous* buyer/item ***
-            save_pending_purchase(session)
+            save_pending_purchase(state, scanned_at, commit)
             bid = barcode.split(':', 1)[1]
             logger.info(f"Scanned Buyer Barcode: {bid}")
-            buyer = Buyer.query.filter_by(barcode_id=bid).first()
+            buyer = _first(_BUYER_BY_BARCODE, barcode=bid)
             if buyer:
-                logger.info(f"Buyer found: {buyer.name} (ID: {buyer.id})")
-                # Set new buyer, clear item and price from session state
-                session.update({
-                    'scan_buyer_id': buyer.id, 'scan_buyer_name': buyer.name,
+                buyer_id, buyer_name = buyer
+                logger.info(f"Buyer found: {buyer_name} (ID: {buyer_id})")
+                # Set new buyer, clear item and price from the scan state
+                state.update({
+                    'scan_buyer_id': buyer_id, 'scan_buyer_name': buyer_name,
                     'scan_item_id': None, 'scan_item_name': None,
                     'scan_accumulated_price': 0.0
                 })
-                session.modified = True
-                response.update(status='success', message=f'Buyer set: {buyer.name}. Scan item.')
+                response.update(status='success', message=f'Buyer set: {buyer_name}. Scan item.')
             else:
                 logger.warning(f"Unknown buyer barcode scanned: '{bid}'")
                 response['message'] = f"Unknown buyer barcode: '{bid}'."
                 # Clear entire state (except event) if buyer not found
-                clear_scan_session_keys(clear_event=False) # Keep event_id
+                clear_scan_session_keys(clear_event=False, state=state) # Keep event_id
 
 
         # --- Item Scan ---
         elif barcode.startswith('ITEM:'):
-            if not session.get('scan_buyer_id'):
+            if not state.get('scan_buyer_id'):
                 logger.warning("Item scanned before buyer.")
                 response['message'] = 'Scan buyer first.'
             else:
                 # *** Save any pending purchase from the *previous* item ***
-                save_pending_purchase(session)
+                save_pending_purchase(state, scanned_at, commit)
                 iid = barcode.split(':', 1)[1]
                 logger.info(f"Scanned Item Barcode: {iid}")
-                item = Item.query.filter_by(barcode_id=iid).first()
+                item = _first(_ITEM_BY_BARCODE, barcode=iid)
                 if item:
-                    logger.info(f"Item found: {item.name} (ID: {item.id}), Unique: {item.is_unique}")
+                    item_id, item_name, is_unique = item
+                    logger.info(f"Item found: {item_name} (ID: {item_id}), Unique: {is_unique}")
                     # Set new item, MUST reset accumulated price to 0 for this new item scan
-                    session.update({
-                        'scan_item_id': item.id, 'scan_item_name': item.name,
+                    state.update({
+                        'scan_item_id': item_id, 'scan_item_name': item_name,
                         'scan_accumulated_price': 0.0 # <<< Reset price for the new item
                     })
-                    session.modified = True
-                    msg = f"Item set: {item.name}. Scan price(s)."
+                    msg = f"Item set: {item_name}. Scan price(s)."
                     # Check uniqueness constraint (optional but good)
-                    if item.is_unique:
-                        existing = Purchase.query.filter_by(event_id=event_id, item_id=item.id).first()
-                        if existing:
-                            logger.warning(f"Unique item '{item.name}' already purchased by Buyer ID {existing.buyer_id}.")
-                            msg += f" ⚠️ Already purchased by {existing.buyer.name}!"
+                    if is_unique:
+                        owner = _first(_UNIQUE_ITEM_OWNER, event_id=event_id, item_id=item_id)
+                        if owner:
+                            logger.warning(f"Unique item '{item_name}' already purchased by Buyer ID {owner.buyer_id}.")
+                            msg += f" ⚠️ Already purchased by {owner.name}!"
                     response.update(status='success', message=msg)
                 else:
                     logger.warning(f"Unknown item barcode scanned: '{iid}'")
                     response['message'] = f"Unknown item barcode: '{iid}'."
                     # Clear only item/price if item not found
-                    session.update({'scan_item_id': None, 'scan_item_name': None, 'scan_accumulated_price': 0.0})
-                    session.modified = True
+                    state.update({'scan_item_id': None, 'scan_item_name': None, 'scan_accumulated_price': 0.0})
 
         # --- Price Scan ---
         elif barcode.startswith('PRICE:'):
             # Check if we have a buyer and item selected first
-            if not session.get('scan_item_id'):
+            if not state.get('scan_item_id'):
                 logger.warning("Price scanned before item.")
                 response['message'] = 'Scan item first.'
-            elif not session.get('scan_buyer_id'):
+            elif not state.get('scan_buyer_id'):
                  logger.warning("Price scanned before buyer.")
                  response['message'] = 'Scan buyer first.'
             else:
@@ -156,12 +205,11 @@ def process_scan():
                     price = float(price_str)
                     logger.info(f"Scanned Price: {price}")
 
-                    # *** Accumulate the price in the session ***
-                    current_total = session.get('scan_accumulated_price', 0.0)
+                    # *** Accumulate the price in the scan state ***
+                    current_total = state.get('scan_accumulated_price', 0.0)
                     new_total = current_total + price
-                    session['scan_accumulated_price'] = new_total
-                    session.modified = True
-                    logger.info(f"Accumulated price for item '{session.get('scan_item_name')}' updated to: {new_total}")
+                    state['scan_accumulated_price'] = new_total
+                    logger.info(f"Accumulated price for item '{state.get('scan_item_name')}' updated to: {new_total}")
 
                     # *** DO NOT SAVE YET ***
                     # *** DO NOT RESET ITEM/PRICE STATE YET ***
@@ -171,7 +219,7 @@ def process_scan():
                         status='success',
                         message=(
                           f"Added ₪{price:.2f}. "
-                          f"Current total for {session.get('scan_item_name', 'item')} is ₪{new_total:.2f}. "
+                          f"Current total for {state.get('scan_item_name', 'item')} is ₪{new_total:.2f}. "
                           f"Scan another price or next item/buyer."
                         )
                     )
@@ -183,13 +231,9 @@ def process_scan():
                     logger.exception(f"Error processing price scan: {e_price}")
                     response['message'] = 'Error processing price.'
 
-        # --- Clear Command ---
-        elif barcode == 'BUYER:__CLEAR__':
-            logger.info("Received clear state command.")
-            # *** Save any pending purchase before clearing ***
-            save_pending_purchase(session)
-            clear_scan_session_keys(clear_event=False) # Keep event id
-            response.update(status='success', message='State cleared. Scan buyer.')
+        # --- Composite Card (item + price, optionally buyer) ---
+        elif barcode.startswith(CARD_PREFIX):
+            response.update(_apply_card(state, barcode, scanned_at, commit))
 
         # --- Unknown Barcode Format ---
         else:
@@ -197,10 +241,107 @@ def process_scan():
             response['message'] = f"Unrecognized barcode format: '{barcode}'."
 
     except Exception as e:
+        if not commit:
+            raise # Replay: abort the whole batch (see replay_scans)
         logger.exception(f"Unexpected error during scan processing for barcode '{barcode}': {e}")
         response['message'] = 'A server error occurred during processing.'
         response['status'] = 'error'
 
+    return response
+
+
+def _apply_card(state, barcode: str, scanned_at=None, commit: bool = True) -> dict:
+    """
+    A composite card (see app/utils/card_codes.py) records its purchase in one
+    scan: the card's buyer (or the current one), item and price. The buyer stays
+    selected, so a run of cards for the same buyer needs one BUYER: scan.
+    """
+    try:
+        card = parse_card_code(barcode)
+    except ValueError as e:
+        logger.warning(f"Rejected card barcode '{barcode}': {e}")
+        return {'status': 'error', 'message': str(e)}
+    if not card.buyer_barcode and not state.get('scan_buyer_id'):
+        return {'status': 'error', 'message': 'Scan buyer first.'}
+
+    clear_item = {'scan_item_id': None, 'scan_item_name': None, 'scan_accumulated_price': 0.0}
+    if save_pending_purchase(state, scanned_at, commit) is False:
+        pending_name = state.get('scan_item_name')
+        state.update(clear_item)
+        return {'status': 'error', 'message': f"The pending {pending_name} was not saved. Scan it again."}
+    if card.buyer_barcode:
+        buyer = _first(_BUYER_BY_BARCODE, barcode=card.buyer_barcode)
+        if not buyer:
+            clear_scan_session_keys(clear_event=False, state=state)
+            return {'status': 'error', 'message': f"Unknown buyer barcode: '{card.buyer_barcode}'."}
+        state.update(scan_buyer_id=buyer[0], scan_buyer_name=buyer[1])
+
+    item = _first(_ITEM_BY_BARCODE, barcode=card.item_barcode)
+    if not item:
+        state.update(clear_item)
+        return {'status': 'error', 'message': f"Unknown item barcode: '{card.item_barcode}'."}
+    item_id, item_name, is_unique = item
+    if is_unique:
+        other = _first(_UNIQUE_ITEM_OTHER_BUYER, event_id=state.get('scan_event_id'), item_id=item_id,
+                       buyer_id=state['scan_buyer_id'])
+        if other:
+            owner = _first(_UNIQUE_ITEM_OWNER, event_id=state.get('scan_event_id'), item_id=item_id)
+            state.update(clear_item)
+            return {'status': 'error', 'message': f"{item_name} already purchased by {owner.name}! Not saved."}
+
+    state.update(scan_item_id=item_id, scan_item_name=item_name, scan_accumulated_price=card.price)
+    saved = save_pending_purchase(state, scanned_at, commit)
+    state.update(clear_item)
+    if not saved:
+        return {'status': 'error', 'message': 'A server error occurred during processing.'}
+    return {'status': 'success',
+            'message': f"Saved {item_name} for {state['scan_buyer_name']}: ₪{card.price:.2f}. Scan next card or buyer."}
+
+
+@bp.route('/process_scan', methods=['POST'])
+@login_required
+def process_scan():
+    data     = request.get_json() or {}
+    barcode  = data.get('barcode', '').strip()
+    event_id = session.get('scan_event_id')
+
+    logger.debug(f"Processing scan. Barcode: '{barcode}', Event ID from session: {event_id}")
+
+    # Start response with current state
+    response = {'status':'error', 'message':'', 'state': get_current_scan_state()}
+
+    if not barcode:
+        response['message'] = 'No barcode received.'
+        logger.warning("Process scan called with empty barcode.")
+        return jsonify(response)
+
+    if not event_id:
+        response['message'] = 'Error: No active event session. Please select an event.'
+        logger.error("Process scan called but no 'scan_event_id' in session.")
+        clear_scan_session_keys()
+        response['state'] = get_current_scan_state()
+        return jsonify(response), 400
+
+    if not _first(_EVENT_EXISTS, event_id=event_id):
+        response['message'] = f'Error: Event {event_id} not found in database.'
+        logger.error(f"Event ID {event_id} from session not found in database.")
+        clear_scan_session_keys()
+        response['state'] = get_current_scan_state()
+        return jsonify(response), 400
+
+    # Same barcode again within its window (a double read): ignored, state unchanged
+    station = str(data.get('station_id') or session.get('_id') or request.remote_addr)
+    seen_at = time.time()
+    if scan_dedupe.suppress(station, barcode, seen_at):
+        logger.info(f"Suppressed repeated scan '{barcode}' from station {station}.")
+        response.update(status='suppressed', message='Duplicate scan ignored.')
+        return jsonify(response)
+
+    response.update(_apply_scan(session, barcode))
+    session.modified = True
+    if response['status'] == 'error':
+        scan_dedupe.forget(station, barcode, seen_at) # A rejected scan may be retried at once
+
     # Update response state (reflects current accumulation) and purchase list
     response['state'] = get_current_scan_state()
     try:
@@ -221,12 +362,185 @@ def finish_event():
     # *** Save the very last pending purchase ***
     save_pending_purchase(session)
     clear_scan_session_keys()
+    station_id = request.form.get('station_id', '').strip()
+    if station_id:
+        # Scanner page in offline-capable mode: its state lives in the station row
+        _finish_station(station_id)
     session.modified = True
     flash("Finished scanning session.", "success")
     logger.info("Scanning session finished and state cleared.")
     return redirect(url_for('main.list_events'))
 
 
+# --- Offline Scanner Support ---
+# The scanner page records every scan in IndexedDB with a per-station sequence
+# number and sends them here in order (immediately when online, in batches once
+# the connection returns). The station's buyer/item/price state is kept in the
+# scan_stations row, so a resent batch after a lost response changes nothing.
+
+class ReplayConflict(Exception):
+    """Another request advanced the station's sequence number first."""
+
+
+@bp.route('/replay', methods=['POST'])
+@login_required
+def replay_scans():
+    """
+    Applies a station's queued scans through the scan state machine:
+    {station_id, event_id, scans: [{seq, barcode, scanned_at (ms since epoch)}]}.
+    Scans at or below the station's last applied seq are reported as duplicates,
+    repeats of a barcode within its window (see scan_dedupe) as suppressed.
+    """
+    data = request.get_json(silent=True) or {}
+    station_id = str(data.get('station_id') or '').strip()
+    event_id = data.get('event_id')
+    scans = data.get('scans')
+    if not station_id or len(station_id) > 64 or not isinstance(event_id, int) \
+            or not isinstance(scans, list) or len(scans) > REPLAY_MAX_BATCH:
+        return jsonify({'error': 'Invalid replay batch.'}), 400
+    try:
+        scans = sorted(((int(scan['seq']), str(scan.get('barcode') or '').strip(), scan.get('scanned_at'))
+                        for scan in scans), key=lambda scan: scan[0])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid scan in replay batch.'}), 400
+    if not _first(_EVENT_EXISTS, event_id=event_id):
+        return jsonify({'error': f'Event {event_id} not found.'}), 404
+
+    try:
+        results, last_seq, state = _replay_batch(station_id, event_id, scans)
+    except (ReplayConflict, IntegrityError):
+        db.session.rollback()
+        logger.warning(f"Replay conflict for station {station_id}; client will resend.")
+        return jsonify({'error': 'Station was updated by another request; resend.'}), 409
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error replaying {len(scans)} scans for station {station_id}: {e}")
+        return jsonify({'error': 'Server error while replaying scans.'}), 500
+
+    logger.info(f"Station {station_id}: replayed {len(scans)} scans for event {event_id}, last seq {last_seq}.")
+    return jsonify({
+        'results': results, 'last_seq': last_seq,
+        'state': get_current_scan_state(state), 'purchases': _get_list(event_id)
+    })
+
+
+@retry_on_busy
+def _replay_batch(station_id: str, event_id: int, scans):
+    """Applies new scans and advances the station in one transaction; returns (results, last_seq, state)."""
+    conn = db.session.connection()
+    row = conn.execute(_STATION_BY_ID, {'station_id': station_id}).first()
+    old_seq = row.last_seq if row else 0
+    # A station moving to another event starts with an empty buyer/item state
+    state = dict(row.state or {}) if row and row.event_id == event_id else {}
+    state['scan_event_id'] = event_id
+
+    # Repeats are judged on the scan times; the ring is only updated once the batch commits
+    sightings, checked = scan_dedupe.recent(station_id), []
+    results, last_seq = [], old_seq
+    for seq, barcode, scanned_at in scans:
+        if seq <= last_seq:
+            results.append({'seq': seq, 'status': 'duplicate', 'message': 'Already applied.'})
+            continue
+        last_seq = seq
+        if not barcode:
+            results.append({'seq': seq, 'status': 'error', 'message': 'No barcode received.'})
+            continue
+        scan_time = _scan_time(scanned_at)
+        at = float(scanned_at) / 1000 if scan_time else time.time()
+        repeat = scan_dedupe.is_repeat(sightings, barcode, at)
+        checked.append((barcode, repeat))
+        if repeat:
+            sightings.append((barcode, at))
+            results.append({'seq': seq, 'status': 'suppressed', 'message': 'Duplicate scan ignored.'})
+            continue
+        result = _apply_scan(state, barcode, scan_time, commit=False)
+        if result['status'] != 'error': # A rejected scan may be retried at once
+            sightings.append((barcode, at))
+        results.append(dict(result, seq=seq))
+
+    if row is not None and last_seq == old_seq:
+        db.session.rollback() # Nothing new (a resent batch)
+        return results, last_seq, dict(row.state or {})
+    values = {'event_id': event_id, 'last_seq': last_seq, 'state': state, 'updated_at': datetime.utcnow()}
+    if row is None:
+        conn.execute(insert(_stations).values(station_id=station_id, **values))
+    elif conn.execute(update(_stations).where(
+            _stations.c.station_id == station_id, _stations.c.last_seq == old_seq).values(**values)).rowcount != 1:
+        raise ReplayConflict()
+    db.session.commit()
+    scan_dedupe.remember(station_id, sightings, checked)
+    return results, last_seq, state
+
+
+def _scan_time(scanned_at):
+    """Client scan time (ms since epoch) as naive UTC; None (= now) if missing or implausible."""
+    try:
+        timestamp = datetime.utcfromtimestamp(float(scanned_at) / 1000)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    now = datetime.utcnow()
+    if timestamp > now + timedelta(minutes=5) or timestamp < now - REPLAY_MAX_AGE:
+        return None
+    return timestamp
+
+
+@retry_on_busy
+def _finish_station(station_id: str):
+    """Saves a station's pending purchase and clears its scan state (Finish button)."""
+    conn = db.session.connection()
+    row = conn.execute(_STATION_BY_ID, {'station_id': station_id}).first()
+    if row is None or not row.state:
+        return
+    state = dict(row.state)
+    save_pending_purchase(state, commit=False)
+    clear_scan_session_keys(state=state)
+    conn.execute(update(_stations).where(_stations.c.station_id == station_id)
+                 .values(state=state, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+
+@bp.route('/catalog', methods=['GET'])
+@login_required
+def scan_catalog():
+    """
+    Buyer and item barcodes for resolving scans on the page (see app/utils/scan_catalog.py):
+    {'version', 'full', 'buyers': [[barcode, id, name]], 'items': [[barcode, id, name, is_unique]],
+     'removed': {'buyers': [barcode], 'items': [barcode]}, 'claims': [[item_id, buyer_name]]}.
+    ?since=<version> returns only the changes, ?event_id= adds the event's unique-item
+    claims; a matching If-None-Match gets 304.
+    """
+    conn = db.session.connection()
+    event_id = request.args.get('event_id', type=int)
+    version, claims, etag = catalog_head(conn, event_id)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        full, buyers, items, removed = catalog_rows(conn, request.args.get('since', type=int))
+        response = jsonify({'version': version, 'full': full, 'buyers': buyers, 'items': items,
+                            'removed': removed, 'claims': claims})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bp.route('/service-worker.js', methods=['GET'])
+def service_worker():
+    """Service worker that caches the scanner page; served under /scan/ so that is its scope."""
+    response = make_response(render_template('scanning/service_worker.js'))
+    response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bp.route('/barcode-worker.js', methods=['GET'])
+def barcode_worker():
+    """Web Worker that decodes camera frames for the scanner page."""
+    response = make_response(render_template('scanning/barcode_worker.js'))
+    response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 # *** Renamed route to match older JS call ***
 @bp.route('/scan/purchases', methods=['GET'])
 @login_required
@@ -273,7 +587,11 @@ def delete_purchase(pid):
          return jsonify({'success': False, 'message': 'Purchase does not belong to the current event'}), 403
 
     try:
+        conn = db.session.connection()
+        buyer_ids = release_pledges(conn, [pid])
         db.session.delete(p)
+        db.session.flush()
+        refresh_balances(conn, buyer_ids)
         db.session.commit()
         logger.info(f"Purchase ID {pid} deleted successfully for event {event_id}.")
         # Return success consistent with older JS expectation
@@ -382,15 +700,13 @@ def manual_entry():
         qty = form.quantity.data or 1
 
         try:
-            p = Purchase(
+            purchase_id = _insert_purchase(
                 event_id=event_id, buyer_id=form.buyer_id.data,
                 item_id=form.item_id.data, total_price=price, quantity=qty,
                 is_manual_entry=True,
                 manual_entry_notes=form.manual_entry_notes.data.strip() or None
             )
-            db.session.add(p)
-            db.session.commit()
-            logger.info(f"Manual purchase (ID: {p.id}) added successfully.")
+            logger.info(f"Manual purchase (ID: {purchase_id}) added successfully.")
 
             # Return updated list, consistent with older JS expectation
             # *** Use the consistent helper name ***
@@ -408,25 +724,41 @@ def manual_entry():
 
 # --- Helper Functions ---
 
-def get_current_scan_state():
-    """Returns the current scanning state from the session."""
+def _add_purchase(**fields):
+    """Inserts one purchase in the current transaction; returns its id."""
+    return db.session.connection().execute(_INSERT_PURCHASE, fields).inserted_primary_key[0]
+
+@retry_on_busy
+def _insert_purchase(**fields):
+    """Inserts and commits one purchase, retrying if another worker holds the write lock. Returns its id."""
+    purchase_id = _add_purchase(**fields)
+    db.session.commit()
+    return purchase_id
+
+def get_current_scan_state(state=None):
+    """Returns the current scanning state from the session (or the given scan state)."""
+    source = session if state is None else state
     state = {
-        'buyer_name': session.get('scan_buyer_name',''),
-        'item_name':  session.get('scan_item_name',''),
-        'accumulated_price': session.get('scan_accumulated_price', 0.0),
+        'buyer_name': source.get('scan_buyer_name',''),
+        'item_name':  source.get('scan_item_name',''),
+        'accumulated_price': source.get('scan_accumulated_price', 0.0),
         # Include IDs for potential debugging or state display needs
-        'event_id': session.get('scan_event_id'),
-        'buyer_id': session.get('scan_buyer_id'),
-        'item_id': session.get('scan_item_id'),
+        'event_id': source.get('scan_event_id'),
+        'buyer_id': source.get('scan_buyer_id'),
+        'item_id': source.get('scan_item_id'),
     }
     return state
 
-def save_pending_purchase(user_session):
+def save_pending_purchase(user_session, scanned_at=None, commit=True):
     """
     Saves a purchase to the database if a buyer, item, and event are
     currently set in the session. Uses the 'scan_accumulated_price'.
     This function is called *before* changing the buyer or item,
-    or when finishing/clearing.
+    or when finishing/clearing. scanned_at (replayed scans) becomes the
+    purchase timestamp; with commit=False the insert joins the caller's
+    transaction and errors propagate. Returns the new purchase's id, None
+    when nothing complete was pending, or False when the save was blocked
+    (unique item) or failed.
     """
     eid = user_session.get('scan_event_id')
     bid = user_session.get('scan_buyer_id')
@@ -442,32 +774,34 @@ def save_pending_purchase(user_session):
         try:
             # Check if this exact item was already purchased by someone else if it's unique
             # (Consider if this check is needed here or only on ITEM scan)
-            item = db.session.get(Item, iid)
+            item = _first(_ITEM_BY_ID, item_id=iid)
             if item and item.is_unique:
-                existing = Purchase.query.filter(
-                    Purchase.event_id == eid,
-                    Purchase.item_id == iid,
-                    Purchase.buyer_id != bid # Check if bought by *someone else*
-                ).first()
+                # Check if bought by *someone else*
+                existing = _first(_UNIQUE_ITEM_OTHER_BUYER, event_id=eid, item_id=iid, buyer_id=bid)
                 if existing:
                     logger.warning(f"SAVE BLOCKED: Unique item '{item.name}' (ID:{iid}) already purchased by Buyer {existing.buyer_id} in Event {eid}. Cannot save for Buyer {bid}.")
                     # Optionally flash a message or handle this in the response?
                     # For now, just log and don't save.
-                    return # Exit the function, do not save
+                    return False # Exit the function, do not save
 
-            purchase = Purchase(
+            fields = dict(
                 event_id=eid, buyer_id=bid, item_id=iid,
                 total_price=price, quantity=1, # Assume quantity 1 for scans
                 is_manual_entry=False # This is for scanned entries
             )
-            db.session.add(purchase)
-            db.session.commit()
-            logger.info(f"Pending purchase saved (ID: {purchase.id}). E={eid}, B={bid}, I={iid}, Price={price}")
+            if scanned_at is not None:
+                fields['timestamp'] = scanned_at
+            purchase_id = _insert_purchase(**fields) if commit else _add_purchase(**fields)
+            logger.info(f"Pending purchase saved (ID: {purchase_id}). E={eid}, B={bid}, I={iid}, Price={price}")
             # Important: Do NOT clear state here. The calling function (process_scan)
             # decides when to clear parts of the state (e.g., item/price).
+            return purchase_id
         except Exception as e:
+            if not commit:
+                raise
             db.session.rollback()
             logger.exception(f"Failed save_pending_purchase (E:{eid}, B:{bid}, I:{iid}, P:{price}): {e}")
+            return False
     else:
         # Log only if something *was* partially set, indicating an incomplete state that wasn't saved.
         if eid and (bid or iid):
@@ -484,30 +818,25 @@ def _get_list(event_id):
         return []
 
     try:
-        # Eager load related Buyer and Item using joinedload
-        purchases = Purchase.query.options(
-            joinedload(Purchase.buyer),
-            joinedload(Purchase.item)
-        ).filter_by(event_id=event_id).order_by(Purchase.timestamp.asc()).all() # Order by oldest first
+        # One joined Core query; rows are plain tuples, not Purchase/Buyer/Item objects
+        rows = db.session.connection().execute(_PURCHASE_LIST, {'event_id': event_id}).all()
 
-        logger.info(f"_get_list found {len(purchases)} purchases for event {event_id}.")
+        logger.info(f"_get_list found {len(rows)} purchases for event {event_id}.")
 
         result_list = []
-        for r in purchases:
-            buyer_name = r.buyer.name if r.buyer else "Unknown Buyer"
-            item_name = r.item.name if r.item else "Unknown Item"
-
+        for pid, buyer_name, item_name, price, quantity, notes, timestamp, manual, item_id in rows:
             result_list.append({
-                'id': r.id,
-                'buyer': buyer_name,
-                'item': item_name,
-                'price': r.total_price,
-                'quantity': r.quantity,
-                'notes': r.manual_entry_notes or '',
+                'id': pid,
+                'item_id': item_id,
+                'buyer': buyer_name or "Unknown Buyer",
+                'item': item_name or "Unknown Item",
+                'price': price,
+                'quantity': quantity,
+                'notes': notes or '',
                 # Use the timestamp format consistent with the older working version if needed,
                 # but ISO format might be better for JS date parsing if required later.
-                'time': r.timestamp.strftime('%Y-%m-%d %H:%M:%S') if r.timestamp else None,
-                'manual': r.is_manual_entry
+                'time': timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None,
+                'manual': manual
             })
         return result_list
 
@@ -515,8 +844,8 @@ def _get_list(event_id):
         logger.exception(f"Database error in _get_list for event {event_id}: {e}")
         return [] # Return empty list on error to prevent breaking UI
 
-def clear_scan_session_keys(clear_event=True):
-    """Removes scanning-related keys from the session."""
+def clear_scan_session_keys(clear_event=True, state=None):
+    """Removes scanning-related keys from the session (or the given scan state)."""
     keys_to_clear = [
         'scan_buyer_id', 'scan_buyer_name',
         'scan_item_id', 'scan_item_name', 'scan_accumulated_price'
@@ -524,11 +853,12 @@ def clear_scan_session_keys(clear_event=True):
     if clear_event:
         keys_to_clear.append('scan_event_id')
 
+    target = session if state is None else state
     cleared_count = 0
     for key in keys_to_clear:
-        if key in session:
-            session.pop(key, None)
+        if key in target:
+            target.pop(key, None)
             cleared_count += 1
-    if cleared_count > 0:
+    if cleared_count > 0 and state is None:
         session.modified = True
     logger.info(f"Cleared {cleared_count} scanning keys from session (clear_event={clear_event}).")
\ No newline at end of file
@@ -0,0 +1,100 @@
+// Barcode detection worker for the scanner page (served by scanning.barcode_worker).
+// The page posts camera frames (its region of interest, as ImageBitmaps); the
+// worker decodes them off the main thread and reports the codes, the decode time
+// and how much the picture changed since the previous frame, which the page uses
+// to pick its frame rate. BarcodeDetector is used where the browser has it,
+// ZXing otherwise.
+const ZXING_URL = 'https://unpkg.com/@zxing/library@0.18.6/umd/index.min.js';
+const MOTION_SIZE = 24; // Motion is measured on a 24x24 grayscale thumbnail
+
+let detector = null;
+let reader = null;
+let frameCanvas = null;
+let motionCanvas = null;
+let previousThumb = null;
+
+async function init() {
+  if (typeof OffscreenCanvas === 'undefined') throw new Error('OffscreenCanvas not supported');
+  motionCanvas = new OffscreenCanvas(MOTION_SIZE, MOTION_SIZE);
+  if ('BarcodeDetector' in self) {
+    try {
+      const formats = await BarcodeDetector.getSupportedFormats();
+      if (formats.length) {
+        detector = new BarcodeDetector({ formats: formats });
+        return 'BarcodeDetector';
+      }
+    } catch (error) { /* Fall back to ZXing */ }
+  }
+  importScripts(ZXING_URL);
+  reader = new ZXing.MultiFormatReader();
+  frameCanvas = new OffscreenCanvas(1, 1);
+  return 'ZXing';
+}
+
+// Mean absolute luminance change per pixel (0-1) against the previous frame
+function measureMotion(bitmap) {
+  const ctx = motionCanvas.getContext('2d', { willReadFrequently: true });
+  ctx.drawImage(bitmap, 0, 0, MOTION_SIZE, MOTION_SIZE);
+  const rgba = ctx.getImageData(0, 0, MOTION_SIZE, MOTION_SIZE).data;
+  const thumb = new Uint8ClampedArray(MOTION_SIZE * MOTION_SIZE);
+  let change = 0;
+  for (let i = 0; i < thumb.length; i++) {
+    thumb[i] = (rgba[i * 4] * 77 + rgba[i * 4 + 1] * 150 + rgba[i * 4 + 2] * 29) >> 8;
+    if (previousThumb) change += Math.abs(thumb[i] - previousThumb[i]);
+  }
+  const motion = previousThumb ? change / (thumb.length * 255) : 1;
+  previousThumb = thumb;
+  return motion;
+}
+
+async function detectNative(bitmap) {
+  const found = await detector.detect(bitmap);
+  return { codes: found.map(code => code.rawValue), partial: false };
+}
+
+// partial: ZXing found a code but couldn't read it (checksum/format), so a
+// better frame is probably a moment away
+function decodeZXing(bitmap) {
+  frameCanvas.width = bitmap.width;
+  frameCanvas.height = bitmap.height;
+  const ctx = frameCanvas.getContext('2d', { willReadFrequently: true });
+  ctx.drawImage(bitmap, 0, 0);
+  const rgba = ctx.getImageData(0, 0, bitmap.width, bitmap.height).data;
+  const luminances = new Uint8ClampedArray(bitmap.width * bitmap.height);
+  for (let i = 0; i < luminances.length; i++) {
+    luminances[i] = (rgba[i * 4] * 77 + rgba[i * 4 + 1] * 150 + rgba[i * 4 + 2] * 29) >> 8;
+  }
+  const source = new ZXing.RGBLuminanceSource(luminances, bitmap.width, bitmap.height, bitmap.width, bitmap.height, 0, 0);
+  try {
+    const result = reader.decode(new ZXing.BinaryBitmap(new ZXing.HybridBinarizer(source)));
+    return { codes: [result.getText()], partial: false };
+  } catch (error) {
+    if (error instanceof ZXing.NotFoundException) return { codes: [], partial: false };
+    return { codes: [], partial: true };
+  } finally {
+    reader.reset();
+  }
+}
+
+const ready = init()
+  .then(engine => { postMessage({ type: 'ready', engine: engine }); return true; })
+  .catch(error => { postMessage({ type: 'unsupported', error: String(error) }); return false; });
+
+onmessage = async ({ data }) => {
+  if (data.type !== 'frame') return;
+  const bitmap = data.bitmap;
+  const started = performance.now();
+  const reply = { type: 'result', id: data.id, capturedAt: data.capturedAt, codes: [], partial: false, motion: 0 };
+  try {
+    if (await ready) {
+      reply.motion = measureMotion(bitmap);
+      Object.assign(reply, detector ? await detectNative(bitmap) : decodeZXing(bitmap));
+    }
+  } catch (error) {
+    reply.error = String(error);
+  } finally {
+    bitmap.close();
+  }
+  reply.decodeMs = performance.now() - started;
+  postMessage(reply);
+};
@@ -0,0 +1,56 @@
+// Service worker for the offline scanner (served by scanning.service_worker, scope /scan/).
+// The scanner page is fetched network-first and kept in the cache, so a station
+// that loses Wi-Fi can still reload it; its libraries are cached on install.
+// Scans themselves are queued by the page in IndexedDB, not here.
+const CACHE_NAME = 'scanner-v1';
+const SCANNER_PATH = '{{ url_for("scanning.start_scanning", event_id=0)[:-1] }}';
+const CATALOG_PATH = '{{ url_for("scanning.scan_catalog") }}';
+const WORKER_PATH = '{{ url_for("scanning.barcode_worker") }}';
+const LIBRARIES = [
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+  'https://unpkg.com/@zxing/library@0.18.6/umd/index.min.js',
+];
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      // One failing CDN must not stop the install
+      .then(cache => Promise.all(LIBRARIES.map(url => cache.add(url).catch(() => null))))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(key => key.startsWith('scanner-') && key !== CACHE_NAME)
+                                    .map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+// Network first; successful responses refresh the cache, failures fall back to it
+function networkFirst(request) {
+  return fetch(request).then(response => {
+    if (response.ok && !response.redirected) {
+      const copy = response.clone();
+      caches.open(CACHE_NAME).then(cache => cache.put(request, copy));
+    }
+    return response;
+  }).catch(() => caches.match(request).then(cached => cached || Response.error()));
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') return; // Scans go through the page's queue
+  const url = new URL(request.url);
+
+  if (request.mode === 'navigate' && url.pathname.startsWith(SCANNER_PATH)) {
+    event.respondWith(networkFirst(request));
+  } else if (url.pathname === CATALOG_PATH || url.pathname === WORKER_PATH) {
+    event.respondWith(networkFirst(request));
+  } else if (LIBRARIES.includes(request.url)) {
+    event.respondWith(caches.match(request).then(cached => cached || fetch(request)));
+  }
+});
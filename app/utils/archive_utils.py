@@ -0,0 +1,429 @@
+# file: app/utils/archive_utils.py
+# Hot/cold storage for purchases: closed Hebrew years are moved out of the
+# main `purchases` table into one compact SQLite file per year. The main DB
+# keeps per-event buyer/item aggregates so totals stay queryable without
+# opening the archive files.
+import heapq
+import json
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import (
+    Event, Buyer, BuyerAlias, Item, Purchase, PurchaseArchive, ArchivedBuyerTotal, ArchivedItemTotal
+)
+from app.utils.hebrew_date_utils import hebrew_year_bounds
+from app.utils.payment_utils import release_pledges
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILENAME = 'purchases_{year}.sqlite'
+ARCHIVE_BATCH_SIZE = 1000
+
+# Purchases are stored as integers only; names live once in the dimension tables.
+# Timestamps are microseconds since the epoch (UTC). purchase_id is the original
+# id, which is not unique: SQLite reuses ids once the hot table has been emptied.
+_ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, event_name TEXT, gregorian_date TEXT, hebrew_date TEXT);
+CREATE TABLE IF NOT EXISTS buyers (id INTEGER PRIMARY KEY, name TEXT, barcode_id TEXT);
+CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT, barcode_id TEXT);
+CREATE TABLE IF NOT EXISTS purchases (
+    id INTEGER PRIMARY KEY, purchase_id INTEGER NOT NULL,
+    event_id INTEGER NOT NULL, buyer_id INTEGER NOT NULL, item_id INTEGER NOT NULL,
+    quantity INTEGER, total_price REAL NOT NULL, timestamp_us INTEGER,
+    is_manual_entry INTEGER, manual_entry_notes TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_purchases_buyer_id ON purchases (buyer_id, timestamp_us);
+CREATE INDEX IF NOT EXISTS ix_purchases_event_id ON purchases (event_id, timestamp_us);
+CREATE INDEX IF NOT EXISTS ix_purchases_item_id ON purchases (item_id, timestamp_us);
+"""
+
+ArchivedItem = namedtuple('ArchivedItem', ['id', 'name'])
+# Same attributes the buyer card template reads from a Purchase
+ArchivedPurchase = namedtuple('ArchivedPurchase', ['id', 'event', 'item', 'total_price', 'quantity', 'timestamp', 'archived'])
+
+
+class ArchiveError(Exception):
+    """Raised when a Hebrew year cannot be archived."""
+
+
+def _archive_dir() -> str:
+    return current_app.config['PURCHASE_ARCHIVE_DIR']
+
+def _archive_path(archive: PurchaseArchive) -> str:
+    return os.path.join(_archive_dir(), archive.filename)
+
+def _to_us(ts):
+    if ts is None:
+        return None
+    return int(ts.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+def _from_us(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1_000_000, tz=timezone.utc).replace(tzinfo=None)
+
+def _open_readonly(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+# --- Archiving ---
+
+def archive_hebrew_year(hebrew_year: int, vacuum: bool = False) -> PurchaseArchive:
+    """
+    Moves the purchases of every event in a closed Hebrew year into the year's
+    archive file, records per-event aggregates in the main DB and deletes the
+    hot rows. Running it again archives purchases added since the last run.
+    """
+    year_start, year_end = hebrew_year_bounds(hebrew_year)
+    if year_end > datetime.utcnow():
+        raise ArchiveError(f"Hebrew year {hebrew_year} is not over yet (ends {year_end:%Y-%m-%d}).")
+
+    event_ids = db.session.execute(
+        select(Event.id).where(Event.gregorian_date >= year_start, Event.gregorian_date < year_end)
+    ).scalars().all()
+    # Rows scanned after this point are left for the next run
+    max_id = db.session.execute(
+        select(func.max(Purchase.id)).where(Purchase.event_id.in_(event_ids))
+    ).scalar() if event_ids else None
+    if max_id is None:
+        raise ArchiveError(f"No purchases to archive for Hebrew year {hebrew_year}.")
+    in_year = (Purchase.event_id.in_(event_ids), Purchase.id <= max_id)
+
+    archive = db.session.get(PurchaseArchive, hebrew_year) or PurchaseArchive(
+        hebrew_year=hebrew_year, filename=ARCHIVE_FILENAME.format(year=hebrew_year)
+    )
+    os.makedirs(_archive_dir(), exist_ok=True)
+    path = _archive_path(archive)
+
+    # 1. Append detail rows to the archive file
+    archived_rows, batch_start = _write_archive_file(path, event_ids, in_year)
+
+    # 2. Aggregates + hot delete in one transaction on the main DB
+    try:
+        _merge_archived_totals(hebrew_year, in_year)
+        # Pledged totals move to the archived aggregates, so balances don't change
+        release_pledges(db.session.connection(), select(Purchase.id).where(*in_year))
+        deleted = db.session.execute(
+            delete(Purchase).where(*in_year), execution_options={'synchronize_session': False}
+        ).rowcount
+        if deleted != archived_rows:
+            raise ArchiveError(f"Archived {archived_rows} purchases but {deleted} matched for deletion.")
+        archive.purchase_count = (archive.purchase_count or 0) + deleted
+        archive.total_amount = db.session.execute(
+            select(func.coalesce(func.sum(ArchivedBuyerTotal.total), 0.0))
+            .where(ArchivedBuyerTotal.hebrew_year == hebrew_year)
+        ).scalar()
+        archive.archived_at = datetime.utcnow()
+        db.session.add(archive)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _discard_archive_batch(path, batch_start) # The hot rows are still there
+        raise
+    db.session.expire_all()
+    logger.info(f"Archived {deleted} purchases of Hebrew year {hebrew_year} to {path}")
+
+    if vacuum:
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+    return archive
+
+
+def _write_archive_file(path: str, event_ids, in_year):
+    """
+    Copies dimension and purchase rows into the archive file.
+    Returns (purchase_count, batch_start): rows with id > batch_start belong to this run.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(_ARCHIVE_SCHEMA)
+        batch_start = conn.execute('SELECT coalesce(max(id), 0) FROM purchases').fetchone()[0]
+        conn.executemany(
+            'INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)',
+            ((eid, name, gdate.isoformat() if gdate else None, hdate) for eid, name, gdate, hdate in
+             db.session.execute(select(Event.id, Event.event_name, Event.gregorian_date, Event.hebrew_date)
+                                .where(Event.id.in_(event_ids))).tuples())
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO buyers VALUES (?, ?, ?)',
+            db.session.execute(select(Buyer.id, Buyer.name, Buyer.barcode_id).where(
+                Buyer.id.in_(select(Purchase.buyer_id).where(*in_year).distinct())
+            )).tuples().all()
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO items VALUES (?, ?, ?)',
+            db.session.execute(select(Item.id, Item.name, Item.barcode_id).where(
+                Item.id.in_(select(Purchase.item_id).where(*in_year).distinct())
+            )).tuples().all()
+        )
+
+        query = select(
+            Purchase.id, Purchase.event_id, Purchase.buyer_id, Purchase.item_id, Purchase.quantity,
+            Purchase.total_price, Purchase.timestamp, Purchase.is_manual_entry, Purchase.manual_entry_notes
+        ).where(*in_year).order_by(Purchase.id)
+        result = db.session.execute(query, execution_options={'yield_per': ARCHIVE_BATCH_SIZE})
+        count = 0
+        for batch in result.tuples().partitions():
+            conn.executemany(
+                'INSERT INTO purchases (purchase_id, event_id, buyer_id, item_id, quantity, total_price, '
+                'timestamp_us, is_manual_entry, manual_entry_notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((pid, eid, bid, iid, qty, price, _to_us(ts), int(bool(manual)), notes)
+                 for pid, eid, bid, iid, qty, price, ts, manual, notes in batch)
+            )
+            count += len(batch)
+        conn.commit()
+    finally:
+        conn.close()
+    return count, batch_start
+
+
+def _discard_archive_batch(path: str, batch_start: int):
+    """Removes the rows appended by a run whose main-DB transaction failed."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('DELETE FROM purchases WHERE id > ?', (batch_start,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _merge_archived_totals(hebrew_year: int, in_year):
+    """
+    Adds the hot rows' per-event buyer/item totals to the archived aggregate tables,
+    one INSERT ... SELECT ... ON CONFLICT statement per table.
+    """
+    for model, key in ((ArchivedBuyerTotal, 'buyer_id'), (ArchivedItemTotal, 'item_id')):
+        table, group_col = model.__table__, getattr(Purchase, key)
+        rows = select(
+            Purchase.event_id, group_col, literal(hebrew_year), func.count(Purchase.id),
+            func.coalesce(func.sum(Purchase.total_price), 0.0)
+        ).where(*in_year).group_by(Purchase.event_id, group_col)
+        stmt = sqlite_insert(table).from_select(['event_id', key, 'hebrew_year', 'purchase_count', 'total'], rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['event_id', key],
+            set_={
+                'purchase_count': table.c.purchase_count + stmt.excluded.purchase_count,
+                'total': table.c.total + stmt.excluded.total,
+            },
+        ))
+
+
+# --- Reading (merged with hot data by the callers) ---
+
+def archived_event_aggregates(event_ids):
+    """Returns {event_id: (buyer_totals, item_totals)} for events with archived purchases."""
+    event_ids = list(event_ids)
+    aggregates = {}
+    if not event_ids:
+        return aggregates
+    for event_id, buyer_id, total in db.session.execute(
+        select(ArchivedBuyerTotal.event_id, ArchivedBuyerTotal.buyer_id, ArchivedBuyerTotal.total)
+        .where(ArchivedBuyerTotal.event_id.in_(event_ids))
+    ).tuples():
+        aggregates.setdefault(event_id, ({}, {}))[0][buyer_id] = total
+    for event_id, item_id, count, total in db.session.execute(
+        select(ArchivedItemTotal.event_id, ArchivedItemTotal.item_id,
+               ArchivedItemTotal.purchase_count, ArchivedItemTotal.total)
+        .where(ArchivedItemTotal.event_id.in_(event_ids))
+    ).tuples():
+        aggregates.setdefault(event_id, ({}, {}))[1][item_id] = (count, total)
+    return aggregates
+
+
+def archived_totals(buyer_id: int = None, item_id: int = None):
+    """(purchase_count, total) over all archived years for a buyer or an item."""
+    model, column = (ArchivedBuyerTotal, ArchivedBuyerTotal.buyer_id) if buyer_id is not None \
+        else (ArchivedItemTotal, ArchivedItemTotal.item_id)
+    count, total = db.session.execute(
+        select(func.coalesce(func.sum(model.purchase_count), 0), func.coalesce(func.sum(model.total), 0.0))
+        .where(column == (buyer_id if buyer_id is not None else item_id))
+    ).one()
+    return count, total
+
+
+def _merged_buyers() -> dict:
+    """
+    {old buyer id: (buyer_id, name, barcode_id)} for buyers merged into another
+    one (see buyer_merge). Archive files keep the ids the purchases had.
+    """
+    return {old_id: (buyer_id, name, barcode) for old_id, buyer_id, name, barcode in db.session.execute(
+        select(BuyerAlias.old_buyer_id, Buyer.id, Buyer.name, Buyer.barcode_id)
+        .join(Buyer, Buyer.id == BuyerAlias.buyer_id)
+    ).tuples()}
+
+
+def archived_buyer_purchases(buyer_id: int):
+    """A buyer's archived purchases (newest first) shaped like Purchase rows for templates."""
+    buyer_ids = [buyer_id] + db.session.execute(
+        select(BuyerAlias.old_buyer_id).where(BuyerAlias.buyer_id == buyer_id)
+    ).scalars().all()
+    archive_years = db.session.execute(
+        select(ArchivedBuyerTotal.hebrew_year).where(ArchivedBuyerTotal.buyer_id == buyer_id).distinct()
+    ).scalars().all()
+    if not archive_years:
+        return []
+    archives = db.session.execute(
+        select(PurchaseArchive).where(PurchaseArchive.hebrew_year.in_(archive_years))
+    ).scalars().all()
+
+    raw = []
+    for archive in archives:
+        path = _archive_path(archive)
+        if not os.path.exists(path):
+            logger.warning(f"Archive file for Hebrew year {archive.hebrew_year} is missing: {path}")
+            continue
+        conn = _open_readonly(path)
+        try:
+            placeholders = ','.join('?' * len(buyer_ids))
+            raw.extend(conn.execute(
+                'SELECT p.purchase_id, p.event_id, i.id, i.name, p.total_price, p.quantity, p.timestamp_us '
+                f'FROM purchases p JOIN items i ON i.id = p.item_id WHERE p.buyer_id IN ({placeholders})',
+                tuple(buyer_ids)
+            ).fetchall())
+        finally:
+            conn.close()
+
+    events = {e.id: e for e in Event.query.filter(Event.id.in_({row[1] for row in raw})).all()} if raw else {}
+    purchases = [
+        ArchivedPurchase(pid, events.get(event_id), ArchivedItem(item_id, item_name), price, qty, _from_us(ts), True)
+        for pid, event_id, item_id, item_name, price, qty, ts in raw if event_id in events
+    ]
+    purchases.sort(key=lambda p: p.timestamp or datetime.min, reverse=True)
+    return purchases
+
+
+def _archive_paths(event_ids) -> list:
+    """Paths of the existing archive files holding purchases of the given events, oldest year first."""
+    archive_years = db.session.execute(
+        select(ArchivedBuyerTotal.hebrew_year).where(ArchivedBuyerTotal.event_id.in_(event_ids)).distinct()
+    ).scalars().all()
+    archives = db.session.execute(
+        select(PurchaseArchive).where(PurchaseArchive.hebrew_year.in_(archive_years))
+        .order_by(PurchaseArchive.hebrew_year)
+    ).scalars().all() if archive_years else []
+    paths = []
+    for archive in archives:
+        path = _archive_path(archive)
+        if not os.path.exists(path):
+            logger.warning(f"Archive file for Hebrew year {archive.hebrew_year} is missing: {path}")
+            continue
+        paths.append(path)
+    return paths
+
+
+def archived_ledger_rows(event_ids):
+    """
+    Yields LEDGER_HEADER rows for archived purchases of the given events,
+    reading each archive file in turn (oldest year first).
+    """
+    event_ids = set(event_ids)
+    if not event_ids:
+        return
+    for path in _archive_paths(event_ids):
+        conn = _open_readonly(path)
+        try:
+            placeholders = ','.join('?' * len(event_ids))
+            cursor = conn.execute(
+                'SELECT p.purchase_id, e.event_name, substr(e.gregorian_date, 1, 10), b.name, b.barcode_id, i.name, '
+                'i.barcode_id, p.quantity, p.total_price, p.timestamp_us, p.is_manual_entry, p.manual_entry_notes '
+                'FROM purchases p JOIN events e ON e.id = p.event_id JOIN buyers b ON b.id = p.buyer_id '
+                f'JOIN items i ON i.id = p.item_id WHERE p.event_id IN ({placeholders}) '
+                'ORDER BY e.gregorian_date, e.id, p.timestamp_us, p.id', tuple(event_ids)
+            )
+            while True:
+                batch = cursor.fetchmany(ARCHIVE_BATCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row[:9] + (_from_us(row[9]), bool(row[10]), row[11])
+        finally:
+            conn.close()
+
+
+_STATEMENT_ROWS_SQL = (
+    'SELECT p.buyer_id, b.name, b.barcode_id, substr(e.gregorian_date, 1, 10), e.event_name, i.name, '
+    'p.total_price, p.timestamp_us FROM purchases p JOIN events e ON e.id = p.event_id '
+    'JOIN buyers b ON b.id = p.buyer_id JOIN items i ON i.id = p.item_id WHERE p.event_id IN ({events}) '
+    'AND p.buyer_id {merged} (SELECT value FROM json_each(?)) ORDER BY p.buyer_id, e.gregorian_date, p.timestamp_us, p.id'
+)
+
+
+def _statement_key(row):
+    return row[0], row[3], row[7] or datetime.min
+
+
+def _statement_rows(path: str, event_ids, merged: dict, moved: bool = False):
+    """
+    A file's statement rows in buyer order: those of buyers not merged since,
+    or (moved=True) those of merged buyers under the buyer they were merged into.
+    """
+    conn = _open_readonly(path)
+    try:
+        placeholders = ','.join('?' * len(event_ids))
+        cursor = conn.execute(_STATEMENT_ROWS_SQL.format(events=placeholders, merged='IN' if moved else 'NOT IN'),
+                              tuple(event_ids) + (json.dumps(list(merged)), ))
+        while True:
+            batch = cursor.fetchmany(ARCHIVE_BATCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                yield (merged[row[0]] if moved else row[:3]) + row[3:7] + (_from_us(row[7]),)
+    finally:
+        conn.close()
+
+
+def archived_statement_rows(event_ids):
+    """
+    Yields statement rows (see statement_utils) for archived purchases of
+    the given events, ordered by buyer id, event date and time across all
+    archive files. Purchases of merged buyers come under the kept buyer; they
+    are few, so they are read apart and sorted into place.
+    """
+    event_ids = set(event_ids)
+    if not event_ids:
+        return iter(())
+    merged = _merged_buyers()
+    streams = []
+    for path in _archive_paths(event_ids):
+        streams.append(_statement_rows(path, event_ids, merged))
+        if merged:
+            streams.append(sorted(_statement_rows(path, event_ids, merged, moved=True), key=_statement_key))
+    return heapq.merge(*streams, key=_statement_key)
+
+
+def has_archived_purchases(buyer_id: int = None, item_id: int = None) -> bool:
+    """True when a buyer/item appears in any archived year (used to block deletion)."""
+    return archived_totals(buyer_id=buyer_id, item_id=item_id)[0] > 0
+
+
+def delete_archived_event_totals(event_id: int) -> set:
+    """
+    Removes an event's archived aggregates and takes them off its year's
+    archive summary (the caller commits). Returns the ids of the buyers whose
+    archived totals were removed, for the caller to refresh their balances.
+    """
+    removed = db.session.execute(
+        select(ArchivedBuyerTotal.hebrew_year, ArchivedBuyerTotal.buyer_id,
+               ArchivedBuyerTotal.purchase_count, ArchivedBuyerTotal.total)
+        .where(ArchivedBuyerTotal.event_id == event_id)
+    ).tuples().all()
+    per_year = {}
+    for hebrew_year, _, count, total in removed:
+        year_count, year_total = per_year.get(hebrew_year, (0, 0.0))
+        per_year[hebrew_year] = (year_count + count, year_total + total)
+    for hebrew_year, (count, total) in per_year.items():
+        db.session.execute(
+            update(PurchaseArchive).where(PurchaseArchive.hebrew_year == hebrew_year).values(
+                purchase_count=PurchaseArchive.purchase_count - count,
+                total_amount=PurchaseArchive.total_amount - total,
+            )
+        )
+    db.session.execute(delete(ArchivedBuyerTotal).where(ArchivedBuyerTotal.event_id == event_id))
+    db.session.execute(delete(ArchivedItemTotal).where(ArchivedItemTotal.event_id == event_id))
+    return {buyer_id for _, buyer_id, _, _ in removed}
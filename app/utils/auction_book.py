@@ -0,0 +1,412 @@
+# file: app/utils/auction_book.py
+# Live auctions of unique items (aliyot, Maftir Yonah...). Each open lot has an
+# in-memory bid book: the high bid, the bidder and the latest bids. A bid is
+# checked and accepted under one lock without touching the database, so a
+# burst of bids from several gabbaim is answered at once. A background thread
+# writes accepted bids to auction_bids every AUCTION_FLUSH_MS and keeps the
+# lot's high bid current; display screens follow the board through a version
+# counter (see auction.stream). Closing a lot writes its remaining bids, the
+# winning Purchase and the lot's status in one transaction.
+#
+# The books live in the worker process, so an event's auction must be run by
+# one worker process (threads are fine). After a restart the books are rebuilt
+# from the database; bids not yet flushed (at most AUCTION_FLUSH_MS old) are lost.
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, event, insert, select, update
+from app import db
+from app.models import AuctionBid, AuctionLot, Buyer, BuyerAlias, Item, Purchase
+from app.utils.db_utils import retry_on_busy
+
+logger = logging.getLogger(__name__)
+
+# Latest bids kept per book (and shown on the screens)
+HISTORY_SIZE = 20
+
+_lots, _bids, _buyers, _aliases, _items, _purchases = (
+    AuctionLot.__table__, AuctionBid.__table__, Buyer.__table__, BuyerAlias.__table__, Item.__table__,
+    Purchase.__table__
+)
+
+_LOTS_OF_EVENT = select(
+    _lots.c.id, _lots.c.item_id, _items.c.name, _lots.c.status, _lots.c.opened_at, _lots.c.closed_at
+).join(_items, _items.c.id == _lots.c.item_id)\
+ .where(_lots.c.event_id == bindparam('event_id')).order_by(_lots.c.id)
+
+_BIDS_OF_EVENT = select(_bids.c.lot_id, _bids.c.amount, _bids.c.buyer_id, _buyers.c.name, _bids.c.placed_at)\
+    .join(_lots, _lots.c.id == _bids.c.lot_id)\
+    .join(_buyers, _buyers.c.id == _bids.c.buyer_id)\
+    .where(_lots.c.event_id == bindparam('event_id'))\
+    .order_by(_bids.c.lot_id, _bids.c.amount, _bids.c.id)
+
+_EVENT_OF_LOT = select(_lots.c.event_id).where(_lots.c.id == bindparam('lot_id'))
+
+# Also the barcodes of buyers merged into another one (see buyer_merge)
+_BUYER_BY_BARCODE = select(_buyers.c.id, _buyers.c.name).where(_buyers.c.barcode_id == bindparam('barcode'))\
+    .union_all(select(_buyers.c.id, _buyers.c.name)
+               .join(_aliases, _aliases.c.buyer_id == _buyers.c.id)
+               .where(_aliases.c.barcode_id == bindparam('barcode')))\
+    .limit(1)
+
+_ITEM_BY_ID = select(_items.c.name, _items.c.is_unique).where(_items.c.id == bindparam('item_id'))
+
+_ITEM_SOLD_AT_EVENT = select(_buyers.c.name)\
+    .select_from(_purchases.join(_buyers, _buyers.c.id == _purchases.c.buyer_id))\
+    .where(_purchases.c.event_id == bindparam('event_id'), _purchases.c.item_id == bindparam('item_id'))\
+    .limit(1)
+
+_INSERT_BIDS = insert(_bids)
+
+_UPDATE_HIGH_BID = update(_lots)\
+    .where(_lots.c.id == bindparam('lot'), _lots.c.status == 'open')\
+    .values(high_bid=bindparam('high_bid'), high_bidder_id=bindparam('high_bidder_id'))
+
+
+class AuctionError(Exception):
+    """Raised when a bid or lot action is refused. lot is the lot's current snapshot, if any."""
+
+    def __init__(self, message, lot=None):
+        super().__init__(message)
+        self.lot = lot
+
+
+class BidBook:
+    """One lot: its status, high bid and latest bids, plus the bids not yet written."""
+    __slots__ = ('lot_id', 'event_id', 'item_id', 'item_name', 'status', 'opened_at', 'closed_at',
+                 'high_bid', 'high_bidder_id', 'high_bidder', 'bid_count', 'history', 'pending')
+
+    def __init__(self, lot_id, event_id, item_id, item_name, status='open', opened_at=None, closed_at=None):
+        self.lot_id, self.event_id, self.item_id, self.item_name = lot_id, event_id, item_id, item_name
+        self.status, self.opened_at, self.closed_at = status, opened_at, closed_at
+        self.high_bid = self.high_bidder_id = self.high_bidder = None
+        self.bid_count = 0
+        self.history = deque(maxlen=HISTORY_SIZE) # (amount, buyer name, placed_at), oldest first
+        self.pending = [] # Rows for auction_bids
+
+    def record(self, amount, buyer_id, buyer_name, placed_at):
+        self.high_bid, self.high_bidder_id, self.high_bidder = amount, buyer_id, buyer_name
+        self.bid_count += 1
+        self.history.append((amount, buyer_name, placed_at))
+
+    def snapshot(self) -> dict:
+        return {
+            'id': self.lot_id, 'item_id': self.item_id, 'item_name': self.item_name, 'status': self.status,
+            'high_bid': self.high_bid, 'high_bidder': self.high_bidder, 'bid_count': self.bid_count,
+            'bids': [{'amount': amount, 'buyer': name, 'at': at.isoformat(timespec='seconds') + 'Z'}
+                     for amount, name, at in reversed(self.history)], # Newest first
+            'opened_at': self.opened_at.isoformat(timespec='seconds') + 'Z' if self.opened_at else None,
+            'closed_at': self.closed_at.isoformat(timespec='seconds') + 'Z' if self.closed_at else None,
+        }
+
+
+class _Board:
+    """The lots of one event; version changes whenever a screen should redraw."""
+    __slots__ = ('event_id', 'lots', 'version')
+
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.lots = {} # lot_id -> BidBook, in opening order
+        self.version = 1
+
+
+# One lock for all books; its condition wakes the screens' streams and the flusher
+_cond = threading.Condition()
+_boards = {} # event_id -> _Board
+_lot_events = {} # lot_id -> event_id
+_buyer_names = {} # barcode -> (buyer_id, name)
+# Held while bids are written, so a closing lot waits for a flush in progress
+_flush_lock = threading.Lock()
+_flusher = None
+
+
+# --- Loading ---
+
+def board(event_id: int) -> _Board:
+    """The event's board, loaded from the database on first use in this process."""
+    with _cond:
+        loaded = _boards.get(event_id)
+    if loaded:
+        return loaded
+    conn = db.session.connection()
+    new = _Board(event_id)
+    for lot_id, item_id, item_name, status, opened_at, closed_at in conn.execute(_LOTS_OF_EVENT, {'event_id': event_id}):
+        new.lots[lot_id] = BidBook(lot_id, event_id, item_id, item_name, status, opened_at, closed_at)
+    for lot_id, amount, buyer_id, name, placed_at in conn.execute(_BIDS_OF_EVENT, {'event_id': event_id}):
+        new.lots[lot_id].record(amount, buyer_id, name, placed_at)
+    with _cond:
+        # Another request may have loaded it meanwhile; keep the first (it may hold new bids)
+        loaded = _boards.setdefault(event_id, new)
+        for lot_id in loaded.lots:
+            _lot_events[lot_id] = event_id
+    return loaded
+
+
+def _book(lot_id: int) -> BidBook:
+    event_id = _lot_events.get(lot_id)
+    if event_id is None:
+        event_id = db.session.connection().execute(_EVENT_OF_LOT, {'lot_id': lot_id}).scalar()
+        if event_id is None:
+            raise AuctionError(f'Lot {lot_id} not found.')
+    book = board(event_id).lots.get(lot_id)
+    if book is None:
+        raise AuctionError(f'Lot {lot_id} was opened by another server process; run auctions from one process.')
+    return book
+
+
+def _buyer(barcode: str):
+    """(buyer_id, name) for a buyer barcode ('B1001' or 'BUYER:B1001'); cached, so repeat bidders cost no query."""
+    barcode = barcode.strip()
+    if barcode.upper().startswith('BUYER:'):
+        barcode = barcode.split(':', 1)[1]
+    found = _buyer_names.get(barcode)
+    if found is None:
+        found = db.session.connection().execute(_BUYER_BY_BARCODE, {'barcode': barcode}).first()
+        if found is None:
+            raise AuctionError(f"Unknown buyer barcode: '{barcode}'.")
+        _buyer_names[barcode] = found = tuple(found)
+    return found
+
+
+@event.listens_for(Buyer, 'after_update')
+@event.listens_for(Buyer, 'after_delete')
+def _forget_buyers(mapper, connection, target):
+    """A renamed, re-barcoded or deleted buyer drops the cached names."""
+    _buyer_names.clear()
+
+
+def _snapshot(book: BidBook) -> dict:
+    """The book's snapshot with its board's version, so a screen can drop answers older than what it shows (lock held)."""
+    event_board = _boards.get(book.event_id) # None once the event was deleted
+    return dict(book.snapshot(), version=event_board.version if event_board else None)
+
+
+def _changed(event_id: int):
+    """Marks the board as changed and wakes its streams (lock held)."""
+    event_board = _boards.get(event_id)
+    if event_board is not None:
+        event_board.version += 1
+    _cond.notify_all()
+
+
+# --- Bidding ---
+
+def place_bid(lot_id: int, buyer_barcode: str, amount: float, user_id: int = None) -> dict:
+    """
+    Accepts a bid if it beats the high bid by at least AUCTION_MIN_INCREMENT and
+    returns the lot's snapshot. Raises AuctionError (with the snapshot) when the
+    lot isn't open or the bid is too low, e.g. after another gabbai's bid.
+    """
+    if not amount or amount <= 0:
+        raise AuctionError('Bid must be a positive amount.')
+    book = _book(lot_id)
+    buyer_id, buyer_name = _buyer(buyer_barcode)
+    increment = current_app.config.get('AUCTION_MIN_INCREMENT', 1)
+    with _cond:
+        if book.status != 'open':
+            raise AuctionError(f'Lot for {book.item_name} is {book.status}.', _snapshot(book))
+        if book.high_bid is not None and amount < book.high_bid + increment:
+            raise AuctionError(f'Bid too low: the high bid is {book.high_bid:g} by {book.high_bidder} '
+                               f'(minimum increment {increment:g}).', _snapshot(book))
+        placed_at = datetime.utcnow()
+        book.record(amount, buyer_id, buyer_name, placed_at)
+        book.pending.append({'lot_id': lot_id, 'buyer_id': buyer_id, 'amount': amount,
+                             'placed_at': placed_at, 'user_id': user_id})
+        _changed(book.event_id)
+        snapshot = _snapshot(book)
+    _start_flusher(current_app._get_current_object())
+    return snapshot
+
+
+# --- Opening and closing lots ---
+
+@retry_on_busy
+def _insert_lot(event_id: int, item_id: int) -> tuple:
+    lot = AuctionLot(event_id=event_id, item_id=item_id, status='open')
+    db.session.add(lot)
+    db.session.commit()
+    return lot.id, lot.opened_at
+
+
+def open_lot(event_id: int, item_id: int) -> dict:
+    """Opens bidding on a unique item that isn't sold at the event and has no open lot."""
+    conn = db.session.connection()
+    item = conn.execute(_ITEM_BY_ID, {'item_id': item_id}).first()
+    if item is None:
+        raise AuctionError(f'Item {item_id} not found.')
+    item_name, is_unique = item
+    if not is_unique:
+        raise AuctionError(f"'{item_name}' is not a unique item; only unique items are auctioned.")
+    owner = conn.execute(_ITEM_SOLD_AT_EVENT, {'event_id': event_id, 'item_id': item_id}).scalar()
+    if owner:
+        raise AuctionError(f"'{item_name}' is already sold to {owner} at this event.")
+    event_board = board(event_id)
+    with _cond:
+        if any(b.item_id == item_id and b.status in ('open', 'closing') for b in event_board.lots.values()):
+            raise AuctionError(f"'{item_name}' is already being auctioned.")
+    lot_id, opened_at = _insert_lot(event_id, item_id)
+    with _cond:
+        book = event_board.lots[lot_id] = BidBook(lot_id, event_id, item_id, item_name, 'open', opened_at)
+        _lot_events[lot_id] = event_id
+        _changed(event_id)
+        return _snapshot(book)
+
+
+@retry_on_busy
+def _write_close(book: BidBook, bids: list, sell: bool, user_id=None):
+    """The closing transaction: remaining bids, the winning purchase, the lot's status (only if still open)."""
+    conn = db.session.connection()
+    if bids:
+        conn.execute(_INSERT_BIDS, bids)
+    now = datetime.utcnow()
+    values = {'status': 'cancelled', 'closed_at': now,
+              'high_bid': book.high_bid, 'high_bidder_id': book.high_bidder_id}
+    if sell:
+        owner = conn.execute(_ITEM_SOLD_AT_EVENT, {'event_id': book.event_id, 'item_id': book.item_id}).scalar()
+        if owner:
+            db.session.rollback()
+            raise AuctionError(f"'{book.item_name}' was sold to {owner} meanwhile. Cancel the lot.")
+        values['status'] = 'sold'
+        values['purchase_id'] = conn.execute(insert(_purchases).values(
+            event_id=book.event_id, buyer_id=book.high_bidder_id, item_id=book.item_id, quantity=1,
+            total_price=book.high_bid, timestamp=now, is_manual_entry=False,
+            manual_entry_notes=f'Auction lot {book.lot_id}')).inserted_primary_key[0]
+    result = conn.execute(update(_lots).where(_lots.c.id == book.lot_id, _lots.c.status == 'open').values(**values))
+    if result.rowcount != 1:
+        db.session.rollback()
+        raise AuctionError(f'Lot {book.lot_id} was already closed.')
+    db.session.commit()
+    return values['status'], now
+
+
+def close_lot(lot_id: int, sell: bool = True) -> dict:
+    """
+    Ends bidding. With sell, the high bidder buys the item at the high bid; a lot
+    without bids, or with sell=False, is cancelled. Bids arriving while the lot
+    closes are refused; if the transaction fails the lot is open again.
+    """
+    book = _book(lot_id)
+    with _flush_lock:
+        with _cond:
+            if book.status != 'open':
+                raise AuctionError(f'Lot for {book.item_name} is {book.status}.', _snapshot(book))
+            book.status = 'closing'
+            bids, book.pending = book.pending, []
+            _changed(book.event_id)
+        try:
+            status, closed_at = _write_close(book, bids, sell and book.high_bid is not None)
+        except Exception:
+            with _cond:
+                book.status = 'open'
+                book.pending[:0] = bids
+                _changed(book.event_id)
+            raise
+    with _cond:
+        book.status, book.closed_at = status, closed_at
+        _changed(book.event_id)
+        return _snapshot(book)
+
+
+# --- Background writes ---
+
+@retry_on_busy
+def _write_bids(bids: list, highs: list):
+    conn = db.session.connection()
+    conn.execute(_INSERT_BIDS, bids)
+    conn.execute(_UPDATE_HIGH_BID, highs)
+    db.session.commit()
+
+
+def flush() -> int:
+    """Writes the accepted bids of all books in one transaction; returns how many were written."""
+    with _flush_lock:
+        with _cond:
+            taken = [(book, book.pending) for b in _boards.values() for book in b.lots.values() if book.pending]
+            for book, _ in taken:
+                book.pending = []
+            highs = [{'lot': book.lot_id, 'high_bid': book.high_bid, 'high_bidder_id': book.high_bidder_id}
+                     for book, _ in taken]
+        if not taken:
+            return 0
+        bids = [row for _, rows in taken for row in rows]
+        try:
+            _write_bids(bids, highs)
+        except Exception:
+            with _cond:
+                for book, rows in taken:
+                    book.pending[:0] = rows
+            raise
+        return len(bids)
+
+
+def _flush_loop(app):
+    interval = app.config.get('AUCTION_FLUSH_MS', 250) / 1000
+    while True:
+        time.sleep(interval)
+        with _cond:
+            if not any(book.pending for b in _boards.values() for book in b.lots.values()):
+                continue
+        try:
+            with app.app_context():
+                flush()
+        except Exception:
+            logger.exception('Writing auction bids failed; retrying on the next flush.')
+
+
+def _start_flusher(app):
+    global _flusher
+    if _flusher is not None:
+        return
+    with _cond:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, args=(app,), name='auction-flusher', daemon=True)
+            _flusher.start()
+
+
+def forget_event(event_id: int):
+    """Drops a deleted event's board; open screens redraw (and find no lots)."""
+    with _cond:
+        event_board = _boards.pop(event_id, None)
+        if event_board is None:
+            return
+        for lot_id in event_board.lots:
+            _lot_events.pop(lot_id, None)
+        event_board.version += 1
+        _cond.notify_all()
+
+
+# --- Screens ---
+
+def board_snapshot(event_id: int) -> dict:
+    event_board = board(event_id)
+    with _cond:
+        return _board_snapshot(event_board)
+
+
+def loaded_snapshot(event_id: int):
+    """The board's snapshot if it is loaded, None once the event was deleted; never touches the database."""
+    with _cond:
+        event_board = _boards.get(event_id)
+        return _board_snapshot(event_board) if event_board is not None else None
+
+
+def _board_snapshot(event_board: _Board) -> dict:
+    """(lock held)"""
+    return {'event_id': event_board.event_id, 'version': event_board.version,
+            'lots': [_snapshot(book) for book in reversed(event_board.lots.values())]} # Newest lot first
+
+
+def wait_for_change(event_id: int, version: int, timeout: float):
+    """
+    Blocks until the board's version differs from version (True) or timeout
+    passes (False). None when the board is gone (the event was deleted).
+    """
+    with _cond:
+        event_board = _boards.get(event_id)
+        if event_board is None:
+            return None
+        changed = _cond.wait_for(lambda: event_board.version != version, timeout)
+        return None if _boards.get(event_id) is not event_board else changed
@@ -0,0 +1,377 @@
+# file: app/utils/bank_import.py
+# Bank statement import (CSV or XLSX) into the payments ledger. The statement
+# is read into lines, then every line is matched in one pass against lookup
+# tables loaded with a handful of IN (...) queries, never a query per line:
+#   1. credits only: debits and zero lines are ignored;
+#   2. a line already imported (same fingerprint) is a duplicate;
+#   3. a buyer barcode (B1001) in the reference, description or payer name;
+#   4. a payer name seen on earlier payments (a resolved review line teaches
+#      the importer the name);
+#   5. the payer's normalized name (app/utils/name_keys.py) equal to a
+#      buyer's, or else a buyer's name within a few consecutive words of it.
+# The first of rules 3-5 that finds buyers decides. One buyer is recorded as a
+# payment, paying the buyer's oldest open pledge of exactly that amount if
+# there is one. Lines with several candidates, or none, go to the review
+# queue, with the buyers who have an open pledge of that amount suggested
+# when nothing else is known.
+import csv
+import hashlib
+import io
+import os
+import re
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime
+from sqlalchemy import insert, select, update
+from app import db
+from app.models import BankImport, BankImportLine, Buyer, BuyerAlias, Payment
+from app.utils.db_utils import retry_on_busy
+from app.utils.name_keys import fill_missing_name_keys, name_tokens
+from app.utils.payment_utils import chunks, open_pledges, pick_pledge, refresh_balances, EPSILON
+
+# Statement lines per import
+MAX_LINES = 50000
+# Rows searched for the header row (bank exports start with account details)
+HEADER_SCAN_ROWS = 20
+# Longest run of consecutive words tried as a name (rule 5)
+NAME_WINDOW = 3
+# Suggested buyers per review line
+MAX_CANDIDATES = 5
+
+StatementLine = namedtuple('StatementLine', ['line_no', 'paid_on', 'amount', 'payer_name', 'reference', 'description'])
+
+# Header names (lower case) per field, English and the Hebrew used by Israeli banks
+HEADER_ALIASES = {
+    'paid_on': ('date', 'value date', 'transaction date', 'תאריך', 'תאריך ערך', 'תאריך התנועה', 'יום ערך'),
+    'amount': ('amount', 'sum', 'סכום', 'סכום התנועה', 'סכום בש"ח', 'סכום בשח'),
+    'credit': ('credit', 'זכות', 'בזכות', 'סכום זכות'),
+    'debit': ('debit', 'חובה', 'בחובה', 'סכום חובה'),
+    'reference': ('reference', 'ref', 'ref.', 'אסמכתא', 'אסמכתה', 'מספר אסמכתא', 'אסמכתא בנק'),
+    'payer_name': ('name', 'payer', 'payer name', 'from', 'שם', 'שם המעביר', 'שם משלם', 'שם המשלם', 'מאת', 'שם החשבון'),
+    'description': ('description', 'details', 'memo', 'תיאור', 'תיאור התנועה', 'פרטים', 'הערות', 'פרטי התנועה', 'סוג תנועה'),
+}
+_HEADER_FIELDS = {alias: field for field, aliases in HEADER_ALIASES.items() for alias in aliases}
+DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%y', '%d.%m.%Y', '%d.%m.%y', '%d-%m-%Y', '%Y-%m-%d', '%Y/%m/%d')
+# Words of a transfer description that aren't part of the payer's name
+TRANSFER_WORDS = frozenset({
+    'העברה', 'העב', 'העברת', 'מאת', 'זיכוי', 'בנקאית', 'הפקדה', 'תשלום', 'מבנק', 'בנק', 'ב', 'מ', 'ל',
+    'transfer', 'from', 'credit', 'payment', 'deposit', 'bank', 'to',
+})
+_BARCODE = re.compile(r'(?<![A-Za-z0-9])[Bb]\d{3,}(?![A-Za-z0-9])')
+
+_buyers, _aliases, _payments, _imports, _lines = (
+    Buyer.__table__, BuyerAlias.__table__, Payment.__table__, BankImport.__table__, BankImportLine.__table__
+)
+
+
+class BankImportError(Exception):
+    """Raised when a statement file can't be read."""
+
+
+# --- Reading ---
+
+def _cell_text(value) -> str:
+    return '' if value is None else str(value).strip()
+
+
+def _parse_amount(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace('₪', '').replace(',', '').replace(' ', '').replace('\u200f', '') # RTL marks in Hebrew exports
+    negative = text.startswith('(') and text.endswith(')') or text.endswith('-')
+    text = text.strip('()-') if negative else text
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _cell_text(value)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _csv_rows(data: bytes) -> list:
+    for encoding in ('utf-8-sig', 'cp1255'): # Hebrew Excel saves CSV as Windows-1255
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise BankImportError('The CSV file is neither UTF-8 nor Windows-1255 encoded.')
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(io.StringIO(text), dialect))
+
+
+def _xlsx_rows(data: bytes) -> list:
+    # openpyxl is imported on first import rather than at worker startup
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception as e:
+        raise BankImportError(f'The Excel file could not be read: {e}') from None
+    try:
+        return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+def _find_header(rows: list):
+    """(index of the header row, {field: column}) - the first row naming a date and an amount column."""
+    for index, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        columns = {}
+        for column, cell in enumerate(row):
+            field = _HEADER_FIELDS.get(' '.join(_cell_text(cell).strip(':').lower().split()))
+            if field and field not in columns:
+                columns[field] = column
+        if 'paid_on' in columns and ({'amount', 'credit'} & columns.keys()):
+            return index, columns
+    raise BankImportError('No header row with a date and an amount (or credit) column was found.')
+
+
+def read_statement(filename: str, data: bytes):
+    """(lines, skipped): the statement's dated lines with an amount, and how many other rows were skipped."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        rows = _xlsx_rows(data)
+    elif extension in ('.csv', '.txt'):
+        rows = _csv_rows(data)
+    else:
+        raise BankImportError(f"Unsupported file type '{extension}'. Upload a CSV or XLSX bank statement.")
+    header, columns = _find_header(rows)
+
+    def cell(row, field):
+        column = columns.get(field)
+        return row[column] if column is not None and column < len(row) else None
+
+    lines, skipped = [], 0
+    for line_no, row in enumerate(rows[header + 1:], start=header + 2):
+        if not any(_cell_text(value) for value in row):
+            continue
+        paid_on = _parse_date(cell(row, 'paid_on'))
+        if 'credit' in columns:
+            credit, debit = _parse_amount(cell(row, 'credit')), _parse_amount(cell(row, 'debit'))
+            amount = None if credit is None and debit is None else (credit or 0.0) - abs(debit or 0.0)
+        else:
+            amount = _parse_amount(cell(row, 'amount'))
+        if paid_on is None or amount is None: # Totals, balances carried forward, notes
+            skipped += 1
+            continue
+        lines.append(StatementLine(
+            line_no, paid_on, round(amount, 2), _cell_text(cell(row, 'payer_name'))[:200],
+            _cell_text(cell(row, 'reference'))[:100], _cell_text(cell(row, 'description'))[:300]))
+        if len(lines) > MAX_LINES:
+            raise BankImportError(f'The statement has more than {MAX_LINES} lines; split it into smaller files.')
+    return lines, skipped
+
+
+# --- Matching ---
+
+def payer_tokens(line: StatementLine) -> list:
+    """The words of the payer's name: the payer column, or the description without transfer words and numbers."""
+    tokens = name_tokens(line.payer_name or line.description)
+    return [token for token in tokens if token not in TRANSFER_WORDS and not token.isdigit()]
+
+
+def payer_key(line: StatementLine):
+    tokens = payer_tokens(line)
+    return ' '.join(sorted(tokens)) if tokens else None
+
+
+def _fingerprints(lines: list) -> list:
+    """Identity of each line: its fields plus its occurrence number, so identical transfers stay apart."""
+    seen = Counter()
+    result = []
+    for line in lines:
+        base = f'{line.paid_on.isoformat()}|{line.amount:.2f}|{line.reference}|{line.payer_name}|{line.description}'
+        seen[base] += 1
+        result.append(hashlib.sha1(f'{base}|{seen[base]}'.encode('utf-8')).hexdigest())
+    return result
+
+
+def _windows(tokens: list) -> list:
+    """Sorted keys of runs of 2..NAME_WINDOW consecutive words, longest first."""
+    return [' '.join(sorted(tokens[start:start + size]))
+            for size in range(min(NAME_WINDOW, len(tokens) - 1), 1, -1)
+            for start in range(len(tokens) - size + 1)]
+
+
+def _lookup(conn, column, key_column, values) -> dict:
+    """{value: set of buyer ids} for values of an indexed column, in chunked IN (...) queries."""
+    found = defaultdict(set)
+    for chunk in chunks(values):
+        for value, buyer_id in conn.execute(select(column, key_column).where(column.in_(chunk)).distinct()):
+            found[value].add(buyer_id)
+    return found
+
+
+def match_lines(conn, lines: list) -> list:
+    """
+    One dict per line: its fields plus fingerprint, status (matched, review,
+    duplicate, ignored), match_rule, candidates and buyer_id.
+    """
+    fingerprints = _fingerprints(lines)
+    keys = [payer_key(line) for line in lines]
+    token_lists = [payer_tokens(line) for line in lines]
+    codes = [sorted({code.upper() for code in _BARCODE.findall(f'{line.reference} {line.description} {line.payer_name}')})
+             for line in lines]
+
+    # --- Lookup tables, one IN (...) query per chunk of distinct values ---
+    imported = set()
+    for chunk in chunks(fingerprints):
+        imported.update(conn.execute(select(_lines.c.fingerprint).where(
+            _lines.c.fingerprint.in_(chunk), _lines.c.status != 'duplicate')).scalars())
+    code_values = {code for line_codes in codes for code in line_codes}
+    by_code = _lookup(conn, _buyers.c.barcode_id, _buyers.c.id, code_values)
+    # Barcodes of merged buyers (see buyer_merge) are their kept buyer's
+    for code, buyer_ids in _lookup(conn, _aliases.c.barcode_id, _aliases.c.buyer_id, code_values).items():
+        by_code[code] |= buyer_ids
+    name_values = {key for key in keys if key} | {window for tokens in token_lists for window in _windows(tokens)}
+    by_name = _lookup(conn, _buyers.c.name_key, _buyers.c.id, name_values)
+    by_payer = _lookup(conn, _payments.c.payer_key, _payments.c.buyer_id, {key for key in keys if key})
+
+    results = []
+    for line, fingerprint, key, tokens, line_codes in zip(lines, fingerprints, keys, token_lists, codes):
+        result = dict(line._asdict(), fingerprint=fingerprint, payer_key=key,
+                      status='review', match_rule=None, candidates=None, buyer_id=None)
+        results.append(result)
+        if line.amount <= EPSILON:
+            result['status'] = 'ignored'
+            continue
+        if fingerprint in imported:
+            result['status'] = 'duplicate'
+            continue
+        imported.add(fingerprint)
+        for rule, buyers in (
+                ('reference', set().union(*(by_code.get(code, ()) for code in line_codes))),
+                ('history', by_payer.get(key, set())),
+                ('name', by_name.get(key, set())),
+                ('name', next((by_name[window] for window in _windows(tokens) if window in by_name), set()))):
+            if buyers:
+                result['match_rule'] = rule
+                if len(buyers) == 1:
+                    result.update(status='matched', buyer_id=next(iter(buyers)))
+                else:
+                    result['candidates'] = sorted(buyers)[:MAX_CANDIDATES]
+                break
+
+    # Review lines without a lead: suggest the buyers with an open pledge of exactly that amount
+    unknown = [result for result in results if result['status'] == 'review' and not result['match_rule']]
+    if unknown:
+        by_amount = defaultdict(set)
+        for _, buyer_id, outstanding in open_pledges(conn, amounts={result['amount'] for result in unknown}):
+            by_amount[round(outstanding, 2)].add(buyer_id)
+        for result in unknown:
+            buyers = by_amount.get(result['amount'])
+            if buyers and len(buyers) <= MAX_CANDIDATES:
+                result.update(match_rule='amount', candidates=sorted(buyers))
+    return results
+
+
+# --- Importing ---
+
+def _payment_row(result: dict, purchase_id, import_id, user_id, now) -> dict:
+    return {
+        'buyer_id': result['buyer_id'], 'purchase_id': purchase_id, 'amount': result['amount'],
+        'paid_on': result['paid_on'], 'method': 'bank', 'reference': result['reference'] or None,
+        'payer_name': result['payer_name'] or result['description'] or None, 'payer_key': result['payer_key'],
+        'bank_import_id': import_id, 'fingerprint': result['fingerprint'], 'user_id': user_id, 'created_at': now,
+    }
+
+
+def _line_row(result: dict, import_id, payment_id=None) -> dict:
+    candidates = result['candidates']
+    return {
+        'import_id': import_id, 'line_no': result['line_no'], 'paid_on': result['paid_on'],
+        'amount': result['amount'], 'payer_name': result['payer_name'] or None,
+        'reference': result['reference'] or None, 'description': result['description'] or None,
+        'fingerprint': result['fingerprint'], 'status': result['status'], 'match_rule': result['match_rule'],
+        'candidates': ','.join(map(str, candidates)) if candidates else None,
+        'buyer_id': result['buyer_id'], 'payment_id': payment_id,
+    }
+
+
+@retry_on_busy
+def import_statement(filename: str, lines: list, user_id: int = None) -> int:
+    """Matches and records a statement's lines in one transaction; returns the BankImport id."""
+    conn = db.session.connection()
+    fill_missing_name_keys(conn)
+    results = match_lines(conn, lines)
+    counts = Counter(result['status'] for result in results)
+    now = datetime.utcnow()
+    import_id = conn.execute(insert(_imports).values(
+        filename=filename[:255], imported_at=now, user_id=user_id, line_count=len(results),
+        matched_count=counts['matched'], review_count=counts['review'],
+        duplicate_count=counts['duplicate'], ignored_count=counts['ignored'])).inserted_primary_key[0]
+
+    matched = [result for result in results if result['status'] == 'matched']
+    pledges = defaultdict(list) # buyer_id -> [[purchase_id, outstanding]], oldest first
+    for purchase_id, buyer_id, outstanding in open_pledges(conn, buyer_ids={r['buyer_id'] for r in matched}):
+        pledges[buyer_id].append([purchase_id, outstanding])
+    if matched:
+        conn.execute(insert(_payments), [
+            _payment_row(result, pick_pledge(pledges[result['buyer_id']], result['amount']), import_id, user_id, now)
+            for result in matched])
+    payment_ids = dict(conn.execute(
+        select(_payments.c.fingerprint, _payments.c.id).where(_payments.c.bank_import_id == import_id)).all())
+    conn.execute(insert(_lines), [_line_row(result, import_id, payment_ids.get(result['fingerprint']))
+                                  for result in results])
+    refresh_balances(conn, {result['buyer_id'] for result in matched})
+    db.session.commit()
+    return import_id
+
+
+@retry_on_busy
+def resolve_line(line_id: int, buyer_id: int = None, user_id: int = None) -> str:
+    """
+    Settles a review line: with a buyer it becomes a payment (and teaches the
+    importer the payer's name), without one it is ignored. Returns the new status.
+    """
+    line = db.session.get(BankImportLine, line_id)
+    if line is None or line.status != 'review':
+        raise BankImportError(f'Line {line_id} is not waiting for review.')
+    conn = db.session.connection()
+    status = 'matched' if buyer_id else 'ignored'
+    values = {'status': status, 'buyer_id': buyer_id}
+    if buyer_id:
+        statement_line = StatementLine(line.line_no, line.paid_on, line.amount, line.payer_name or '',
+                                       line.reference or '', line.description or '')
+        result = dict(statement_line._asdict(), fingerprint=line.fingerprint, payer_key=payer_key(statement_line),
+                      buyer_id=buyer_id)
+        pledge_rows = [[purchase_id, outstanding] for purchase_id, _, outstanding in open_pledges(conn, buyer_ids=[buyer_id])]
+        values['payment_id'] = conn.execute(insert(_payments).values(**_payment_row(
+            result, pick_pledge(pledge_rows, line.amount), line.import_id, user_id, datetime.utcnow()))).inserted_primary_key[0]
+        values['match_rule'] = 'manual'
+        refresh_balances(conn, [buyer_id])
+    conn.execute(update(_lines).where(_lines.c.id == line_id, _lines.c.status == 'review').values(**values))
+    count_column = _imports.c.matched_count if buyer_id else _imports.c.ignored_count
+    conn.execute(update(_imports).where(_imports.c.id == line.import_id).values(
+        {count_column: count_column + 1, _imports.c.review_count: _imports.c.review_count - 1}))
+    db.session.commit()
+    return status
+
+
+def review_candidates(conn, lines) -> dict:
+    """{buyer_id: (name, barcode)} for the candidates of the given review lines, in one query."""
+    ids = {int(buyer_id) for line in lines if line.candidates for buyer_id in line.candidates.split(',')}
+    names = {}
+    for chunk in chunks(ids):
+        for buyer_id, name, barcode in conn.execute(
+                select(_buyers.c.id, _buyers.c.name, _buyers.c.barcode_id).where(_buyers.c.id.in_(chunk))):
+            names[buyer_id] = (name, barcode)
+    return names
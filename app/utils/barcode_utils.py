@@ -1,114 +1,28 @@
 # file: app/utils/barcode_utils.py
-import barcode
-# Import SVGWriter specifically
-from barcode.writer import ImageWriter, SVGWriter
-import io
-import base64
+# Facade for barcode helpers. python-barcode (and Pillow for PNG) is loaded on
+# the first barcode render (see barcode_render), not when the app starts.
 import logging
 
 from app import db
-from app.models import Buyer, Item
+from app.models import Buyer, BuyerAlias, Item
 from sqlalchemy import func, cast, Integer, String
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
-# Choose the barcode type (Code 128 is good for alphanumeric)
-BARCODE_TYPE = barcode.get_barcode_class('code128')
 
-# --- Constants for options ---
-# Adjust these values to fine-tune appearance and clarity
-# module_height is important for vertical size within the fixed CSS height
-MODULE_HEIGHT_MM = 8.0
-# quiet_zone is the blank space around the barcode (in mm)
-QUIET_ZONE_MM = 4.0
-# SVG specific options (write_text includes the human-readable text below)
-SVG_OPTIONS = {
-    'module_height': MODULE_HEIGHT_MM,
-    'quiet_zone': QUIET_ZONE_MM,
-    'write_text': True, # Include human-readable text below barcode
-    'text_distance': 3.0, # Distance between barcode and text (adjust if needed)
-    'font_size': 8,      # Font size for the text (adjust if needed)
-    # 'module_width': 0.2, # Optional: Uncomment and adjust (e.g., 0.2-0.3mm) if bars are too thin, but makes barcode wider
-}
+def _renderer():
+    from app.utils import barcode_render
+    return barcode_render
 
-# PNG specific options (less critical now but kept for reference)
-PNG_OPTIONS = {
-    'module_height': MODULE_HEIGHT_MM,
-    'quiet_zone': QUIET_ZONE_MM,
-    'write_text': True,
-    'text_distance': 3.0,
-    'font_size': 8,
-}
 
 def generate_barcode_bytes(data: str, writer_format='SVG'): # Default to SVG
     """Generates barcode image bytes (preferring SVG for clarity)."""
-    if not data:
-        return None
-    try:
-        writer_format = writer_format.upper()
-        buffer = io.BytesIO()
-
-        if writer_format == 'SVG':
-            writer = SVGWriter()
-            options = SVG_OPTIONS.copy() # Use a copy to avoid modification issues
-            # Instantiate the barcode object and write to buffer
-            bc = BARCODE_TYPE(data, writer=writer)
-            bc.write(buffer, options=options) # Pass SVG specific options
-            logger.debug(f"Generated SVG barcode for '{data}'")
-
-        elif writer_format == 'PNG':
-             # Ensure Pillow is installed for ImageWriter
-             try:
-                 from PIL import Image # Pillow import check
-                 writer = ImageWriter(format='PNG')
-                 options = PNG_OPTIONS.copy()
-                 bc = BARCODE_TYPE(data, writer=writer)
-                 bc.write(buffer, options=options) # Pass PNG specific options
-                 logger.debug(f"Generated PNG barcode for '{data}'")
-             except ImportError:
-                  logger.error("Pillow library not found. PNG barcode generation requires Pillow. Please install it: pip install Pillow")
-                  return None
-        else:
-             logger.error(f"Unsupported barcode writer format: {writer_format}")
-             return None
-
-        buffer.seek(0)
-        return buffer.read()
-
-    except Exception as e:
-        logger.error(f"Error generating barcode bytes for '{data}' (Format: {writer_format}): {e}", exc_info=True)
-        return None
+    return _renderer().generate_barcode_bytes(data, writer_format=writer_format)
 
 def generate_barcode_uri(data: str, format='svg'): # Default to SVG
     """Generates a Base64 Data URI for embedding in HTML (preferring SVG)."""
-    # Ensure format is lowercase for checks
-    format = format.lower()
-    # Determine writer format based on desired output format
-    writer_format = 'SVG' if format == 'svg' else 'PNG'
-
-    img_bytes = generate_barcode_bytes(data, writer_format=writer_format)
-
-    if img_bytes:
-        encoded = base64.b64encode(img_bytes).decode('utf-8')
-        if format == 'svg':
-             mime_type = 'image/svg+xml'
-             # SVGs generated by the library might not have XML declaration, add it for robustness
-             # Also, ensure UTF-8 encoding is declared within the SVG string for the data URI
-             # Decode bytes back to string to prepend XML declaration
-             svg_string = img_bytes.decode('utf-8')
-             # Basic check if XML declaration is already present
-             if not svg_string.strip().startswith('<?xml'):
-                 svg_string = '<?xml version="1.0" encoding="UTF-8"?>\n' + svg_string
-             # Re-encode for base64
-             encoded = base64.b64encode(svg_string.encode('utf-8')).decode('utf-8')
-             return f"data:{mime_type};base64,{encoded}"
-        else: # PNG
-             mime_type = 'image/png'
-             return f"data:{mime_type};base64,{encoded}"
-    else:
-         logger.warning(f"Failed to generate barcode bytes for URI (Format: {format}, Data: '{data}')")
-         return None
+    return _renderer().generate_barcode_uri(data, format=format)
 
 
 # --- generate_next_barcode_id function remains unchanged ---
@@ -126,27 +40,31 @@ def generate_next_barcode_id(prefix: str, starting_num: int = 1000) -> str | Non
         logger.error("Prefix cannot be empty for barcode generation.")
         return None
 
-    model_class = None
+    barcode_columns = None
     if prefix.upper() == 'B':
-        model_class = Buyer
+        # Barcodes of merged buyers still scan (see buyer_merge), so they are not handed out again
+        barcode_columns = (Buyer.barcode_id, BuyerAlias.barcode_id)
     elif prefix.upper() == 'I':
-        model_class = Item
+        barcode_columns = (Item.barcode_id, )
     else:
         logger.error(f"Unknown prefix '{prefix}' for barcode generation.")
         return None
 
     try:
         prefix_len = len(prefix)
-        max_num_query = db.session.query(
-            func.max(
-                cast(
-                    func.substr(model_class.barcode_id, prefix_len + 1),
-                    Integer
+        max_nums = [
+            db.session.query(
+                func.max(
+                    cast(
+                        func.substr(barcode_column, prefix_len + 1),
+                        Integer
+                    )
                 )
-            )
-        ).filter(model_class.barcode_id.like(f"{prefix}%"))
+            ).filter(barcode_column.like(f"{prefix}%")).scalar()
+            for barcode_column in barcode_columns
+        ]
 
-        max_num = max_num_query.scalar()
+        max_num = max((num for num in max_nums if num is not None), default=None)
 
         next_num = (max_num + 1) if max_num is not None else starting_num
         next_id = f"{prefix.upper()}{next_num}"
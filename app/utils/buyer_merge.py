@@ -0,0 +1,261 @@
+# file: app/utils/buyer_merge.py
+# Merging duplicate buyers (quick-adds from the scanner, bulk imports). The
+# candidates come from a blocking index: buyers whose normalized names
+# (Buyer.name_key, see name_keys) are equal fall in one block, so finding them
+# is one grouped query on an indexed column instead of comparing every pair of
+# names. A merge moves every row that points at the merged buyers to the kept
+# one with one UPDATE ... WHERE buyer_id IN (...) per table, folds their
+# archived totals into the kept buyer's and deletes them. Their barcodes become
+# aliases, so printed cards still scan. The merge records the merged buyer rows
+# and the ids of the rows it moved, which is all an undo needs.
+import itertools
+import json
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from app import db
+from app.models import (
+    ArchivedBuyerTotal, AuctionBid, AuctionLot, BankImportLine, Buyer, BuyerAlias, BuyerMerge, Payment,
+    Purchase, PurchaseArchive
+)
+from app.utils.db_utils import retry_on_busy
+from app.utils.name_keys import fill_missing_name_keys
+from app.utils.payment_utils import chunks, refresh_balances
+
+# Buyers merged into one at a time
+MAX_MERGE_SOURCES = 20
+# Blocks listed on the duplicates page
+DUPLICATE_GROUP_LIMIT = 200
+
+_buyers, _purchases, _aliases, _archived = (
+    Buyer.__table__, Purchase.__table__, BuyerAlias.__table__, ArchivedBuyerTotal.__table__
+)
+
+# (name, table, column) of every column that points at a buyer
+_BUYER_REFERENCES = tuple((table.name, table, table.c[column]) for table, column in (
+    (Purchase.__table__, 'buyer_id'),
+    (Payment.__table__, 'buyer_id'),
+    (AuctionBid.__table__, 'buyer_id'),
+    (AuctionLot.__table__, 'high_bidder_id'),
+    (BankImportLine.__table__, 'buyer_id'),
+))
+
+_ADD_ARCHIVED = update(_archived)\
+    .where(_archived.c.event_id == bindparam('event'), _archived.c.buyer_id == bindparam('buyer'))\
+    .values(purchase_count=_archived.c.purchase_count + bindparam('count_delta'),
+            total=_archived.c.total + bindparam('total_delta'))
+
+DuplicateBuyer = namedtuple('DuplicateBuyer', ['id', 'name', 'barcode', 'purchase_count', 'total', 'last_purchase'])
+
+
+class BuyerMergeError(Exception):
+    """Raised when buyers cannot be merged or a merge cannot be undone."""
+
+
+# --- Candidates ---
+
+def find_duplicate_groups(conn, limit: int = DUPLICATE_GROUP_LIMIT):
+    """
+    ([[DuplicateBuyer]], more) for blocks of buyers with the same name key,
+    busiest buyer first in each block (the suggested one to keep).
+    """
+    fill_missing_name_keys(conn)
+    keys = [key for key, in conn.execute(
+        select(_buyers.c.name_key).where(_buyers.c.name_key.is_not(None))
+        .group_by(_buyers.c.name_key).having(func.count() > 1).order_by(_buyers.c.name_key).limit(limit + 1))]
+    more, keys = len(keys) > limit, keys[:limit]
+    if not keys:
+        return [], False
+
+    blocked = select(_buyers.c.id).where(_buyers.c.name_key.in_(keys))
+    hot = select(_purchases.c.buyer_id, func.count().label('count'), func.sum(_purchases.c.total_price).label('total'),
+                 func.max(_purchases.c.timestamp).label('last'))\
+        .where(_purchases.c.buyer_id.in_(blocked)).group_by(_purchases.c.buyer_id).subquery()
+    archived = select(_archived.c.buyer_id, func.sum(_archived.c.purchase_count).label('count'),
+                      func.sum(_archived.c.total).label('total'))\
+        .where(_archived.c.buyer_id.in_(blocked)).group_by(_archived.c.buyer_id).subquery()
+    rows = conn.execute(
+        select(_buyers.c.name_key, _buyers.c.id, _buyers.c.name, _buyers.c.barcode_id,
+               func.coalesce(hot.c.count, 0) + func.coalesce(archived.c.count, 0),
+               func.coalesce(hot.c.total, 0.0) + func.coalesce(archived.c.total, 0.0), hot.c.last)
+        .outerjoin(hot, hot.c.buyer_id == _buyers.c.id)
+        .outerjoin(archived, archived.c.buyer_id == _buyers.c.id)
+        .where(_buyers.c.name_key.in_(keys)).order_by(_buyers.c.name_key, _buyers.c.id)
+    )
+    groups = []
+    for _, block in itertools.groupby(rows, key=lambda row: row[0]):
+        buyers = [DuplicateBuyer._make(row[1:]) for row in block]
+        groups.append(sorted(buyers, key=lambda buyer: (-buyer.purchase_count, buyer.id)))
+    return groups, more
+
+
+def find_buyer(barcode: str):
+    """The buyer with this barcode, or the buyer it was merged into; None if unknown."""
+    barcode = (barcode or '').strip()
+    buyer = db.session.execute(select(Buyer).where(Buyer.barcode_id == barcode)).scalar() if barcode else None
+    if buyer is None and barcode:
+        alias = db.session.get(BuyerAlias, barcode)
+        buyer = db.session.get(Buyer, alias.buyer_id) if alias else None
+    return buyer
+
+
+def resolve_buyer_barcodes(conn, barcodes) -> dict:
+    """{barcode: buyer_id} for buyer barcodes and aliases (unknown barcodes are left out)."""
+    barcodes = {barcode.strip() for barcode in barcodes if barcode and barcode.strip()}
+    found = {}
+    for chunk in chunks(barcodes):
+        found.update(conn.execute(select(_aliases.c.barcode_id, _aliases.c.buyer_id)
+                                  .where(_aliases.c.barcode_id.in_(chunk))).all())
+        found.update(conn.execute(select(_buyers.c.barcode_id, _buyers.c.id)
+                                  .where(_buyers.c.barcode_id.in_(chunk))).all())
+    return found
+
+
+# --- Merge ---
+
+def _move_archived_totals(conn, rows, from_ids, to_id: int, sign: int = 1):
+    """
+    Adds the archived per-event totals in rows ([event_id, buyer_id, hebrew_year,
+    count, total]) to to_id's rows (sign=-1 takes them off again) and deletes
+    the rows of from_ids. to_id rows left with no purchases are removed.
+    """
+    per_event = {}
+    for event_id, _, hebrew_year, count, total in rows:
+        year, event_count, event_total = per_event.get(event_id, (hebrew_year, 0, 0.0))
+        per_event[event_id] = (year, event_count + count, event_total + total)
+    if from_ids:
+        conn.execute(delete(_archived).where(_archived.c.buyer_id.in_(from_ids)))
+    if not per_event:
+        return
+    existing = set()
+    for chunk in chunks(per_event):
+        existing.update(conn.execute(select(_archived.c.event_id).where(
+            _archived.c.buyer_id == to_id, _archived.c.event_id.in_(chunk))).scalars())
+    updates = [{'event': event_id, 'buyer': to_id, 'count_delta': sign * count, 'total_delta': sign * total}
+               for event_id, (_, count, total) in per_event.items() if event_id in existing]
+    inserts = [{'event_id': event_id, 'buyer_id': to_id, 'hebrew_year': year, 'purchase_count': count, 'total': total}
+               for event_id, (year, count, total) in per_event.items() if event_id not in existing and sign > 0]
+    if updates:
+        conn.execute(_ADD_ARCHIVED, updates)
+    if inserts:
+        conn.execute(insert(_archived), inserts)
+    if sign < 0:
+        conn.execute(delete(_archived).where(_archived.c.buyer_id == to_id, _archived.c.purchase_count <= 0))
+
+
+@retry_on_busy
+def merge_buyers(target_id: int, source_ids, user_id: int = None) -> BuyerMerge:
+    """Merges the source buyers into the target buyer in one transaction; returns the merge record."""
+    source_ids = sorted({int(source_id) for source_id in source_ids} - {target_id})
+    if not source_ids:
+        raise BuyerMergeError('Choose the buyers to merge into the buyer you keep.')
+    if len(source_ids) > MAX_MERGE_SOURCES:
+        raise BuyerMergeError(f'Merge at most {MAX_MERGE_SOURCES} buyers at a time.')
+    target = db.session.get(Buyer, target_id)
+    sources = db.session.execute(select(Buyer).where(Buyer.id.in_(source_ids)).order_by(Buyer.id)).scalars().all()
+    if target is None or len(sources) != len(source_ids):
+        raise BuyerMergeError('One of the buyers no longer exists.')
+    # Bids of open lots live in memory (auction_book) under the buyer's id
+    if db.session.execute(select(AuctionLot.id).where(AuctionLot.status == 'open').limit(1)).first():
+        raise BuyerMergeError('An auction lot is open. Merge buyers after the auction.')
+
+    conn = db.session.connection()
+    moved = {}
+    for name, table, column in _BUYER_REFERENCES:
+        rows = conn.execute(select(table.c.id, column).where(column.in_(source_ids))).all()
+        if not rows:
+            continue
+        per_source = {}
+        for row_id, buyer_id in rows:
+            per_source.setdefault(str(buyer_id), []).append(row_id)
+        moved[name] = per_source
+        conn.execute(update(table).where(column.in_(source_ids)).values({column.name: target_id}))
+
+    archived = [list(row) for row in conn.execute(
+        select(_archived.c.event_id, _archived.c.buyer_id, _archived.c.hebrew_year,
+               _archived.c.purchase_count, _archived.c.total).where(_archived.c.buyer_id.in_(source_ids)))]
+    _move_archived_totals(conn, archived, source_ids, target_id)
+
+    # Aliases of buyers merged into a source earlier now lead to the target
+    repointed = dict(conn.execute(
+        select(_aliases.c.barcode_id, _aliases.c.buyer_id).where(_aliases.c.buyer_id.in_(source_ids))).all())
+    if repointed:
+        conn.execute(update(_aliases).where(_aliases.c.buyer_id.in_(source_ids)).values(buyer_id=target_id))
+
+    purchase_count = sum(len(ids) for ids in moved.get(_purchases.name, {}).values())
+    merge = BuyerMerge(
+        target_id=target_id, target_name=target.name,
+        source_summary='; '.join(f'{source.barcode_id} {source.name}' for source in sources)[:500],
+        purchase_count=purchase_count, user_id=user_id, merged_at=datetime.utcnow(),
+        undo_data=json.dumps({
+            'sources': [{'id': source.id, 'name': source.name, 'barcode_id': source.barcode_id,
+                         'name_key': source.name_key} for source in sources],
+            'moved': moved, 'archived': archived, 'aliases': repointed,
+        }, ensure_ascii=False),
+    )
+    db.session.add(merge)
+    db.session.flush()
+    conn.execute(insert(_aliases), [
+        {'barcode_id': source.barcode_id, 'buyer_id': target_id, 'old_buyer_id': source.id, 'merge_id': merge.id}
+        for source in sources])
+    for source in sources:
+        db.session.delete(source) # Listeners: scanner catalog tombstone, auction name cache
+    db.session.flush()
+    # Stamped after the tombstones, so a scanner that gets them also gets the aliases
+    target.updated_at = datetime.utcnow()
+    db.session.flush()
+    refresh_balances(conn, [target_id] + source_ids)
+    db.session.commit()
+    return merge
+
+
+@retry_on_busy
+def undo_merge(merge_id: int, user_id: int = None) -> BuyerMerge:
+    """Restores the merged buyers with their rows and barcodes in one transaction."""
+    merge = db.session.get(BuyerMerge, merge_id)
+    if merge is None or merge.undone_at is not None:
+        raise BuyerMergeError('This merge was already undone.')
+    target = db.session.get(Buyer, merge.target_id)
+    if target is None:
+        raise BuyerMergeError(f"'{merge.target_name}' was merged into another buyer since. Undo that merge first.")
+    # Archiving moves purchases (and their totals) out of reach of the recorded ids
+    if db.session.execute(select(PurchaseArchive.hebrew_year)
+                          .where(PurchaseArchive.archived_at > merge.merged_at).limit(1)).first():
+        raise BuyerMergeError('A year was archived after this merge, so it can no longer be undone.')
+    data = json.loads(merge.undo_data)
+    sources = data['sources']
+    source_ids = [source['id'] for source in sources]
+    taken = resolve_buyer_barcodes(db.session.connection(), [source['barcode_id'] for source in sources])
+    if any(taken.get(source['barcode_id']) not in (None, merge.target_id) for source in sources):
+        raise BuyerMergeError('A barcode of the merged buyers belongs to another buyer now.')
+    # Buyer ids aren't reused, but a database from before that may have given one out again
+    if db.session.execute(select(Buyer.id).where(Buyer.id.in_(source_ids)).limit(1)).first():
+        raise BuyerMergeError('The id of a merged buyer belongs to another buyer now, so this merge can no longer be undone.')
+
+    conn = db.session.connection()
+    now = datetime.utcnow()
+    conn.execute(delete(_aliases).where(_aliases.c.merge_id == merge.id))
+    conn.execute(insert(_buyers), [dict(source, updated_at=now) for source in sources])
+    references = {name: (table, column) for name, table, column in _BUYER_REFERENCES}
+    for name, per_source in data['moved'].items():
+        table, column = references[name]
+        for source_id, row_ids in per_source.items():
+            for chunk in chunks(row_ids):
+                # Rows reassigned again since (e.g. a later merge) stay where they are
+                conn.execute(update(table).where(table.c.id.in_(chunk), column == merge.target_id)
+                             .values({column.name: int(source_id)}))
+    _move_archived_totals(conn, data['archived'], [], merge.target_id, sign=-1)
+    if data['archived']:
+        conn.execute(insert(_archived), [
+            {'event_id': event_id, 'buyer_id': buyer_id, 'hebrew_year': hebrew_year, 'purchase_count': count,
+             'total': total} for event_id, buyer_id, hebrew_year, count, total in data['archived']])
+    for barcode, buyer_id in data['aliases'].items():
+        conn.execute(update(_aliases).where(_aliases.c.barcode_id == barcode, _aliases.c.buyer_id == merge.target_id)
+                     .values(buyer_id=buyer_id))
+
+    merge.undone_at, merge.undone_by_id = now, user_id
+    target.updated_at = now # Listeners: scanner catalog, auction name cache
+    db.session.flush()
+    refresh_balances(conn, [merge.target_id] + source_ids)
+    db.session.commit()
+    return merge
@@ -0,0 +1,52 @@
+# file: app/utils/card_codes.py
+# Composite scan cards: one barcode that records a whole purchase.
+#   CARD:<item barcode>:<price>:<buyer barcode or empty>:<signature>
+# e.g. CARD:I5001:180:B1002:4c1f0a9e2b. Without a buyer the card applies to the
+# buyer currently scanned; with one it is a pre-sold honor. The signature is a
+# truncated HMAC-SHA256 of the rest under CARD_SIGNING_KEY, so a card can't be
+# altered (another price or buyer) or typed in by hand. The payload stays short
+# enough for a Code128 card.
+import hashlib
+import hmac
+from collections import namedtuple
+from flask import current_app
+
+CARD_PREFIX = 'CARD:'
+SIGNATURE_LENGTH = 10 # Hex characters (40 bits)
+
+CardCode = namedtuple('CardCode', ['item_barcode', 'price', 'buyer_barcode'])
+
+
+def _key() -> bytes:
+    key = current_app.config.get('CARD_SIGNING_KEY') or current_app.config['SECRET_KEY']
+    return key.encode('utf-8')
+
+
+def _signature(payload: str) -> str:
+    return hmac.new(_key(), payload.encode('utf-8'), hashlib.sha256).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def format_price(price: float) -> str:
+    """Shortest exact form: 180, 18.5, 36.25."""
+    return f'{price:.2f}'.rstrip('0').rstrip('.')
+
+
+def make_card_code(item_barcode: str, price: float, buyer_barcode: str = None) -> str:
+    payload = f"{CARD_PREFIX}{item_barcode}:{format_price(price)}:{buyer_barcode or ''}"
+    return f'{payload}:{_signature(payload)}'
+
+
+def parse_card_code(barcode: str) -> CardCode:
+    """Fields of a card barcode; ValueError (with a message for the scanner) if malformed or unsigned."""
+    payload, _, signature = barcode.rpartition(':')
+    parts = payload[len(CARD_PREFIX):].split(':') if payload.startswith(CARD_PREFIX) else []
+    if len(parts) != 3 or not parts[0]:
+        raise ValueError(f"Malformed card barcode: '{barcode}'.")
+    if not hmac.compare_digest(signature.lower(), _signature(payload)):
+        raise ValueError('Card signature is not valid. Reprint the card.')
+    item_barcode, price_str, buyer_barcode = parts
+    try:
+        price = float(price_str)
+    except ValueError:
+        raise ValueError(f"Invalid price on card: '{price_str}'.") from None
+    return CardCode(item_barcode, price, buyer_barcode or None)
@@ -0,0 +1,111 @@
+# file: app/utils/db_bench.py
+# Scan throughput while a heavy report runs (used by `flask bench-sqlite`).
+# Every worker is a separate process, like gunicorn workers, each with its
+# own engine on the same database file.
+import multiprocessing
+import random
+import statistics
+import time
+from collections import namedtuple
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from app.models import Buyer, Item, Purchase
+from app.utils.db_utils import apply_sqlite_profile
+from app.utils.report_utils import ledger_select
+
+BenchResult = namedtuple('BenchResult', [
+    'mode', 'scans', 'scans_per_s', 'p50_ms', 'p95_ms', 'max_ms', 'locked_errors', 'reports'
+])
+
+# Today's defaults: rollback journal, pysqlite's 5 s busy timeout, no pragmas
+BASELINE = 'baseline'
+PROFILE = 'profile'
+BENCH_PRAGMAS = [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('busy_timeout', 15000),
+                 ('cache_size', -16384), ('temp_store', 'MEMORY'), ('mmap_size', 128 * 1024 * 1024)]
+
+
+def _engine(path: str, mode: str, read_only: bool = False):
+    engine = create_engine(f'sqlite:///{path}')
+    if mode == PROFILE:
+        apply_sqlite_profile(engine, BENCH_PRAGMAS, read_only=read_only, serialize_writes=not read_only)
+    return engine
+
+
+def prepare_database(path: str, mode: str, seed_engine_factory):
+    """Seeds a database file and sets its (persistent) journal mode for the run."""
+    engine = seed_engine_factory(path)
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA journal_mode={'WAL' if mode == PROFILE else 'DELETE'}")
+    engine.dispose()
+
+
+def _scan_worker(path, mode, duration, seed, buyers, items, events, queue):
+    """Scan loop: buyer lookup, item lookup, unique check, insert + commit."""
+    rng = random.Random(seed)
+    engine = _engine(path, mode)
+    latencies, locked = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        event_id, item_no = rng.randint(1, events), rng.randint(1, items)
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                buyer_id = conn.execute(select(Buyer.id).where(
+                    Buyer.barcode_id == f'B{1000 + rng.randint(1, buyers)}')).scalar()
+                item_id = conn.execute(select(Item.id).where(Item.barcode_id == f'I{5000 + item_no}')).scalar()
+                conn.execute(select(Purchase.id).where(
+                    Purchase.event_id == event_id, Purchase.item_id == item_id).limit(1)).first()
+                conn.execute(insert(Purchase).values(
+                    event_id=event_id, buyer_id=buyer_id, item_id=item_id, quantity=1,
+                    total_price=float(rng.randint(1, 500)), is_manual_entry=False))
+        except OperationalError as e:
+            if 'locked' not in str(e.orig).lower() and 'busy' not in str(e.orig).lower():
+                raise
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    engine.dispose()
+    queue.put(('scan', latencies, locked))
+
+
+def _report_worker(path, mode, duration, queue):
+    """Heavy report loop: the full purchase ledger of every event, fetched to the end."""
+    engine = _engine(path, mode, read_only=True)
+    reports = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        with engine.connect() as conn:
+            # Hold the read open for the whole fetch, like a streamed export
+            for _ in conn.execute(ledger_select(), execution_options={'yield_per': 500}):
+                pass
+        reports += 1
+    engine.dispose()
+    queue.put(('report', reports, 0))
+
+
+def run_benchmark(path: str, mode: str, duration: float, scan_workers: int,
+                  report_workers: int, buyers: int, items: int, events: int) -> BenchResult:
+    """Runs scan and report worker processes against path and collects their results."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_scan_worker, args=(path, mode, duration, i, buyers, items, events, queue))
+             for i in range(scan_workers)]
+    procs += [ctx.Process(target=_report_worker, args=(path, mode, duration, queue))
+              for _ in range(report_workers)]
+    for proc in procs:
+        proc.start()
+    latencies, locked, reports = [], 0, 0
+    for _ in procs:
+        kind, value, errors = queue.get()
+        if kind == 'scan':
+            latencies.extend(value)
+            locked += errors
+        else:
+            reports += value
+    for proc in procs:
+        proc.join()
+
+    latencies_ms = sorted(l * 1000 for l in latencies) or [0.0]
+    p95 = latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))]
+    return BenchResult(mode, len(latencies), len(latencies) / duration, statistics.median(latencies_ms),
+                       p95, latencies_ms[-1], locked, reports)
@@ -0,0 +1,135 @@
+# file: app/utils/db_utils.py
+# SQLite engine profile for running several workers against one database file:
+# WAL journaling and tuned pragmas on every connection, one serialized writer
+# per process, a separate read-only engine for heavy report reads, and a retry
+# helper for the occasional "database is locked" that still gets through.
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Serializes write transactions of all threads in this process. Other
+# processes are handled by SQLite's own lock and the busy timeout.
+_writer_lock = threading.Lock()
+_WRITE_VERBS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def is_file_sqlite(uri: str) -> bool:
+    """True for SQLite URIs that point at a file (WAL needs a real file)."""
+    return uri.startswith('sqlite:') and uri not in ('sqlite://', 'sqlite:///') and ':memory:' not in uri
+
+
+def sqlite_pragmas(config) -> list:
+    """Pragmas applied to every new connection, from the app config."""
+    return [
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 15000))),
+        ('cache_size', int(config.get('SQLITE_CACHE_SIZE_KB', 16384)) * -1), # Negative = KiB
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))),
+    ]
+
+
+def apply_sqlite_profile(engine, pragmas, read_only: bool = False, serialize_writes: bool = True):
+    """Attaches the connect-time pragmas (and the per-process writer lock) to an engine."""
+    busy_timeout_s = dict(pragmas).get('busy_timeout', 15000) / 1000
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+            if read_only:
+                cursor.execute('PRAGMA query_only=ON')
+        finally:
+            cursor.close()
+
+    if not serialize_writes:
+        return
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _acquire_writer(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('holds_writer_lock'):
+            return
+        if not statement.lstrip()[:7].upper().startswith(_WRITE_VERBS):
+            return
+        if _writer_lock.acquire(timeout=busy_timeout_s):
+            conn.info['holds_writer_lock'] = True
+        else:
+            logger.warning(f"Writer lock not acquired within {busy_timeout_s:.0f} s; writing anyway.")
+
+    def _release_writer(info):
+        if info.pop('holds_writer_lock', False):
+            _writer_lock.release()
+
+    event.listen(engine, 'commit', lambda conn: _release_writer(conn.info))
+    event.listen(engine, 'rollback', lambda conn: _release_writer(conn.info))
+    # Safety net: a connection going back to the pool never keeps the lock
+    event.listen(engine.pool, 'checkin', lambda dbapi_conn, record: _release_writer(record.info))
+
+
+def init_sqlite_profile(app):
+    """
+    Applies the profile to the app's engine and creates the reader engine
+    (app.extensions['sqlite_reader']). No-op for non-SQLite databases, in-memory
+    databases, or when SQLITE_PROFILE is False.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not app.config.get('SQLITE_PROFILE', True) or not is_file_sqlite(uri):
+        return
+    pragmas = sqlite_pragmas(app.config)
+    with app.app_context():
+        apply_sqlite_profile(db.engine, pragmas)
+    reader = create_engine(uri, pool_size=int(app.config.get('SQLITE_READER_POOL_SIZE', 4)))
+    apply_sqlite_profile(reader, pragmas, read_only=True, serialize_writes=False)
+    app.extensions['sqlite_reader'] = reader
+
+
+@contextmanager
+def read_connection():
+    """
+    A connection for long read-only queries (reports, exports). With WAL it
+    reads a consistent snapshot without blocking scanning writes. Falls back
+    to the main engine when no reader engine is configured.
+    """
+    engine = current_app.extensions.get('sqlite_reader') or db.engine
+    with engine.connect() as conn:
+        yield conn
+
+
+def _is_busy_error(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(fn=None, attempts: int = 5, base_delay: float = 0.05, max_delay: float = 1.0):
+    """
+    Retries a unit of work (add + commit) when SQLite reports the database is
+    locked, rolling back the session and backing off exponentially with jitter.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if attempt == attempts or not _is_busy_error(e):
+                        raise
+                    db.session.rollback()
+                    delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                    logger.warning(f"{func.__name__}: database busy (attempt {attempt}/{attempts}), "
+                                   f"retrying in {delay * 1000:.0f} ms.")
+                    time.sleep(delay)
+        return wrapper
+    return decorator(fn) if fn else decorator
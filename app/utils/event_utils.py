@@ -0,0 +1,174 @@
+# file: app/utils/event_utils.py
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select
+from app import db
+from app.models import AuctionBid, AuctionLot, Event, Purchase
+from app.utils.export_utils import iter_csv
+from app.utils.archive_utils import delete_archived_event_totals
+from app.utils.auction_book import forget_event
+from app.utils.payment_utils import refresh_balances, release_pledges
+from app.utils.hebrew_date_utils import calendar_for_year, hebrew_year_bounds
+from app.utils.report_utils import LEDGER_HEADER, invalidate_event_aggregates, ledger_select, stream_rows
+
+logger = logging.getLogger(__name__)
+
+# Holidays (from the calendar table) that get their own event on weekdays.
+# Any Shabbat gets an event regardless.
+EVENT_HOLIDAYS = frozenset((
+    "ראש השנה א׳", "ראש השנה ב׳", "יום כיפור", "סוכות",
+    "שמיני עצרת - שמחת תורה", "פסח", "שביעי של פסח", "שבועות",
+))
+
+SeasonEventPlan = namedtuple('SeasonEventPlan', ['gregorian_date', 'event_name', 'hebrew_date', 'details'])
+
+
+def plan_season_events(hebrew_year: int, include_shabbat: bool = True, include_holidays: bool = True):
+    """
+    Lists the Shabbat and holiday events of a Hebrew year in date order,
+    in one pass over the precomputed calendar table (no database access).
+    """
+    calendar = calendar_for_year(hebrew_year)
+    year_start, year_end = hebrew_year_bounds(hebrew_year)
+    plans = []
+    for day, offset in calendar.days(year_start.toordinal(), year_end.toordinal()):
+        holiday = calendar.holidays[offset]
+        is_event_holiday = holiday in EVENT_HOLIDAYS
+        if not (include_shabbat and day.weekday() == 5) and not (include_holidays and is_event_holiday):
+            continue
+        if day.weekday() == 5: # Shabbat
+            parasha = calendar.parashot[offset]
+            if is_event_holiday:
+                name, details = holiday, holiday
+            elif parasha:
+                name, details = f"פרשת {parasha}", parasha
+            elif holiday:
+                name, details = f"שבת {holiday}", holiday
+            else:
+                name, details = "שבת", None
+        else:
+            name, details = holiday, holiday
+        plans.append(SeasonEventPlan(
+            datetime(day.year, day.month, day.day), name, calendar.date_strings[offset], details
+        ))
+    return plans
+
+
+def generate_season_events(hebrew_year: int, include_shabbat: bool = True,
+                           include_holidays: bool = True, dry_run: bool = False):
+    """
+    Creates the Shabbat and holiday events of a Hebrew year in one transaction.
+    Dates that already have an event are skipped, so running it again is harmless.
+    Returns (created, skipped) lists of SeasonEventPlan.
+    """
+    plans = plan_season_events(hebrew_year, include_shabbat, include_holidays)
+    year_start, year_end = hebrew_year_bounds(hebrew_year)
+    existing = set(db.session.execute(
+        select(func.date(Event.gregorian_date))
+        .where(Event.gregorian_date >= year_start, Event.gregorian_date < year_end)
+    ).scalars())
+
+    created, skipped = [], []
+    for plan in plans:
+        (skipped if plan.gregorian_date.date().isoformat() in existing else created).append(plan)
+
+    if created and not dry_run:
+        try:
+            db.session.execute(insert(Event), [plan._asdict() for plan in created])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Failed to generate events for Hebrew year {hebrew_year}")
+            raise
+    logger.info(f"Season {hebrew_year}: {len(created)} events created, {len(skipped)} skipped"
+                f"{' (dry run)' if dry_run else ''}.")
+    return created, skipped
+
+
+# --- Event Deletion ---
+
+class EventArchiveMismatch(Exception):
+    """Purchases changed between archiving and deleting an event."""
+
+
+class EventHasOpenLot(Exception):
+    """An event with an auction lot still open can't be deleted."""
+
+
+def has_open_lot(event_id: int) -> bool:
+    return db.session.execute(
+        select(AuctionLot.id).where(AuctionLot.event_id == event_id, AuctionLot.status == 'open').limit(1)
+    ).first() is not None
+
+
+def archive_event_ledger(event: Event, directory: str):
+    """
+    Writes the event's purchase ledger to a CSV file in directory, streaming
+    rows from the DB cursor. Returns (path, row_count).
+    """
+    os.makedirs(directory, exist_ok=True)
+    filename = f"event_{event.id}_{event.gregorian_date:%Y-%m-%d}_{datetime.utcnow():%Y%m%d%H%M%S}.csv"
+    path = os.path.join(directory, filename)
+    row_count = 0
+
+    def counted(rows):
+        nonlocal row_count
+        for row in rows:
+            row_count += 1
+            yield row
+
+    # Write under a temporary name so a partial file is never mistaken for an archive
+    with open(path + '.part', 'wb') as f:
+        for chunk in iter_csv(LEDGER_HEADER, counted(stream_rows(ledger_select(event_id=event.id)))):
+            f.write(chunk)
+    os.replace(path + '.part', path)
+    logger.info(f"Archived {row_count} purchases of event {event.id} to {path}")
+    return path, row_count
+
+
+def delete_event_with_purchases(event_id: int, expected_purchases: int = None) -> int:
+    """
+    Deletes an event with all its purchases and auction lots and bids, with
+    set-based DELETEs in one transaction (no purchase rows are loaded into
+    the session).
+    When expected_purchases is given (e.g. the archived row count) and the
+    number of deleted purchases differs, nothing is deleted and
+    EventArchiveMismatch is raised; an open auction lot raises
+    EventHasOpenLot. Returns the number of purchases deleted.
+    """
+    try:
+        buyer_ids = release_pledges(db.session.connection(), select(Purchase.id).where(Purchase.event_id == event_id))
+        # Checked after the first write, which holds the write lock: no lot can open meanwhile
+        if has_open_lot(event_id):
+            raise EventHasOpenLot(f"Event {event_id} has an open auction lot.")
+        lot_ids = select(AuctionLot.id).where(AuctionLot.event_id == event_id)
+        db.session.execute(delete(AuctionBid).where(AuctionBid.lot_id.in_(lot_ids)),
+                           execution_options={'synchronize_session': False})
+        db.session.execute(delete(AuctionLot).where(AuctionLot.event_id == event_id),
+                           execution_options={'synchronize_session': False})
+        deleted = db.session.execute(
+            delete(Purchase).where(Purchase.event_id == event_id),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if expected_purchases is not None and deleted != expected_purchases:
+            raise EventArchiveMismatch(
+                f"Event {event_id} has {deleted} purchases but {expected_purchases} were archived."
+            )
+        # Archived totals count towards the buyers' pledged amounts too
+        buyer_ids |= delete_archived_event_totals(event_id)
+        db.session.execute(
+            delete(Event).where(Event.id == event_id),
+            execution_options={'synchronize_session': False}
+        )
+        refresh_balances(db.session.connection(), buyer_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    db.session.expire_all() # Drop any stale Event/Purchase objects still in the identity map
+    invalidate_event_aggregates(event_id)
+    forget_event(event_id)
+    logger.info(f"Deleted event {event_id} and {deleted} purchases.")
+    return deleted
@@ -0,0 +1,133 @@
+# file: app/utils/export_utils.py
+import csv
+import io
+import logging
+import tempfile
+from collections import namedtuple
+from urllib.parse import quote
+
+from flask import Response, stream_with_context, send_file
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered before a chunk is handed to the WSGI server
+CSV_CHUNK_ROWS = 1000
+CSV_MIME_TYPE = 'text/csv' # Flask appends '; charset=utf-8'
+
+
+def content_disposition(filename: str, disposition: str = 'attachment') -> str:
+    """RFC 6266 Content-Disposition value with a UTF-8 encoded filename."""
+    return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+
+def iter_csv(header, rows, chunk_rows: int = CSV_CHUNK_ROWS):
+    """
+    Yields the CSV as UTF-8 byte chunks (BOM first, so Excel detects the encoding).
+    Only one chunk of rows is held in memory at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'.encode('utf-8')
+    writer.writerow(header)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_csv_response(header, rows, filename: str) -> Response:
+    """
+    Returns a chunked CSV download streaming `rows` (any iterable of tuples,
+    typically report_utils.stream_rows) through csv.writer.
+    The request context stays open while streaming so DB cursors remain valid.
+    """
+    response = Response(stream_with_context(iter_csv(header, rows)), mimetype=CSV_MIME_TYPE)
+    response.headers['Content-Disposition'] = content_disposition(filename)
+    return response
+
+
+ZIP_MIME_TYPE = 'application/zip'
+
+
+def stream_zip_response(chunks, filename: str) -> Response:
+    """Returns a chunked ZIP download of `chunks` (bytes, e.g. statement_utils.iter_statements_zip)."""
+    response = Response(stream_with_context(chunks), mimetype=ZIP_MIME_TYPE)
+    response.headers['Content-Disposition'] = content_disposition(filename)
+    return response
+
+
+# --- Excel (openpyxl write-only mode) ---
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Number formats used in Hebrew workbooks
+SHEKEL_FORMAT = '#,##0.00 "₪"'
+DATETIME_FORMAT = 'dd/mm/yyyy hh:mm'
+DATE_FORMAT = 'dd/mm/yyyy'
+
+# A worksheet to write: rows is any iterable of tuples (streamed, never stored),
+# formats maps a 0-based column index to an Excel number format.
+Sheet = namedtuple('Sheet', ['title', 'header', 'rows', 'formats'])
+
+
+def write_workbook(sheets, output, rtl: bool = True) -> int:
+    """
+    Writes the sheets into `output` (path or binary file object) using openpyxl's
+    write-only mode: rows are serialized as they are produced instead of being
+    kept as a cell-object tree, so memory stays bounded for large events.
+    Returns the number of data rows written.
+    """
+    # openpyxl is imported on first export rather than at worker startup
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    total_rows = 0
+    for sheet in sheets:
+        worksheet = workbook.create_sheet(title=sheet.title[:31]) # Excel limits sheet names to 31 chars
+        worksheet.sheet_view.rightToLeft = rtl
+        header_cells = []
+        for title in sheet.header:
+            cell = WriteOnlyCell(worksheet, value=title)
+            cell.font = header_font
+            header_cells.append(cell)
+        worksheet.append(header_cells)
+
+        formats = sheet.formats or {}
+        for row in sheet.rows:
+            if formats:
+                row = list(row)
+                for index, number_format in formats.items():
+                    cell = WriteOnlyCell(worksheet, value=row[index])
+                    cell.number_format = number_format
+                    row[index] = cell
+            worksheet.append(row)
+            total_rows += 1
+
+    workbook.save(output)
+    return total_rows
+
+
+def send_workbook(sheets, filename: str, rtl: bool = True):
+    """
+    Builds a write-only workbook in a temporary file and sends it as a download.
+    The temporary file is streamed to the client and removed once closed.
+    """
+    output = tempfile.TemporaryFile()
+    try:
+        row_count = write_workbook(sheets, output, rtl=rtl)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    logger.info(f"Excel export '{filename}': {row_count} rows, {output.seek(0, io.SEEK_END)} bytes.")
+    output.seek(0)
+    return send_file(output, mimetype=XLSX_MIME_TYPE, as_attachment=True, download_name=filename)
@@ -1,12 +1,24 @@
-# file: app/utils/hebrew_date_utils.py (Using Correct Class Names)
-from datetime import datetime
-# Corrected imports based on dir(hdate) output:
-from hdate import HebrewDate, Location, Zmanim # Use HebrewDate instead of HDate
+# file: app/utils/hebrew_date_utils.py
+import logging
+import threading
+from array import array
+from datetime import datetime, date as date_cls
+from functools import lru_cache
 from convertdate import hebrew
 
-# Define a default location (adjust as needed)
-# Doing this once avoids recreating it in both functions
-DEFAULT_LOCATION = Location(latitude=31.77, longitude=35.21, timezone="Asia/Jerusalem", name="Jerusalem")
+logger = logging.getLogger(__name__)
+
+# Default span of the precomputed calendar table (Hebrew years, inclusive).
+# Overridden by HEBREW_CALENDAR_FIRST_YEAR / HEBREW_CALENDAR_LAST_YEAR in the app config.
+DEFAULT_CALENDAR_FIRST_YEAR = 5780
+DEFAULT_CALENDAR_LAST_YEAR = 5800
+
+
+@lru_cache(maxsize=1)
+def _default_location():
+    """Default location for hdate (adjust as needed). hdate is imported on first use."""
+    from hdate import Location
+    return Location(latitude=31.77, longitude=35.21, timezone="Asia/Jerusalem", name="Jerusalem")
 
 # Hebrew month names
 HEBREW_MONTH_NAMES = {
@@ -30,7 +42,36 @@ HEBREW_LETTERS = {
     10: "י", 20: "כ", 30: "ל", 40: "מ", 50: "נ", 60: "ס", 70: "ע", 80: "פ", 90: "צ",
     100: "ק", 200: "ר", 300: "ש", 400: "ת"
 }
+# Letter values, largest first (sorted once instead of on every conversion)
+_GEMATRIA_VALUES = tuple(sorted(HEBREW_LETTERS, reverse=True))
+
+# Holidays by (Hebrew month, day) as observed in Israel. Hanukkah, Purim and
+# Tisha B'Av depend on the year and are handled in _holiday_name().
+HOLIDAY_NAMES = {
+    (7, 1): "ראש השנה א׳",
+    (7, 2): "ראש השנה ב׳",
+    (7, 10): "יום כיפור",
+    (7, 15): "סוכות",
+    (7, 16): "חול המועד סוכות",
+    (7, 17): "חול המועד סוכות",
+    (7, 18): "חול המועד סוכות",
+    (7, 19): "חול המועד סוכות",
+    (7, 20): "חול המועד סוכות",
+    (7, 21): "הושענא רבה",
+    (7, 22): "שמיני עצרת - שמחת תורה",
+    (11, 15): "ט״ו בשבט",
+    (1, 15): "פסח",
+    (1, 16): "חול המועד פסח",
+    (1, 17): "חול המועד פסח",
+    (1, 18): "חול המועד פסח",
+    (1, 19): "חול המועד פסח",
+    (1, 20): "חול המועד פסח",
+    (1, 21): "שביעי של פסח",
+    (2, 18): "ל״ג בעומר",
+    (3, 6): "שבועות",
+}
 
+@lru_cache(maxsize=None)
 def num_to_gematria(num):
     if num >= 1000:
         thousands = num // 1000
@@ -40,7 +81,7 @@ def num_to_gematria(num):
 
 def _convert_gematria(num):
     parts = []
-    for value in sorted(HEBREW_LETTERS.keys(), reverse=True):
+    for value in _GEMATRIA_VALUES:
         while num >= value:
             num -= value
             parts.append(HEBREW_LETTERS[value])
@@ -51,49 +92,245 @@ def _convert_gematria(num):
         return "ט״ז"
     return "".join(parts[:-1]) + "״" + parts[-1] if parts else ""
 
-def get_hebrew_date_string(date: datetime) -> str:
-    h_year, h_month, h_day = hebrew.from_gregorian(date.year, date.month, date.day)
+def _month_name(h_year: int, h_month: int) -> str:
+    if h_month == 12 and hebrew.leap(h_year):
+        return "אדר א׳"
+    return HEBREW_MONTH_NAMES.get(h_month, f"חודש {h_month}")
 
-    if hebrew.leap(h_year) and h_month == 12:
-        month_name = "אדר א׳"
-    else:
-        month_name = HEBREW_MONTH_NAMES.get(h_month, f"חודש {h_month}")
+def _format_hebrew_date(h_year: int, h_month: int, h_day: int) -> str:
+    return f"{num_to_gematria(h_day)} {_month_name(h_year, h_month)} ה׳{num_to_gematria(h_year % 1000)}"
+
+def _holiday_name(h_year: int, h_month: int, h_day: int, weekday: int):
+    """Holiday name for a Hebrew date (Israel customs), or None. weekday: Monday=0."""
+    name = HOLIDAY_NAMES.get((h_month, h_day))
+    if name:
+        return name
+    # Hanukkah: 8 days from 25 Kislev, running into Tevet (Kislev has 29 or 30 days)
+    if h_month == 9 and h_day >= 25:
+        return "חנוכה"
+    if h_month == 10 and h_day <= 8 - (hebrew.month_days(h_year, 9) - 24):
+        return "חנוכה"
+    # Purim is in Adar, or Adar II in a leap year
+    purim_month = 13 if hebrew.leap(h_year) else 12
+    if h_month == purim_month and h_day == 14:
+        return "פורים"
+    if h_month == purim_month and h_day == 15:
+        return "שושן פורים"
+    # Tisha B'Av is deferred to Sunday when 9 Av falls on Shabbat
+    if h_month == 5 and ((h_day == 9 and weekday != 5) or (h_day == 10 and weekday == 6)):
+        return "תשעה באב"
+    return None
 
-    day_str = num_to_gematria(h_day)
-    year_str = num_to_gematria(h_year % 1000)
+def _next_hebrew_day(h_year: int, h_month: int, h_day: int):
+    """Advances a (year, month, day) Hebrew date by one day."""
+    if h_day < hebrew.month_days(h_year, h_month):
+        return h_year, h_month, h_day + 1
+    if h_month == 6: # Elul -> Tishrei of the next year
+        return h_year + 1, 7, 1
+    if h_month == hebrew.year_months(h_year): # Adar / Adar II -> Nisan
+        return h_year, 1, 1
+    return h_year, h_month + 1, 1
 
-    return f"{day_str} {month_name} ה׳{year_str}"
+def _parasha_names(saturdays):
+    """
+    Hebrew parasha names for a list of Saturdays (date objects), None where
+    there is no regular reading (e.g. Shabbat during a festival).
+    """
+    try:
+        from hdate import HDateInfo
+        from hdate.translator import get_language, set_language
+    except ImportError:
+        HDateInfo = None
 
+    if HDateInfo is None: # Older hdate releases
+        names = []
+        for saturday in saturdays:
+            try:
+                from hdate import HebrewDate
+                hd = HebrewDate(datetime(saturday.year, saturday.month, saturday.day), location=_default_location())
+                names.append(hd.get_parasha_string(hebrew=True) or None)
+            except Exception:
+                names.append(None)
+        return names
 
-def get_parsha_string(gregorian_dt: datetime):
-    """Gets the weekly Parsha for a given Gregorian date (if it's Shabbat) using hdate."""
+    previous_language = get_language()
+    set_language('he')
     try:
-        # Instantiate HebrewDate with the location
-        hd = HebrewDate(gregorian_dt, location=DEFAULT_LOCATION)
+        names = []
+        for saturday in saturdays:
+            info = HDateInfo(saturday, diaspora=False)
+            names.append(None if info.parasha_obj.name == 'NONE' else str(info.parasha))
+        return names
+    finally:
+        set_language(previous_language)
+
+
+class HebrewCalendar:
+    """
+    Precomputed calendar table for a span of Hebrew years.
+    Every per-day attribute is stored in a list/array indexed by
+    (date.toordinal() - start_ordinal), so lookups are O(1).
+    """
+
+    def __init__(self, first_year: int, last_year: int, with_parashot: bool = True):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.start_ordinal = date_cls(*hebrew.to_gregorian(first_year, 7, 1)).toordinal()
+        self.end_ordinal = date_cls(*hebrew.to_gregorian(last_year + 1, 7, 1)).toordinal()
+        days = self.end_ordinal - self.start_ordinal
+
+        self.hebrew_ymd = array('l') # Packed as year * 10000 + month * 100 + day
+        self.date_strings = []
+        self.holidays = [None] * days
+        self.parashot = [None] * days
+
+        h_year, h_month, h_day = first_year, 7, 1
+        saturdays = []
+        for offset in range(days):
+            weekday = (self.start_ordinal + offset + 6) % 7 # Monday == 0, like date.weekday()
+            self.hebrew_ymd.append(h_year * 10000 + h_month * 100 + h_day)
+            self.date_strings.append(_format_hebrew_date(h_year, h_month, h_day))
+            self.holidays[offset] = _holiday_name(h_year, h_month, h_day, weekday)
+            if weekday == 5:
+                saturdays.append(offset)
+            h_year, h_month, h_day = _next_hebrew_day(h_year, h_month, h_day)
+
+        if with_parashot and saturdays:
+            names = _parasha_names([date_cls.fromordinal(self.start_ordinal + o) for o in saturdays])
+            for offset, name in zip(saturdays, names):
+                self.parashot[offset] = name
+
+    def _offset(self, d):
+        offset = d.toordinal() - self.start_ordinal
+        if 0 <= offset < len(self.date_strings):
+            return offset
+        return None
 
-        dow = gregorian_dt.weekday() # Monday is 0, Sunday is 6
+    def covers(self, d) -> bool:
+        return self._offset(d) is not None
 
-        # Check if it's Shabbat (Saturday == 5)
-        if dow == 5:
-            # Get Parsha info using recommended hdate method
-            # Use hebrew=True for Hebrew names if desired
-            parsha_str = hd.get_parasha_string(hebrew=False)
+    def hebrew_date_string(self, d):
+        """Hebrew date string for a date/datetime, or None if outside the table."""
+        offset = self._offset(d)
+        return self.date_strings[offset] if offset is not None else None
 
-            if parsha_str:
-                 # The get_parasha_string often combines regular and special parshiot
-                return parsha_str
+    def hebrew_date(self, d):
+        """(year, month, day) Hebrew date tuple, or None if outside the table."""
+        offset = self._offset(d)
+        if offset is None:
+            return None
+        packed = self.hebrew_ymd[offset]
+        return packed // 10000, packed // 100 % 100, packed % 100
 
-            # If no specific parsha string, check for holidays
-            # Use hebrew=True for Hebrew names if desired
-            holiday_info = hd.holiday_description(hebrew=False)
-            if holiday_info:
-                return holiday_info # Return the holiday name
+    def holiday(self, d):
+        offset = self._offset(d)
+        return self.holidays[offset] if offset is not None else None
 
-            return "Shabbat (No specific Parsha/Holiday found)" # Fallback
+    def parasha(self, d):
+        offset = self._offset(d)
+        return self.parashot[offset] if offset is not None else None
 
+    def label(self, d):
+        """Holiday name if the day is a holiday, else the parasha on Shabbat, else None."""
+        offset = self._offset(d)
+        if offset is None:
+            return None
+        return self.holidays[offset] or self.parashot[offset]
+
+    def days(self, start_ordinal: int = None, end_ordinal: int = None):
+        """Yields (date, offset) for each day in [start, end) clipped to the table."""
+        start = max(start_ordinal or self.start_ordinal, self.start_ordinal)
+        end = min(end_ordinal or self.end_ordinal, self.end_ordinal)
+        for ordinal in range(start, end):
+            yield date_cls.fromordinal(ordinal), ordinal - self.start_ordinal
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+def get_calendar() -> HebrewCalendar:
+    """Returns the process-wide calendar table, building it on first use."""
+    global _calendar
+    if _calendar is None:
+        with _calendar_lock:
+            if _calendar is None:
+                first_year, last_year = DEFAULT_CALENDAR_FIRST_YEAR, DEFAULT_CALENDAR_LAST_YEAR
+                try:
+                    from flask import current_app
+                    first_year = current_app.config.get('HEBREW_CALENDAR_FIRST_YEAR', first_year)
+                    last_year = current_app.config.get('HEBREW_CALENDAR_LAST_YEAR', last_year)
+                except RuntimeError: # No app context (e.g. scripts)
+                    pass
+                _calendar = HebrewCalendar(first_year, last_year)
+                logger.info(f"Built Hebrew calendar table for {first_year}-{last_year} "
+                            f"({len(_calendar.date_strings)} days).")
+    return _calendar
+
+def calendar_for_year(h_year: int) -> HebrewCalendar:
+    """The process-wide table if it covers h_year, else a one-off table for that year."""
+    calendar = get_calendar()
+    if calendar.first_year <= h_year <= calendar.last_year:
+        return calendar
+    return HebrewCalendar(h_year, h_year)
+
+def convert_many(dates):
+    """
+    Converts many Gregorian dates/datetimes to Hebrew date strings in one pass.
+    Dates outside the precomputed table fall back to direct conversion.
+    """
+    calendar = get_calendar()
+    start, strings = calendar.start_ordinal, calendar.date_strings
+    count = len(strings)
+    result = []
+    for d in dates:
+        if d is None:
+            result.append(None)
+            continue
+        offset = d.toordinal() - start
+        result.append(strings[offset] if 0 <= offset < count else _compute_hebrew_date_string(d))
+    return result
+
+def _compute_hebrew_date_string(date) -> str:
+    h_year, h_month, h_day = hebrew.from_gregorian(date.year, date.month, date.day)
+    return _format_hebrew_date(h_year, h_month, h_day)
+
+def get_hebrew_date_string(date: datetime) -> str:
+    return get_calendar().hebrew_date_string(date) or _compute_hebrew_date_string(date)
+
+
+def get_parsha_string(gregorian_dt: datetime):
+    """Gets the weekly Parsha for a given Gregorian date (if it's Shabbat) from the calendar table."""
+    if gregorian_dt.weekday() != 5: # Check if it's Shabbat (Saturday == 5)
         return None # Not Shabbat
-    except Exception as e:
-        print(f"Error getting Parsha with hdate: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
\ No newline at end of file
+    calendar = get_calendar()
+    if calendar.covers(gregorian_dt):
+        parsha_str = calendar.parasha(gregorian_dt)
+        holiday_info = calendar.holiday(gregorian_dt)
+    else:
+        d = gregorian_dt.date() if isinstance(gregorian_dt, datetime) else gregorian_dt
+        parsha_str = _parasha_names([d])[0]
+        h_year, h_month, h_day = hebrew.from_gregorian(d.year, d.month, d.day)
+        holiday_info = _holiday_name(h_year, h_month, h_day, 5)
+    if parsha_str:
+        return parsha_str
+    if holiday_info:
+        return holiday_info # Return the holiday name
+    return "Shabbat (No specific Parsha/Holiday found)" # Fallback
+
+
+def get_hebrew_year(date: datetime) -> int:
+    """Returns the Hebrew year (e.g. 5785) that the given Gregorian date falls in."""
+    hebrew_date = get_calendar().hebrew_date(date)
+    if hebrew_date:
+        return hebrew_date[0]
+    return hebrew.from_gregorian(date.year, date.month, date.day)[0]
+
+
+def hebrew_year_bounds(h_year: int):
+    """
+    Returns (start, end) Gregorian datetimes for a Hebrew year.
+    The year runs from 1 Tishrei (inclusive) to 1 Tishrei of the next year (exclusive).
+    """
+    start = datetime(*hebrew.to_gregorian(h_year, 7, 1))
+    end = datetime(*hebrew.to_gregorian(h_year + 1, 7, 1))
+    return start, end
@@ -0,0 +1,159 @@
+# file: app/utils/hot_path_bench.py
+# Timings of the hot paths on a synthetic database (used by `flask bench-hot-paths`).
+# Results are compared against a JSON baseline; a median that got slower than
+# the tolerance allows is reported as a regression.
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from sqlalchemy import func, select
+from app import db
+from app.models import Buyer, Item, Purchase
+
+BenchStats = namedtuple('BenchStats', ['name', 'rounds', 'median_ms', 'p95_ms', 'min_ms', 'cpu_ms', 'alloc_kb'])
+Regression = namedtuple('Regression', ['name', 'baseline_ms', 'median_ms', 'ratio'])
+
+# Differences below this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 1.0
+
+
+def _time(fn, rounds: int):
+    """Wall-clock and CPU milliseconds per call."""
+    fn() # Warm-up: lazy imports, font registration, caches
+    wall, cpu = [], []
+    for _ in range(rounds):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        fn()
+        wall.append((time.perf_counter() - start) * 1000)
+        cpu.append((time.process_time() - start_cpu) * 1000)
+    return wall, cpu
+
+
+def _peak_alloc_kb(fn, rounds: int = 3) -> float:
+    """Median peak of Python allocations during one call (tracemalloc; slow, so timed separately)."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(rounds):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+    finally:
+        tracemalloc.stop()
+    return statistics.median(peaks)
+
+
+def _stats(name: str, wall: list, cpu: list, alloc_kb=None) -> BenchStats:
+    ordered = sorted(wall)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return BenchStats(name, len(ordered), statistics.median(ordered), p95, ordered[0],
+                      statistics.median(cpu), alloc_kb)
+
+
+def _busiest(column):
+    """The id with the most purchases in column (busiest event, most active buyer, ...)."""
+    return db.session.execute(
+        select(column).group_by(column).order_by(func.count(Purchase.id).desc()).limit(1)
+    ).scalar()
+
+
+def hot_paths(app, client):
+    """
+    (name, callable, heavy) for every hot path. client must be logged in as an
+    admin; heavy paths (PDF, card sheets) run fewer rounds.
+    """
+    from app.routes.scanning import _get_list
+    from app.utils.barcode_utils import generate_barcode_uri, generate_next_barcode_id
+    from app.utils.pdf_utils import generate_pdf_report
+    from app.utils.report_utils import (
+        get_event_report_rows, buyer_summary_select, item_summary_select, stream_rows
+    )
+    from app.models import Event
+
+    event_id = _busiest(Purchase.event_id)
+    buyer_id = _busiest(Purchase.buyer_id)
+    event = db.session.get(Event, event_id)
+    buyer_barcode = db.session.get(Buyer, buyer_id).barcode_id
+    item_barcode = db.session.scalars(select(Item.barcode_id).where(Item.is_unique.is_(False)).limit(1)).first()
+    client.get(f'/scan/event/{event_id}')
+
+    def scan_cycle():
+        # Buyer, item, price: the price scan completes a pending purchase
+        for barcode in (f'BUYER:{buyer_barcode}', f'ITEM:{item_barcode}', 'PRICE:18'):
+            response = client.post('/scan/process_scan', json={'barcode': barcode})
+            assert response.status_code == 200, response.status_code
+
+    def get(url):
+        def fetch():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return fetch
+
+    def in_request(fn):
+        def call():
+            with app.test_request_context():
+                fn()
+        return call
+
+    return [
+        ('process_scan (buyer+item+price)', scan_cycle, False),
+        ('_get_list', in_request(lambda: _get_list(event_id)), False),
+        ('generate_pdf_report', in_request(lambda: generate_pdf_report(event, get_event_report_rows(event_id))), True),
+        ('generate_barcode_uri', lambda: generate_barcode_uri(f'BUYER:{buyer_barcode}'), False),
+        ('generate_next_barcode_id', lambda: (generate_next_barcode_id('B'), generate_next_barcode_id('I')), False),
+        ('buyer summary', in_request(lambda: list(stream_rows(buyer_summary_select(event_id)))), False),
+        ('item summary', in_request(lambda: list(stream_rows(item_summary_select(event_id)))), False),
+        ('buyer_card', get(f'/admin/buyer/{buyer_id}/card'), False),
+        ('print_cards', get('/admin/print_cards'), True),
+    ]
+
+
+def run_hot_path_benchmarks(app, client, rounds: int = 20, only=None, alloc: bool = False) -> list:
+    """
+    Times every hot path (or those whose name contains one of only); returns
+    BenchStats. With alloc, also measures the peak allocations per call.
+    """
+    results = []
+    for name, fn, heavy in hot_paths(app, client):
+        if only and not any(part in name for part in only):
+            continue
+        wall, cpu = _time(fn, max(1, rounds // 5) if heavy else rounds)
+        results.append(_stats(name, wall, cpu, _peak_alloc_kb(fn, 1 if heavy else 3) if alloc else None))
+    return results
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: list, volumes: dict):
+    """Writes the medians (and the data volumes they were measured on) as the new baseline."""
+    data = {
+        'volumes': volumes,
+        'results': {
+            r.name: {'median_ms': round(r.median_ms, 3), 'p95_ms': round(r.p95_ms, 3), 'cpu_ms': round(r.cpu_ms, 3),
+                     'alloc_kb': round(r.alloc_kb, 1) if r.alloc_kb is not None else None}
+            for r in results
+        },
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def find_regressions(baseline: dict, results: list, tolerance: float) -> list:
+    """Results whose median exceeds the baseline median by more than tolerance (0.25 = 25%)."""
+    regressions = []
+    for r in results:
+        base = baseline.get('results', {}).get(r.name)
+        if not base:
+            continue
+        limit = base['median_ms'] * (1 + tolerance)
+        if r.median_ms > limit and r.median_ms - base['median_ms'] > NOISE_FLOOR_MS:
+            regressions.append(Regression(r.name, base['median_ms'], r.median_ms, r.median_ms / base['median_ms']))
+    return regressions
@@ -0,0 +1,54 @@
+# file: app/utils/name_keys.py
+# Normalized name keys, for matching names typed by other people (bank
+# statements, imports) to buyers. The key ignores niqqud, punctuation, case,
+# final letter forms, honorifics and word order, so "הרב כהן, משה" and
+# "משה כהן" get the same key. Buyer.name_key stores it and is indexed; the
+# listeners below keep it current for ORM writes, fill_missing_name_keys()
+# catches rows inserted with Core (seed-synthetic, migrations).
+import re
+import unicodedata
+from sqlalchemy import bindparam, event, select, update
+from app.models import Buyer
+
+_FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+_NON_WORD = re.compile(r'[^\w\s]|_')
+# Titles and words around a name that don't tell buyers apart
+HONORIFICS = frozenset({
+    'ר', 'רב', 'הרב', 'מר', 'גב', 'גברת', 'משפ', 'משפחת', 'הגאון', 'רבי',
+    'mr', 'mrs', 'ms', 'dr', 'rabbi', 'family',
+})
+
+_buyers = Buyer.__table__
+
+
+def name_tokens(name: str) -> list:
+    """The name's normalized words, honorifics dropped, in their original order."""
+    if not name:
+        return []
+    text = ''.join(ch for ch in unicodedata.normalize('NFKD', name) if unicodedata.category(ch) != 'Mn')
+    text = _NON_WORD.sub(' ', text.casefold().translate(_FINAL_LETTERS))
+    return [token for token in text.split() if token not in HONORIFICS]
+
+
+def name_key(name: str):
+    """The order-independent key of a name, or None if nothing is left of it."""
+    tokens = name_tokens(name)
+    return ' '.join(sorted(tokens)) if tokens else None
+
+
+def fill_missing_name_keys(conn) -> int:
+    """Sets name_key on buyers that have none; returns how many were set."""
+    rows = conn.execute(select(_buyers.c.id, _buyers.c.name).where(_buyers.c.name_key.is_(None))).all()
+    updates = [{'buyer': buyer_id, 'key': name_key(name)} for buyer_id, name in rows]
+    updates = [row for row in updates if row['key']]
+    if updates:
+        # updated_at is kept: a new key is not a change the scanner catalog has to resend
+        conn.execute(update(_buyers).where(_buyers.c.id == bindparam('buyer'))
+                     .values(name_key=bindparam('key'), updated_at=_buyers.c.updated_at), updates)
+    return len(updates)
+
+
+@event.listens_for(Buyer, 'before_insert')
+@event.listens_for(Buyer, 'before_update')
+def _set_name_key(mapper, connection, target):
+    target.name_key = name_key(target.name)
@@ -0,0 +1,156 @@
+# file: app/utils/payment_utils.py
+# Payments ledger and per-buyer balances. A purchase is a pledge; a payment is
+# recorded against a buyer and, when it pays a whole open pledge, that pledge.
+# buyer_balances holds pledged (current and archived purchases), paid and the
+# outstanding balance per buyer, so the balances list and the overdue sort are
+# one indexed read. Payments refresh their buyers' rows in the same
+# transaction; purchases come from the scanner hot path, which doesn't touch
+# balances, so the full table is refreshed on demand when purchases changed
+# (refresh_if_stale) or with `flask refresh-balances`.
+from datetime import datetime
+from sqlalchemy import bindparam, delete, func, insert, literal, select, union, update
+from app.models import ArchivedBuyerTotal, AuctionLot, Buyer, BuyerBalance, Payment, Purchase
+
+# Outstanding amounts below this count as paid (float sums of agorot)
+EPSILON = 0.005
+# Ids per IN (...) list, well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+PAYMENT_METHODS = [('bank', 'Bank transfer'), ('cash', 'Cash'), ('check', 'Check'), ('card', 'Credit card')]
+
+_buyers, _purchases, _payments, _balances, _archived, _lots = (
+    Buyer.__table__, Purchase.__table__, Payment.__table__, BuyerBalance.__table__, ArchivedBuyerTotal.__table__,
+    AuctionLot.__table__
+)
+
+_INSERT_PAYMENT = insert(_payments)
+
+# Changes when purchases are added or deleted, or a year is archived
+_PURCHASES_MARK = select(
+    select(func.count()).select_from(_purchases).scalar_subquery(),
+    select(func.max(_purchases.c.id)).scalar_subquery(),
+    select(func.count()).select_from(_archived).scalar_subquery(),
+)
+_mark = {'purchases': None} # Mark at the last full refresh in this process
+
+_BUYER_PAID = select(func.coalesce(func.sum(_payments.c.amount), 0.0))\
+    .where(_payments.c.buyer_id == bindparam('buyer_id'))
+
+
+def chunks(values, size: int = CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# --- Pledges ---
+
+def open_pledges(conn, buyer_ids=None, amounts=None) -> list:
+    """
+    [(purchase_id, buyer_id, outstanding)] of pledges not fully paid, oldest
+    first, for the given buyers or (as a prefilter) pledged amounts.
+    """
+    paid = select(_payments.c.purchase_id, func.sum(_payments.c.amount).label('paid'))\
+        .where(_payments.c.purchase_id.is_not(None)).group_by(_payments.c.purchase_id).subquery()
+    outstanding = (_purchases.c.total_price - func.coalesce(paid.c.paid, 0.0)).label('outstanding')
+    query = select(_purchases.c.id, _purchases.c.buyer_id, outstanding)\
+        .outerjoin(paid, paid.c.purchase_id == _purchases.c.id)\
+        .where(outstanding > EPSILON).order_by(_purchases.c.timestamp, _purchases.c.id)
+    if buyer_ids is None and amounts is None:
+        return [tuple(row) for row in conn.execute(query)]
+    column, values = (_purchases.c.buyer_id, buyer_ids) if buyer_ids is not None else (_purchases.c.total_price, amounts)
+    rows = []
+    for chunk in chunks(set(values)):
+        rows.extend(tuple(row) for row in conn.execute(query.where(column.in_(chunk))))
+    return rows
+
+
+def pick_pledge(pledges: list, amount: float):
+    """
+    Takes the oldest pledge in pledges ([purchase_id, outstanding] lists, changed
+    in place) whose outstanding amount equals amount; None pays on account.
+    """
+    for pledge in pledges:
+        if abs(pledge[1] - amount) < EPSILON:
+            pledge[1] = 0.0
+            return pledge[0]
+    return None
+
+
+def add_payment(conn, **fields) -> int:
+    """Inserts one payment in the current transaction (paying a matching open pledge) and refreshes the buyer's balance."""
+    if 'purchase_id' not in fields:
+        pledges = [[purchase_id, outstanding] for purchase_id, _, outstanding
+                   in open_pledges(conn, buyer_ids=[fields['buyer_id']])]
+        fields['purchase_id'] = pick_pledge(pledges, fields['amount'])
+    fields.setdefault('created_at', datetime.utcnow())
+    payment_id = conn.execute(_INSERT_PAYMENT, fields).inserted_primary_key[0]
+    refresh_balances(conn, [fields['buyer_id']])
+    return payment_id
+
+
+def release_pledges(conn, purchase_ids) -> set:
+    """
+    Unlinks payments and sold auction lots from purchases about to be deleted
+    (purchase_ids: a list or a SELECT of ids), in the current transaction.
+    SQLite doesn't enforce the foreign keys, so a payment would otherwise keep
+    pointing at the id and settle whatever purchase gets it next; it stays
+    with its buyer, paid on account. Returns the buyers whose balances change
+    once the purchases are gone (the caller refreshes them after deleting).
+    """
+    buyer_ids = set(conn.execute(union(
+        select(_purchases.c.buyer_id).where(_purchases.c.id.in_(purchase_ids)),
+        select(_payments.c.buyer_id).where(_payments.c.purchase_id.in_(purchase_ids)),
+    )).scalars())
+    conn.execute(update(_payments).where(_payments.c.purchase_id.in_(purchase_ids)).values(purchase_id=None))
+    conn.execute(update(_lots).where(_lots.c.purchase_id.in_(purchase_ids)).values(purchase_id=None))
+    return buyer_ids
+
+
+def buyer_paid(conn, buyer_id: int) -> float:
+    return conn.execute(_BUYER_PAID, {'buyer_id': buyer_id}).scalar()
+
+
+# --- Balances ---
+
+def _balance_rows(buyer_ids=None):
+    """SELECT of buyer_balances rows, for all buyers or the given ones."""
+    def totals(table, amount):
+        query = select(table.c.buyer_id, func.sum(amount).label('total')).group_by(table.c.buyer_id)
+        if buyer_ids is not None:
+            query = query.where(table.c.buyer_id.in_(buyer_ids))
+        return query.subquery()
+
+    pledged, archived, paid = totals(_purchases, _purchases.c.total_price), totals(_archived, _archived.c.total),\
+        totals(_payments, _payments.c.amount)
+    pledged_total = func.coalesce(pledged.c.total, 0.0) + func.coalesce(archived.c.total, 0.0)
+    paid_total = func.coalesce(paid.c.total, 0.0)
+    query = select(_buyers.c.id, pledged_total, paid_total, pledged_total - paid_total, literal(datetime.utcnow()))\
+        .outerjoin(pledged, pledged.c.buyer_id == _buyers.c.id)\
+        .outerjoin(archived, archived.c.buyer_id == _buyers.c.id)\
+        .outerjoin(paid, paid.c.buyer_id == _buyers.c.id)
+    if buyer_ids is not None:
+        query = query.where(_buyers.c.id.in_(buyer_ids))
+    return query
+
+
+def refresh_balances(conn, buyer_ids=None) -> None:
+    """Recomputes buyer_balances rows (all of them without buyer_ids) in the current transaction."""
+    columns = ['buyer_id', 'pledged', 'paid', 'balance', 'refreshed_at']
+    if buyer_ids is None:
+        conn.execute(delete(_balances))
+        conn.execute(insert(_balances).from_select(columns, _balance_rows()))
+        return
+    for chunk in chunks(set(buyer_ids)):
+        conn.execute(delete(_balances).where(_balances.c.buyer_id.in_(chunk)))
+        conn.execute(insert(_balances).from_select(columns, _balance_rows(chunk)))
+
+
+def refresh_if_stale(conn, force: bool = False) -> bool:
+    """Refreshes all balances if purchases changed since the last full refresh; True if it did."""
+    mark = tuple(conn.execute(_PURCHASES_MARK).one())
+    if not force and mark == _mark['purchases']:
+        return False
+    refresh_balances(conn)
+    _mark['purchases'] = mark
+    return True
@@ -0,0 +1,273 @@
+# file: app/utils/pdf_render.py
+# ReportLab implementation behind app.utils.pdf_utils; imported on first use only.
+import io
+import os
+import logging
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_RIGHT, TA_CENTER
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from app.models import Event  # Type hinting
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from bidi.algorithm import get_display
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+# TTF font that supports Hebrew, resolved relative to this package (not the CWD)
+HEBREW_FONT_NAME = 'HebrewFont'
+HEBREW_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'David.ttf')
+
+def register_fonts():
+    """Registers the Hebrew TTF font with ReportLab (once per process)."""
+    if HEBREW_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(HEBREW_FONT_NAME, HEBREW_FONT_PATH))
+
+register_fonts()
+
+def _append_buyer_items(story: list, item_data: list, buyer_total: float, style):
+    """Appends one buyer's item table and subtotal line to the story."""
+    if not item_data:
+        return
+    item_table = Table(item_data, colWidths=[3.5 * inch, 1.0 * inch])
+    item_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    story.append(item_table)
+    subtotal_line = f" ₪{buyer_total:.2f}"+get_display("סה\"כ: ")
+    story.append(Paragraph(subtotal_line, style))
+    story.append(Spacer(1, 0.15 * inch))
+
+def generate_pdf_report(event: Event, report_rows):
+    """
+    Generates a PDF report in Hebrew with full RTL alignment.
+    report_rows is an iterable of ReportRow tuples (see report_utils),
+    already ordered and grouped by buyer with subtotals filled in.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            leftMargin=0.75 * inch, rightMargin=0.75 * inch,
+                            topMargin=0.75 * inch, bottomMargin=0.75 * inch)
+
+    # Base styles from ReportLab sample styles.
+    base_styles = getSampleStyleSheet()
+
+    # Custom paragraph styles for Hebrew (using right alignment).
+    hebrew_right = ParagraphStyle(
+        name='HebrewRight',
+        parent=base_styles['Normal'],
+        fontName='HebrewFont',
+        alignment=TA_RIGHT,
+        leading=16
+    )
+    hebrew_title = ParagraphStyle(
+        name='HebrewTitle',
+        parent=base_styles['h1'],
+        fontName='HebrewFont',
+        alignment=TA_CENTER,
+        leading=20
+    )
+    hebrew_subheader = ParagraphStyle(
+        name='HebrewSubheader',
+        parent=base_styles['h3'],
+        fontName='HebrewFont',
+        alignment=TA_RIGHT,
+        leading=16
+    )
+
+    story = []
+
+    # Process dynamic event text for RTL.
+    event_name_rtl = get_display(event.event_name)
+    details_rtl = get_display(event.details) if event.details else ""
+    
+    # Prepare Hebrew date: if event.hebrew_date is "N/A" or empty, omit it.
+    hebrew_date = event.hebrew_date if event.hebrew_date and event.hebrew_date.upper() != "N/A" else ""
+    date_str = f"{event.gregorian_date.strftime('%Y-%m-%d')}"
+    if hebrew_date:
+        date_str += f" ({hebrew_date})"
+    date_line = get_display(f"תאריך: {date_str}")
+
+    # --- Title ---
+    # Construct the title as "פרשת " + event name, then run get_display() on the whole title.
+    title_plain = f"פרשת {event.event_name}"
+    title_text = get_display(title_plain)
+    story.append(Paragraph(title_text, hebrew_title))
+    story.append(Paragraph(date_line, hebrew_right))
+    if details_rtl:
+        # Prepend a static label "פרטים:" to details.
+        details_line = details_rtl + get_display("פרטים: ") 
+        story.append(Paragraph(details_line, hebrew_right))
+    story.append(Spacer(1, 0.2 * inch))
+
+    # --- Buyers (rows arrive grouped by buyer with subtotals from SQL) ---
+    story.append(Spacer(1, 0.1 * inch))
+    item_data = []
+    buyer_total = 0.0
+    grand_total = None
+    for row in report_rows:
+        if row.buyer_row == 1:
+            _append_buyer_items(story, item_data, buyer_total, hebrew_right)
+            item_data = []
+            story.append(Paragraph(get_display(row.buyer_name), hebrew_subheader))
+            story.append(Spacer(1, 0.05 * inch))
+        buyer_total = row.buyer_total
+        grand_total = row.grand_total
+        original_item_name = row.item_name
+        if row.is_unique_item:
+            original_item_name = "*" + original_item_name
+        item_data.append([
+            Paragraph(f"₪{row.price:.0f}", hebrew_right),
+            Paragraph(get_display(original_item_name), hebrew_right)
+        ])
+    _append_buyer_items(story, item_data, buyer_total, hebrew_right)
+
+    if grand_total is not None:
+        grand_total_line = f" ₪{grand_total:.2f}" + get_display("סה\"כ לאירוע: ")
+        story.append(Paragraph(grand_total_line, hebrew_subheader))
+
+    # --- Build PDF ---
+    try:
+        doc.build(story)
+        buffer.seek(0)
+        return buffer
+    except Exception as e:
+        logger.error(f"Error building PDF: {e}", exc_info=True)
+        return None
+
+
+def generate_season_pdf_report(report):
+    """
+    Generates a Hebrew season statement PDF from a SeasonReport (see report_utils):
+    a per-event totals table followed by each buyer's season total.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            leftMargin=0.75 * inch, rightMargin=0.75 * inch,
+                            topMargin=0.75 * inch, bottomMargin=0.75 * inch)
+    base_styles = getSampleStyleSheet()
+    hebrew_right = ParagraphStyle(name='HebrewRight', parent=base_styles['Normal'],
+                                  fontName='HebrewFont', alignment=TA_RIGHT, leading=16)
+    hebrew_title = ParagraphStyle(name='HebrewTitle', parent=base_styles['h1'],
+                                  fontName='HebrewFont', alignment=TA_CENTER, leading=20)
+    hebrew_subheader = ParagraphStyle(name='HebrewSubheader', parent=base_styles['h3'],
+                                      fontName='HebrewFont', alignment=TA_RIGHT, leading=16)
+    table_style = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+    ])
+
+    story = [Paragraph(get_display(report.title), hebrew_title), Spacer(1, 0.2 * inch)]
+
+    # --- Totals per event ---
+    story.append(Paragraph(get_display("סיכום לפי אירוע"), hebrew_subheader))
+    event_data = [[Paragraph(get_display("סכום"), hebrew_right),
+                   Paragraph(get_display("תאריך"), hebrew_right),
+                   Paragraph(get_display("אירוע"), hebrew_right)]]
+    for event in report.events:
+        event_data.append([
+            Paragraph(f"₪{report.event_totals.get(event.id, 0.0):.2f}", hebrew_right),
+            Paragraph(event.gregorian_date.strftime('%Y-%m-%d'), hebrew_right),
+            Paragraph(get_display(event.event_name), hebrew_right),
+        ])
+    event_table = Table(event_data, colWidths=[1.2 * inch, 1.2 * inch, 3.5 * inch], repeatRows=1)
+    event_table.setStyle(table_style)
+    story.append(event_table)
+    story.append(Spacer(1, 0.25 * inch))
+
+    # --- Totals per buyer ---
+    story.append(Paragraph(get_display("סיכום לפי קונה"), hebrew_subheader))
+    buyer_data = [[Paragraph(get_display("סכום"), hebrew_right),
+                   Paragraph(get_display("אירועים"), hebrew_right),
+                   Paragraph(get_display("קונה"), hebrew_right)]]
+    for row in report.buyer_rows:
+        buyer_data.append([
+            Paragraph(f"₪{row.total:.2f}", hebrew_right),
+            Paragraph(str(row.count), hebrew_right),
+            Paragraph(get_display(row.name), hebrew_right),
+        ])
+    buyer_table = Table(buyer_data, colWidths=[1.2 * inch, 1.2 * inch, 3.5 * inch], repeatRows=1)
+    buyer_table.setStyle(table_style)
+    story.append(buyer_table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    grand_total_line = f" ₪{report.grand_total:.2f}" + get_display("סה\"כ לתקופה: ")
+    story.append(Paragraph(grand_total_line, hebrew_subheader))
+
+    try:
+        doc.build(story)
+        buffer.seek(0)
+        return buffer
+    except Exception as e:
+        logger.error(f"Error building season PDF: {e}", exc_info=True)
+        return None
+
+
+
+# Built once per process: statements are rendered by the thousand (see statement_utils)
+_statement_styles = {}
+
+def _get_statement_styles():
+    if not _statement_styles:
+        base_styles = getSampleStyleSheet()
+        _statement_styles.update(
+            title=ParagraphStyle(name='HebrewTitle', parent=base_styles['h1'],
+                                 fontName='HebrewFont', alignment=TA_CENTER, leading=20),
+            subheader=ParagraphStyle(name='HebrewSubheader', parent=base_styles['h3'],
+                                     fontName='HebrewFont', alignment=TA_RIGHT, leading=16),
+            right=ParagraphStyle(name='HebrewRight', parent=base_styles['Normal'],
+                                 fontName='HebrewFont', alignment=TA_RIGHT, leading=16),
+            table=TableStyle([
+                ('FONTNAME', (0, 0), (-1, -1), HEBREW_FONT_NAME),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+            ]),
+        )
+    return _statement_styles
+
+
+def generate_buyer_statement_pdf(statement):
+    """
+    Generates one buyer's Hebrew statement PDF from a BuyerStatement (see
+    statement_utils): every purchase of the season with its event, and the total.
+    Table cells are plain strings rather than Paragraphs, which are several
+    times slower to lay out.
+    """
+    styles = _get_statement_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            leftMargin=0.75 * inch, rightMargin=0.75 * inch,
+                            topMargin=0.75 * inch, bottomMargin=0.75 * inch)
+
+    story = [Paragraph(get_display(statement.title), styles['title']),
+             Paragraph(escape(get_display(statement.name)), styles['subheader'])]
+    if statement.barcode:
+        story.append(Paragraph(f" {statement.barcode}" + get_display("מספר קונה: "), styles['right']))
+    story.append(Spacer(1, 0.2 * inch))
+
+    line_data = [[get_display("סכום"), get_display("פריט"), get_display("אירוע"), get_display("תאריך")]]
+    for line in statement.lines:
+        line_data.append([f"₪{line.price:.2f}", get_display(line.item_name), get_display(line.event_name),
+                          line.event_date or ''])
+    line_table = Table(line_data, colWidths=[1.1 * inch, 2.2 * inch, 2.2 * inch, 1.2 * inch], repeatRows=1)
+    line_table.setStyle(styles['table'])
+    story.append(line_table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    total_line = f" ₪{statement.total:.2f}" + get_display("סה\"כ: ")
+    story.append(Paragraph(total_line, styles['subheader']))
+
+    try:
+        doc.build(story)
+        buffer.seek(0)
+        return buffer
+    except Exception as e:
+        logger.error(f"Error building statement PDF for buyer {statement.buyer_id}: {e}", exc_info=True)
+        return None
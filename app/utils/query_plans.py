@@ -0,0 +1,126 @@
+# file: app/utils/query_plans.py
+# EXPLAIN QUERY PLAN checks for the hot queries (run with `flask check-query-plans`).
+# Each entry mirrors a query the app runs on every scan or page view; a plan
+# that scans a whole table or sorts through a temp B-tree is a regression.
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import configure_mappers, joinedload
+from app import db
+from app.models import Event, Buyer, BuyerAlias, Item, Purchase, ArchivedBuyerTotal, ArchivedItemTotal
+
+PlanCheck = namedtuple('PlanCheck', ['name', 'ok', 'plan'])
+
+# Plan lines that mean "reads every row" or "sorts after reading"
+_BAD_PLAN_PREFIXES = ('SCAN ', 'USE TEMP B-TREE')
+
+# Queries allowed to walk an index in order: with ORDER BY ... LIMIT the walk
+# stops after LIMIT rows, so "SCAN t USING INDEX" is not a full read there.
+_ORDERED_INDEX_WALKS = frozenset(('events: dashboard', 'events: list page'))
+
+
+def _is_bad_line(name: str, line: str) -> bool:
+    if name in _ORDERED_INDEX_WALKS and line.startswith('SCAN ') and ' USING ' in line:
+        return False
+    return line.startswith(_BAD_PLAN_PREFIXES)
+
+
+def hot_queries(event_id=1, buyer_id=1, item_id=1, event_ids=(1, 2, 3)):
+    """(name, select) pairs for the hot queries, with sample parameters."""
+    configure_mappers() # Purchase.buyer/item/event are backrefs, set up when the mappers are configured
+    event_ids = list(event_ids)
+    return [
+        # routes/scanning.py
+        ('scan: buyer by barcode', select(Buyer.id, Buyer.name).where(Buyer.barcode_id == 'B1001').union_all(
+            select(Buyer.id, Buyer.name).join(BuyerAlias, BuyerAlias.buyer_id == Buyer.id)
+            .where(BuyerAlias.barcode_id == 'B1001')).limit(1)),
+        ('scan: item by barcode', select(Item).where(Item.barcode_id == 'I5001').limit(1)),
+        ('scan: unique item check', select(Purchase).where(
+            Purchase.event_id == event_id, Purchase.item_id == item_id).limit(1)),
+        ('scan: unique item bought by another buyer', select(Purchase).where(
+            Purchase.event_id == event_id, Purchase.item_id == item_id, Purchase.buyer_id != buyer_id).limit(1)),
+        ('scan: purchase list (_get_list)', select(Purchase).options(
+            joinedload(Purchase.buyer), joinedload(Purchase.item)
+        ).where(Purchase.event_id == event_id).order_by(Purchase.timestamp.asc())),
+        ('scan: buyer name exists', select(Buyer).where(func.lower(Buyer.name) == func.lower('Name')).limit(1)),
+        ('scan: item name exists', select(Item).where(func.lower(Item.name) == func.lower('Name')).limit(1)),
+        # routes/main.py
+        ('events: dashboard', select(Event).order_by(Event.gregorian_date.desc()).limit(5)),
+        ('events: list page', select(Event).order_by(Event.gregorian_date.desc()).limit(10).offset(10)),
+        ('events: season date range', select(Event.id).where(
+            Event.gregorian_date >= datetime(2025, 9, 23), Event.gregorian_date < datetime(2026, 9, 12))),
+        # routes/admin.py
+        ('buyer card: purchases', select(Purchase).options(
+            joinedload(Purchase.item), joinedload(Purchase.event)
+        ).where(Purchase.buyer_id == buyer_id).order_by(Purchase.timestamp.desc())),
+        ('buyer card: total', select(func.sum(Purchase.total_price)).where(Purchase.buyer_id == buyer_id)),
+        ('buyer card: archived total', select(func.sum(ArchivedBuyerTotal.total)).where(
+            ArchivedBuyerTotal.buyer_id == buyer_id)),
+        ('buyer delete: has purchases', select(Purchase.id).where(Purchase.buyer_id == buyer_id).limit(1)),
+        ('item history: recent', select(Purchase).options(
+            joinedload(Purchase.buyer), joinedload(Purchase.event)
+        ).where(Purchase.item_id == item_id).order_by(Purchase.timestamp.desc()).limit(50)),
+        ('item history: totals', select(func.count(Purchase.id), func.sum(Purchase.total_price)).where(
+            Purchase.item_id == item_id)),
+        ('item history: archived totals', select(func.sum(ArchivedItemTotal.total)).where(
+            ArchivedItemTotal.item_id == item_id)),
+        # utils/report_utils.py
+        ('reports: event has purchases', select(Purchase.id).where(Purchase.event_id == event_id).limit(1)),
+        ('reports: event fingerprints', select(
+            Purchase.event_id, func.count(Purchase.id), func.max(Purchase.id), func.sum(Purchase.total_price)
+        ).where(Purchase.event_id.in_(event_ids)).group_by(Purchase.event_id)),
+        ('reports: buyer totals per event', select(
+            Purchase.event_id, Purchase.buyer_id, func.sum(Purchase.total_price)
+        ).where(Purchase.event_id.in_(event_ids)).group_by(Purchase.event_id, Purchase.buyer_id)),
+        ('reports: item totals per event', select(
+            Purchase.event_id, Purchase.item_id, func.count(Purchase.id), func.sum(Purchase.total_price)
+        ).where(Purchase.event_id.in_(event_ids)).group_by(Purchase.event_id, Purchase.item_id)),
+    ]
+
+
+def explain(connection, statement):
+    """Returns the EXPLAIN QUERY PLAN detail lines for a select."""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def check_query_plans(connection):
+    """Runs EXPLAIN QUERY PLAN for every hot query; returns a list of PlanCheck."""
+    results = []
+    for name, statement in hot_queries():
+        plan = explain(connection, statement)
+        ok = not any(_is_bad_line(name, line) for line in plan)
+        results.append(PlanCheck(name, ok, plan))
+    return results
+
+
+def seeded_engine(path: str, events: int = 60, buyers: int = 400, items: int = 80, purchases: int = 20000):
+    """
+    Creates a SQLite database at path with the app schema and synthetic
+    rows, then runs ANALYZE so the planner sees realistic statistics.
+    """
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    rng = random.Random(5786)
+    start = datetime(2025, 9, 27)
+    with engine.begin() as conn:
+        conn.execute(insert(Event), [
+            {'id': i, 'event_name': f'Event {i}', 'gregorian_date': start + timedelta(days=7 * i)}
+            for i in range(1, events + 1)
+        ])
+        conn.execute(insert(Buyer), [
+            {'id': i, 'name': f'Buyer {i}', 'barcode_id': f'B{1000 + i}'} for i in range(1, buyers + 1)
+        ])
+        conn.execute(insert(Item), [
+            {'id': i, 'name': f'Item {i}', 'barcode_id': f'I{5000 + i}', 'is_unique': i % 5 == 0}
+            for i in range(1, items + 1)
+        ])
+        conn.execute(insert(Purchase), [
+            {'event_id': rng.randint(1, events), 'buyer_id': rng.randint(1, buyers),
+             'item_id': rng.randint(1, items), 'quantity': 1, 'total_price': float(rng.randint(1, 500)),
+             'timestamp': start + timedelta(minutes=i), 'is_manual_entry': False}
+            for i in range(purchases)
+        ])
+        conn.exec_driver_sql('ANALYZE')
+    return engine
@@ -0,0 +1,316 @@
+# file: app/utils/report_utils.py
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy import select, func, over, or_
+
+from app import db
+from app.models import Buyer, BuyerMerge, Item, Purchase, Event
+from app.utils.hebrew_date_utils import convert_many, hebrew_year_bounds
+from app.utils.archive_utils import archived_event_aggregates
+from app.utils.db_utils import read_connection
+
+logger = logging.getLogger(__name__)
+
+# Number of rows fetched from the cursor at a time when streaming report rows
+REPORT_FETCH_SIZE = 500
+
+# Lightweight row returned by get_event_report_rows (no dict per row)
+ReportRow = namedtuple('ReportRow', [
+    'buyer_id', 'buyer_name', 'item_name', 'price', 'is_unique_item',
+    'buyer_total', 'buyer_row', 'grand_total'
+])
+
+
+def _event_report_select(event_id: int):
+    """
+    Builds the grouped report query for one event.
+    Rows come back ordered by buyer, with per-buyer subtotals and the
+    event grand total computed by window functions in the database.
+    """
+    return select(
+        Buyer.id,
+        Buyer.name,
+        Item.name,
+        Purchase.total_price,
+        Item.is_unique,
+        over(func.sum(Purchase.total_price), partition_by=Purchase.buyer_id),
+        over(func.row_number(), partition_by=Purchase.buyer_id,
+             order_by=(Purchase.timestamp, Purchase.id)),
+        over(func.sum(Purchase.total_price)),
+    ).join(Buyer, Purchase.buyer_id == Buyer.id)\
+     .join(Item, Purchase.item_id == Item.id)\
+     .where(Purchase.event_id == event_id)\
+     .order_by(Buyer.name, Buyer.id, Purchase.timestamp, Purchase.id)
+
+
+def get_event_report_rows(event_id: int):
+    """
+    Streams the purchase rows of an event, already grouped by buyer.
+    Each ReportRow carries the buyer's subtotal (buyer_total), its 1-based
+    position inside the buyer group (buyer_row == 1 starts a new buyer)
+    and the event grand total, so callers only need to iterate.
+    """
+    with read_connection() as conn:
+        result = conn.execute(
+            _event_report_select(event_id),
+            execution_options={'yield_per': REPORT_FETCH_SIZE}
+        )
+        for row in result.tuples():
+            yield ReportRow._make(row)
+
+
+# --- Season / Date-Range Reports ---
+
+# Named holiday sets for season reports. An event belongs to a set when its
+# name or details mention one of the listed holidays.
+HOLIDAY_SETS = {
+    'high_holidays': ('ראש השנה', 'יום כיפור', 'יום הכיפורים', 'סוכות', 'שמיני עצרת', 'שמחת תורה'),
+    'pesach': ('פסח',),
+    'shavuot': ('שבועות',),
+    'all_holidays': ('ראש השנה', 'יום כיפור', 'יום הכיפורים', 'סוכות', 'שמיני עצרת',
+                     'שמחת תורה', 'פסח', 'שבועות', 'חנוכה', 'פורים'),
+}
+
+# One entry per event: (fingerprint, {buyer_id: total}, {item_id: (count, total)})
+_event_aggregate_cache = {}
+_event_aggregate_lock = threading.Lock()
+
+SeasonEvent = namedtuple('SeasonEvent', ['id', 'event_name', 'gregorian_date', 'hebrew_date'])
+SeasonRow = namedtuple('SeasonRow', ['id', 'name', 'per_event', 'count', 'total'])
+SeasonReport = namedtuple('SeasonReport', ['title', 'events', 'buyer_rows', 'item_rows', 'event_totals', 'grand_total'])
+
+
+def get_season_events(hebrew_year: int = None, start_date=None, end_date=None, holiday_set: str = None):
+    """
+    Returns the events of a season, ordered by date.
+    Either a Hebrew year or a Gregorian start/end date range (inclusive) selects
+    the span; holiday_set (a HOLIDAY_SETS key) further restricts it to holidays.
+    """
+    query = select(Event.id, Event.event_name, Event.gregorian_date, Event.hebrew_date)
+    if hebrew_year:
+        year_start, year_end = hebrew_year_bounds(hebrew_year)
+        query = query.where(Event.gregorian_date >= year_start, Event.gregorian_date < year_end)
+    if start_date:
+        query = query.where(func.date(Event.gregorian_date) >= start_date.isoformat())
+    if end_date:
+        query = query.where(func.date(Event.gregorian_date) <= end_date.isoformat())
+    if holiday_set:
+        names = HOLIDAY_SETS.get(holiday_set, ())
+        query = query.where(or_(*(
+            or_(Event.event_name.contains(name), Event.details.contains(name)) for name in names
+        )))
+    query = query.order_by(Event.gregorian_date, Event.id)
+    events = [SeasonEvent._make(row) for row in db.session.execute(query).tuples()]
+    # Label events saved without a Hebrew date in one batch from the calendar table
+    missing = [i for i, e in enumerate(events) if not e.hebrew_date and e.gregorian_date]
+    if missing:
+        labels = convert_many(events[i].gregorian_date for i in missing)
+        for i, label in zip(missing, labels):
+            events[i] = events[i]._replace(hebrew_date=label)
+    return events
+
+
+# Changes with every buyer merge and undo, which move purchases between buyers
+# without changing any event's count, max id or sum (see buyer_merge)
+_MERGE_MARK = select(func.count(BuyerMerge.id), func.count(BuyerMerge.undone_at))
+
+
+def _event_fingerprints(conn, event_ids):
+    """One grouped query returning {event_id: (count, max_id, sum, merges)} for change detection."""
+    query = select(
+        Purchase.event_id, func.count(Purchase.id), func.max(Purchase.id), func.sum(Purchase.total_price)
+    ).where(Purchase.event_id.in_(event_ids)).group_by(Purchase.event_id)
+    merges = tuple(conn.execute(_MERGE_MARK).one())
+    fingerprints = {event_id: (0, None, None, merges) for event_id in event_ids}
+    for event_id, count, max_id, total in conn.execute(query).tuples():
+        fingerprints[event_id] = (count, max_id, total, merges)
+    return fingerprints
+
+
+def get_event_aggregates(event_ids):
+    """
+    Returns {event_id: (buyer_totals, item_totals)} for the given events.
+    Per-event partial aggregates are cached; only events whose purchases
+    changed since the last call are recomputed, using one grouped query for
+    buyers and one for items across all of them.
+    """
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    with read_connection() as conn:
+        fingerprints = _event_fingerprints(conn, event_ids)
+
+        with _event_aggregate_lock:
+            stale = [eid for eid in event_ids
+                     if eid not in _event_aggregate_cache or _event_aggregate_cache[eid][0] != fingerprints[eid]]
+
+        if stale:
+            logger.info(f"Recomputing season aggregates for {len(stale)} of {len(event_ids)} events.")
+            buyer_totals = {eid: {} for eid in stale}
+            item_totals = {eid: {} for eid in stale}
+
+            buyer_query = select(
+                Purchase.event_id, Purchase.buyer_id, func.sum(Purchase.total_price)
+            ).where(Purchase.event_id.in_(stale)).group_by(Purchase.event_id, Purchase.buyer_id)
+            for event_id, buyer_id, total in conn.execute(buyer_query).tuples():
+                buyer_totals[event_id][buyer_id] = total
+
+            item_query = select(
+                Purchase.event_id, Purchase.item_id, func.count(Purchase.id), func.sum(Purchase.total_price)
+            ).where(Purchase.event_id.in_(stale)).group_by(Purchase.event_id, Purchase.item_id)
+            for event_id, item_id, count, total in conn.execute(item_query).tuples():
+                item_totals[event_id][item_id] = (count, total)
+
+            with _event_aggregate_lock:
+                for eid in stale:
+                    _event_aggregate_cache[eid] = (fingerprints[eid], buyer_totals[eid], item_totals[eid])
+
+    with _event_aggregate_lock:
+        return {eid: _event_aggregate_cache[eid][1:] for eid in event_ids}
+
+
+def invalidate_event_aggregates(event_id: int = None):
+    """Drops cached season aggregates for one event, or for all events."""
+    with _event_aggregate_lock:
+        if event_id is None:
+            _event_aggregate_cache.clear()
+        else:
+            _event_aggregate_cache.pop(event_id, None)
+
+
+def build_season_report(title: str, events: list) -> SeasonReport:
+    """
+    Builds the buyer x event and item x event pivots for a list of SeasonEvents.
+    Rows are sorted by name; per_event maps event_id to the buyer/item total
+    and event_totals maps event_id to the event's total.
+    Totals of archived years are merged in from the archived aggregate tables.
+    """
+    event_ids = [event.id for event in events]
+    aggregates = get_event_aggregates(event_ids)
+    for event_id, (archived_buyers, archived_items) in archived_event_aggregates(event_ids).items():
+        buyer_totals, item_totals = aggregates[event_id]
+        buyer_totals, item_totals = dict(buyer_totals), dict(item_totals) # Don't mutate the cache
+        for buyer_id, total in archived_buyers.items():
+            buyer_totals[buyer_id] = buyer_totals.get(buyer_id, 0.0) + total
+        for item_id, (count, total) in archived_items.items():
+            hot_count, hot_total = item_totals.get(item_id, (0, 0.0))
+            item_totals[item_id] = (hot_count + count, hot_total + total)
+        aggregates[event_id] = (buyer_totals, item_totals)
+
+    buyer_pivot, item_pivot = {}, {}
+    for event_id, (buyer_totals, item_totals) in aggregates.items():
+        for buyer_id, total in buyer_totals.items():
+            buyer_pivot.setdefault(buyer_id, {})[event_id] = total
+        for item_id, (count, total) in item_totals.items():
+            item_pivot.setdefault(item_id, {})[event_id] = (count, total)
+
+    buyer_names = dict(db.session.execute(
+        select(Buyer.id, Buyer.name).where(Buyer.id.in_(list(buyer_pivot)))
+    ).tuples().all()) if buyer_pivot else {}
+    item_names = dict(db.session.execute(
+        select(Item.id, Item.name).where(Item.id.in_(list(item_pivot)))
+    ).tuples().all()) if item_pivot else {}
+
+    buyer_rows = sorted((
+        SeasonRow(buyer_id, buyer_names.get(buyer_id, 'Unknown Buyer'), per_event,
+                  len(per_event), sum(per_event.values()))
+        for buyer_id, per_event in buyer_pivot.items()
+    ), key=lambda row: (row.name, row.id))
+    item_rows = sorted((
+        SeasonRow(item_id, item_names.get(item_id, 'Unknown Item'),
+                  {eid: total for eid, (count, total) in per_event.items()},
+                  sum(count for count, total in per_event.values()),
+                  sum(total for count, total in per_event.values()))
+        for item_id, per_event in item_pivot.items()
+    ), key=lambda row: (row.name, row.id))
+
+    event_totals = {
+        event_id: sum(buyer_totals.values()) for event_id, (buyer_totals, item_totals) in aggregates.items()
+    }
+    grand_total = sum(event_totals.values())
+    return SeasonReport(title, events, buyer_rows, item_rows, event_totals, grand_total)
+
+
+# --- Export Queries (streamed by export_utils) ---
+
+BUYER_SUMMARY_HEADER = ['Buyer Name', 'Total Pledged/Purchased (NIS)']
+ITEM_SUMMARY_HEADER = ['Item Name', 'Times Purchased', 'Total Raised (NIS)']
+LEDGER_HEADER = [
+    'Purchase ID', 'Event', 'Event Date', 'Buyer Name', 'Buyer Barcode', 'Item Name',
+    'Item Barcode', 'Quantity', 'Price (NIS)', 'Timestamp', 'Manual Entry', 'Notes'
+]
+
+
+def buyer_summary_select(event_id: int):
+    """Per-buyer totals for one event, ordered by buyer name."""
+    return select(Buyer.name, func.sum(Purchase.total_price))\
+        .join(Purchase, Buyer.id == Purchase.buyer_id)\
+        .where(Purchase.event_id == event_id)\
+        .group_by(Buyer.id, Buyer.name)\
+        .order_by(Buyer.name)
+
+
+def item_summary_select(event_id: int):
+    """Per-item purchase counts and totals for one event, ordered by item name."""
+    return select(Item.name, func.count(Purchase.id), func.sum(Purchase.total_price))\
+        .join(Purchase, Item.id == Purchase.item_id)\
+        .where(Purchase.event_id == event_id)\
+        .group_by(Item.id, Item.name)\
+        .order_by(Item.name)
+
+
+def ledger_select(event_id: int = None, event_ids=None, start_date=None, end_date=None):
+    """
+    Raw purchase ledger (one row per purchase) for an event, a list of events
+    or a date range (inclusive, by event date), ordered by event date and purchase time.
+    """
+    query = select(
+        Purchase.id, Event.event_name, func.date(Event.gregorian_date), Buyer.name, Buyer.barcode_id,
+        Item.name, Item.barcode_id, Purchase.quantity, Purchase.total_price,
+        Purchase.timestamp, Purchase.is_manual_entry, Purchase.manual_entry_notes
+    ).join(Event, Purchase.event_id == Event.id)\
+     .join(Buyer, Purchase.buyer_id == Buyer.id)\
+     .join(Item, Purchase.item_id == Item.id)
+    if event_id is not None:
+        query = query.where(Purchase.event_id == event_id)
+    if event_ids is not None:
+        query = query.where(Purchase.event_id.in_(list(event_ids)))
+    if start_date:
+        query = query.where(func.date(Event.gregorian_date) >= start_date.isoformat())
+    if end_date:
+        query = query.where(func.date(Event.gregorian_date) <= end_date.isoformat())
+    return query.order_by(Event.gregorian_date, Event.id, Purchase.timestamp, Purchase.id)
+
+
+def stream_rows(query, fetch_size: int = REPORT_FETCH_SIZE):
+    """
+    Executes a Core select on a reader connection and yields plain tuples,
+    fetching from the cursor in batches.
+    """
+    with read_connection() as conn:
+        result = conn.execute(query, execution_options={'yield_per': fetch_size})
+        yield from result.tuples()
+
+
+EVENT_DETAIL_HEADER = ['Buyer Name', 'Buyer Barcode', 'Item Name', 'Unique Item', 'Quantity',
+                       'Price (NIS)', 'Timestamp', 'Manual Entry', 'Notes']
+
+
+def event_detail_select(event_id: int, order_by: str = 'buyer', manual_only: bool = False):
+    """
+    Purchase detail rows for one event (EVENT_DETAIL_HEADER columns),
+    ordered by buyer or by item, optionally limited to manual entries.
+    """
+    query = select(
+        Buyer.name, Buyer.barcode_id, Item.name, Item.is_unique, Purchase.quantity,
+        Purchase.total_price, Purchase.timestamp, Purchase.is_manual_entry, Purchase.manual_entry_notes
+    ).join(Buyer, Purchase.buyer_id == Buyer.id)\
+     .join(Item, Purchase.item_id == Item.id)\
+     .where(Purchase.event_id == event_id)
+    if manual_only:
+        query = query.where(Purchase.is_manual_entry.is_(True))
+    if order_by == 'item':
+        return query.order_by(Item.name, Item.id, Purchase.timestamp, Purchase.id)
+    return query.order_by(Buyer.name, Buyer.id, Purchase.timestamp, Purchase.id)
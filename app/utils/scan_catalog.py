@@ -0,0 +1,123 @@
+# file: app/utils/scan_catalog.py
+# Versioned buyer/item catalog for the scanner page (GET /scan/catalog), which
+# resolves BUYER:/ITEM: scans without waiting for the server. The version is the
+# latest change time of buyers, items and tombstones in microseconds. A client
+# that sends ?since=<version> gets only the rows changed since then plus the
+# barcodes that left the catalog. Those are recorded as tombstones by the
+# listeners below (deleted rows, changed barcodes) and kept for TOMBSTONE_DAYS;
+# a client older than that gets the full catalog again. Barcodes of merged
+# buyers (see buyer_merge) are sent as rows of the buyer they were merged into,
+# along with that buyer's row.
+import hashlib
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import attributes
+from app.models import Buyer, BuyerAlias, Item, Purchase, CatalogTombstone
+
+TOMBSTONE_DAYS = 30
+# Rows stamped this long before the client's version are sent again: a transaction
+# can stamp its rows, then commit after another client already read a later version
+DELTA_OVERLAP = timedelta(seconds=5)
+
+_buyers = Buyer.__table__
+_aliases = BuyerAlias.__table__
+_items = Item.__table__
+_purchases = Purchase.__table__
+_tombstones = CatalogTombstone.__table__
+
+_EPOCH = datetime(1970, 1, 1)
+
+_HEAD = select(
+    select(func.max(_buyers.c.updated_at)).scalar_subquery(),
+    select(func.max(_items.c.updated_at)).scalar_subquery(),
+    select(func.max(_tombstones.c.removed_at)).scalar_subquery(),
+    select(func.count()).select_from(_buyers).scalar_subquery(),
+    select(func.count()).select_from(_items).scalar_subquery(),
+)
+
+
+def _to_version(ts) -> int:
+    return (ts - _EPOCH) // timedelta(microseconds=1) if ts else 0
+
+
+def _from_version(version: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=version)
+
+
+def event_claims(conn, event_id: int) -> list:
+    """[[item_id, buyer_name]] for the unique items already bought at the event (first purchase wins)."""
+    first = select(_purchases.c.item_id, func.min(_purchases.c.id).label('purchase_id'))\
+        .join(_items, _items.c.id == _purchases.c.item_id)\
+        .where(_purchases.c.event_id == event_id, _items.c.is_unique.is_(True))\
+        .group_by(_purchases.c.item_id).subquery()
+    rows = conn.execute(
+        select(first.c.item_id, _buyers.c.name)
+        .join(_purchases, _purchases.c.id == first.c.purchase_id)
+        .join(_buyers, _buyers.c.id == _purchases.c.buyer_id)
+        .order_by(first.c.item_id)
+    )
+    return [list(row) for row in rows]
+
+
+def catalog_head(conn, event_id: int = None):
+    """
+    (version, claims, etag). The ETag covers the catalog version, the row
+    counts (which catch changes made outside the ORM) and the event's claims.
+    """
+    buyers_at, items_at, removed_at, buyer_count, item_count = conn.execute(_HEAD).one()
+    version = max(_to_version(buyers_at), _to_version(items_at), _to_version(removed_at))
+    claims = event_claims(conn, event_id) if event_id else []
+    key = json.dumps([version, buyer_count, item_count, event_id, claims], ensure_ascii=False)
+    return version, claims, hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def catalog_rows(conn, since: int = None):
+    """
+    (full, buyers, items, removed) where buyers are [barcode, id, name], items
+    [barcode, id, name, is_unique] and removed {'buyers': [...], 'items': [...]}
+    barcodes. With a usable since version only the changes are returned.
+    """
+    horizon = datetime.utcnow() - timedelta(days=TOMBSTONE_DAYS)
+    full = since is None or _from_version(since) < horizon
+    buyer_query = select(_buyers.c.barcode_id, _buyers.c.id, _buyers.c.name)
+    alias_query = select(_aliases.c.barcode_id, _buyers.c.id, _buyers.c.name)\
+        .join(_buyers, _buyers.c.id == _aliases.c.buyer_id)
+    item_query = select(_items.c.barcode_id, _items.c.id, _items.c.name, _items.c.is_unique)
+    removed = {'buyers': [], 'items': []}
+    if not full:
+        changed_after = _from_version(since) - DELTA_OVERLAP
+        buyer_query = buyer_query.where(_buyers.c.updated_at > changed_after)
+        alias_query = alias_query.where(_buyers.c.updated_at > changed_after)
+        item_query = item_query.where(_items.c.updated_at > changed_after)
+        for kind, barcode in conn.execute(
+                select(_tombstones.c.kind, _tombstones.c.barcode_id)
+                .where(_tombstones.c.removed_at > changed_after)
+                .order_by(_tombstones.c.id)):
+            removed[f'{kind}s'].append(barcode)
+    buyers = [list(row) for row in conn.execute(buyer_query.union_all(alias_query))]
+    items = [[barcode, item_id, name, bool(is_unique)] for barcode, item_id, name, is_unique in conn.execute(item_query)]
+    return full, buyers, items, removed
+
+
+# --- Tombstones ---
+
+def _tombstone(connection, target, barcode: str):
+    now = datetime.utcnow()
+    connection.execute(insert(_tombstones).values(
+        kind='buyer' if isinstance(target, Buyer) else 'item', barcode_id=barcode, removed_at=now))
+    connection.execute(delete(_tombstones).where(_tombstones.c.removed_at < now - timedelta(days=TOMBSTONE_DAYS)))
+
+
+@event.listens_for(Buyer, 'after_delete')
+@event.listens_for(Item, 'after_delete')
+def _row_deleted(mapper, connection, target):
+    _tombstone(connection, target, target.barcode_id)
+
+
+@event.listens_for(Buyer, 'after_update')
+@event.listens_for(Item, 'after_update')
+def _row_updated(mapper, connection, target):
+    for old_barcode in attributes.get_history(target, 'barcode_id').deleted or ():
+        if old_barcode and old_barcode != target.barcode_id:
+            _tombstone(connection, target, old_barcode)
@@ -0,0 +1,109 @@
+# file: app/utils/scan_dedupe.py
+# Server-side suppression of repeated scans. A keyboard-wedge scanner (or a
+# card held in front of the camera) can read the same barcode twice within a
+# fraction of a second: a second PRICE: read would double the total, a second
+# BUYER:/ITEM: read saves the pending purchase for nothing. Each station keeps a
+# ring of its last RING_SIZE sightings; a barcode seen again within its type's
+# window (SCAN_DUPLICATE_WINDOW_MS, measured from its latest sighting) is
+# suppressed. A scan that was rejected (ITEM: before BUYER:, a server error)
+# leaves no sighting, so the operator can scan the same code again at once.
+# Rings and counters live in the worker process, like the user cache.
+import threading
+import time
+from collections import OrderedDict, deque
+from flask import current_app
+
+RING_SIZE = 8
+# Bound on tracked stations; the least recently seen is dropped first
+MAX_STATIONS = 512
+
+_rings = OrderedDict() # station -> deque of (barcode, seconds since epoch)
+_lock = threading.Lock()
+_counters = {'checked': 0, 'suppressed': 0}
+_suppressed_by_type = {}
+
+
+def barcode_type(barcode: str) -> str:
+    """BUYER, ITEM, PRICE, CARD... (the prefix before the first colon)."""
+    prefix, sep, _ = barcode.partition(':')
+    return prefix.upper() if sep else 'OTHER'
+
+
+def is_repeat(sightings, barcode: str, at: float) -> bool:
+    """True if barcode's latest sighting (oldest first in sightings) is within its window before at."""
+    window_ms = current_app.config.get('SCAN_DUPLICATE_WINDOW_MS', {}).get(barcode_type(barcode), 0)
+    if window_ms <= 0:
+        return False
+    for seen, seen_at in reversed(sightings):
+        if seen == barcode:
+            return 0 <= (at - seen_at) * 1000 < window_ms
+    return False
+
+
+def _ring(station: str) -> deque:
+    """The station's ring, created if new and marked as recently used (lock held)."""
+    ring = _rings.get(station)
+    if ring is None:
+        ring = _rings[station] = deque(maxlen=RING_SIZE)
+        if len(_rings) > MAX_STATIONS:
+            _rings.popitem(last=False)
+    else:
+        _rings.move_to_end(station)
+    return ring
+
+
+def _count(barcode: str, suppressed: bool):
+    _counters['checked'] += 1
+    if suppressed:
+        _counters['suppressed'] += 1
+        kind = barcode_type(barcode)
+        _suppressed_by_type[kind] = _suppressed_by_type.get(kind, 0) + 1
+
+
+def suppress(station: str, barcode: str, at: float = None) -> bool:
+    """Checks and records a live scan in one step; True if it is a repeat to ignore."""
+    at = time.time() if at is None else at
+    with _lock:
+        ring = _ring(station)
+        repeat = is_repeat(ring, barcode, at)
+        ring.append((barcode, at))
+        _count(barcode, repeat)
+    return repeat
+
+
+def forget(station: str, barcode: str, at: float):
+    """Drops the sighting recorded by suppress(station, barcode, at), for a scan that was then rejected."""
+    with _lock:
+        ring = _rings.get(station)
+        if ring is not None:
+            try:
+                ring.remove((barcode, at))
+            except ValueError:
+                pass # Already pushed out of the ring
+
+
+def recent(station: str) -> list:
+    """A copy of the station's sightings, for checking a batch before it is committed."""
+    with _lock:
+        return list(_rings.get(station, ()))
+
+
+def remember(station: str, sightings: list, checked: list):
+    """
+    Stores a committed batch: sightings becomes the station's ring and checked
+    ([(barcode, suppressed)]) goes into the counters. A batch that is rolled
+    back and retried is therefore neither remembered nor counted twice.
+    """
+    with _lock:
+        ring = _ring(station)
+        ring.clear()
+        ring.extend(sightings[-RING_SIZE:])
+        for barcode, suppressed in checked:
+            _count(barcode, suppressed)
+
+
+def dedupe_stats() -> dict:
+    with _lock:
+        stats = dict(_counters, by_type=dict(_suppressed_by_type), stations=len(_rings))
+    stats['suppressed_rate'] = round(stats['suppressed'] / stats['checked'], 4) if stats['checked'] else None
+    return stats
@@ -0,0 +1,134 @@
+# file: app/utils/sql_profiler.py
+# Opt-in per-request SQL profiler (SQL_PROFILER=1). Records every statement a
+# request executes, groups them by normalized fingerprint to spot N+1 patterns,
+# logs slow or chatty requests and keeps per-route stats for /admin/sql_profile.
+import logging
+import re
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from app import db
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# {endpoint: stats dict}, see _record_request()
+_route_stats = {}
+_route_stats_lock = threading.Lock()
+
+
+def fingerprint(statement: str) -> str:
+    """Normalizes a SQL statement: literals -> ?, IN (?, ?, ...) -> IN (?...), collapsed whitespace."""
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def init_sql_profiler(app):
+    """Attaches the profiler to the app's engines when SQL_PROFILER is enabled."""
+    if not app.config.get('SQL_PROFILER'):
+        return
+    with app.app_context():
+        engines = [db.engine]
+    if app.extensions.get('sqlite_reader') is not None:
+        engines.append(app.extensions['sqlite_reader'])
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.teardown_request(_finish_request)
+    logger.info("SQL profiler enabled.")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_start')
+    if not starts or not has_request_context():
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    queries = g.setdefault('sql_profile', {})
+    key = fingerprint(statement)
+    count, total = queries.get(key, (0, 0.0))
+    queries[key] = (count + 1, total + elapsed)
+
+
+def _finish_request(exc=None):
+    """Runs after the response (including streamed bodies) is done."""
+    queries = g.pop('sql_profile', None)
+    if not queries:
+        return
+    from flask import current_app
+    config = current_app.config
+    endpoint = request.endpoint or request.path
+    query_count = sum(count for count, _ in queries.values())
+    sql_ms = sum(total for _, total in queries.values()) * 1000
+    repeated = {fp: count for fp, (count, _) in queries.items()
+                if count >= config.get('SQL_PROFILER_N_PLUS_ONE', 5)}
+
+    _record_request(endpoint, query_count, sql_ms, repeated)
+
+    slow = sql_ms >= config.get('SQL_PROFILER_SLOW_MS', 250)
+    chatty = query_count >= config.get('SQL_PROFILER_MAX_QUERIES', 25)
+    if slow or chatty or repeated:
+        reasons = [r for r, hit in (('slow', slow), ('chatty', chatty), ('N+1', repeated)) if hit]
+        logger.warning(f"SQL profile [{', '.join(reasons)}] {request.method} {endpoint}: "
+                       f"{query_count} queries, {sql_ms:.1f} ms in SQL")
+        for fp, count in sorted(repeated.items(), key=lambda kv: -kv[1]):
+            logger.warning(f"    {count}x {fp[:200]}")
+
+
+def _record_request(endpoint: str, query_count: int, sql_ms: float, repeated: dict):
+    with _route_stats_lock:
+        stats = _route_stats.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0, 'max_sql_ms': 0.0,
+            'n_plus_one_requests': 0, 'n_plus_one_patterns': {}
+        })
+        stats['requests'] += 1
+        stats['queries'] += query_count
+        stats['max_queries'] = max(stats['max_queries'], query_count)
+        stats['sql_ms'] += sql_ms
+        stats['max_sql_ms'] = max(stats['max_sql_ms'], sql_ms)
+        if repeated:
+            stats['n_plus_one_requests'] += 1
+            patterns = stats['n_plus_one_patterns']
+            for fp, count in repeated.items():
+                patterns[fp] = max(patterns.get(fp, 0), count)
+
+
+def worst_routes(limit: int = 20, sort: str = 'sql_ms'):
+    """Per-route stats, worst first. sort: 'sql_ms' (total time), 'avg_queries' or 'max_queries'."""
+    with _route_stats_lock:
+        rows = []
+        for endpoint, stats in _route_stats.items():
+            requests = stats['requests']
+            rows.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'avg_queries': round(stats['queries'] / requests, 1),
+                'max_queries': stats['max_queries'],
+                'sql_ms': round(stats['sql_ms'], 1),
+                'avg_sql_ms': round(stats['sql_ms'] / requests, 2),
+                'max_sql_ms': round(stats['max_sql_ms'], 1),
+                'n_plus_one_requests': stats['n_plus_one_requests'],
+                'n_plus_one_patterns': [
+                    {'count': count, 'statement': fp}
+                    for fp, count in sorted(stats['n_plus_one_patterns'].items(), key=lambda kv: -kv[1])[:5]
+                ],
+            })
+    key = sort if sort in ('sql_ms', 'avg_queries', 'max_queries') else 'sql_ms'
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:limit]
+
+
+def reset_stats():
+    with _route_stats_lock:
+        _route_stats.clear()
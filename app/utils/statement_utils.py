@@ -0,0 +1,218 @@
+# file: app/utils/statement_utils.py
+# Year-end donor statements: one Hebrew PDF per buyer listing all their
+# purchases of a season. The season's purchases (hot and archived) are read in
+# one scan ordered by buyer and cut into per-buyer statements as they arrive.
+# Rendering is CPU-bound ReportLab work, so statements are rendered by a pool
+# of processes, each of which imports pdf_render (and so registers the Hebrew
+# font) once when it starts. PDFs are written into a ZIP in the order they
+# complete, so the download starts with the first finished statements.
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, select
+from app import db
+from app.models import ArchivedBuyerTotal, Buyer, Event, Item, Purchase
+from app.utils.archive_utils import archived_statement_rows
+from app.utils.report_utils import stream_rows
+
+logger = logging.getLogger(__name__)
+
+# Statements sent to a worker process at a time
+STATEMENTS_PER_TASK = 8
+# Tasks queued per worker, so only a few statements wait in memory
+TASKS_PER_WORKER = 4
+
+# (buyer_id, buyer_name, buyer_barcode, event_date, event_name, item_name, price, timestamp);
+# archive_utils.archived_statement_rows yields the same shape
+StatementLine = namedtuple('StatementLine', ['event_date', 'event_name', 'item_name', 'price'])
+BuyerStatement = namedtuple('BuyerStatement', ['buyer_id', 'name', 'barcode', 'title', 'lines', 'total'])
+
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def _statement_select(event_ids):
+    """Purchase rows of the given events ordered by buyer, then event date and time."""
+    return select(
+        Purchase.buyer_id, Buyer.name, Buyer.barcode_id, func.date(Event.gregorian_date), Event.event_name,
+        Item.name, Purchase.total_price, Purchase.timestamp
+    ).join(Buyer, Purchase.buyer_id == Buyer.id)\
+     .join(Event, Purchase.event_id == Event.id)\
+     .join(Item, Purchase.item_id == Item.id)\
+     .where(Purchase.event_id.in_(list(event_ids)))\
+     .order_by(Purchase.buyer_id, Event.gregorian_date, Purchase.timestamp, Purchase.id)
+
+
+def count_statement_buyers(event_ids) -> int:
+    """Number of buyers with purchases (current or archived) in the given events."""
+    event_ids = list(event_ids)
+    if not event_ids:
+        return 0
+    hot = select(Purchase.buyer_id).where(Purchase.event_id.in_(event_ids))
+    archived = select(ArchivedBuyerTotal.buyer_id).where(ArchivedBuyerTotal.event_id.in_(event_ids))
+    return db.session.execute(select(func.count()).select_from(hot.union(archived).subquery())).scalar()
+
+
+def iter_buyer_statements(event_ids, title: str):
+    """
+    Yields one BuyerStatement per buyer (ordered by buyer id) from a single
+    ordered scan of the events' purchases, merged with their archived purchases.
+    """
+    event_ids = list(event_ids)
+    rows = heapq.merge(stream_rows(_statement_select(event_ids)), archived_statement_rows(event_ids),
+                       key=lambda row: (row[0], row[3], row[7] or datetime.min))
+    for buyer_id, buyer_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        first = next(buyer_rows)
+        lines = [StatementLine(row[3], row[4], row[5], row[6]) for row in itertools.chain((first,), buyer_rows)]
+        yield BuyerStatement(buyer_id, first[1], first[2], title, lines, sum(line.price for line in lines))
+
+
+def statement_filename(statement: BuyerStatement) -> str:
+    name = _UNSAFE_FILENAME.sub('_', statement.name).strip() or 'buyer'
+    return f"{statement.barcode or statement.buyer_id} {name}.pdf"
+
+
+# --- Rendering (runs in the worker processes) ---
+
+def _init_worker():
+    from app.utils import pdf_render # noqa: F401 (registers the Hebrew font once per process)
+
+
+def _render_batch(statements) -> list:
+    """[(filename, pdf bytes or None)] for a batch of statements."""
+    from app.utils import pdf_render
+    results = []
+    for statement in statements:
+        buffer = pdf_render.generate_buyer_statement_pdf(statement)
+        results.append((statement_filename(statement), buffer.getvalue() if buffer else None))
+    return results
+
+
+def render_statements(statements, total: int, workers: int = None):
+    """
+    Yields (filename, pdf bytes or None) for each statement, in completion
+    order. Batches are rendered by a process pool; only a few batches per
+    worker are taken from `statements` ahead of time. Small runs are rendered
+    in this process, where starting workers would cost more than it saves.
+    """
+    workers = workers or current_app.config.get('STATEMENT_WORKERS') or os.cpu_count() or 1
+    workers = min(workers, -(-total // STATEMENTS_PER_TASK))
+    batches = _batches(statements, STATEMENTS_PER_TASK)
+    if workers <= 1:
+        for batch in batches:
+            yield from _render_batch(batch)
+        return
+
+    # spawn, not fork: the server process has threads (and open database connections)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker)
+    try:
+        pending = {pool.submit(_render_batch, batch)
+                   for batch in itertools.islice(batches, workers * TASKS_PER_WORKER)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.add(pool.submit(_render_batch, batch))
+    finally:
+        # Also runs when the client goes away mid-download: drop the queued batches
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _batches(iterable, size: int):
+    iterator = iter(iterable)
+    return iter(lambda: list(itertools.islice(iterator, size)), [])
+
+
+# --- ZIP output ---
+
+class _ChunkSink:
+    """Write-only file object for zipfile that hands out what was written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def iter_statements_zip(event_ids, title: str, workers: int = None, progress=None):
+    """
+    Yields the bytes of a ZIP with one PDF per buyer, written as the statements
+    are rendered. progress(done, total, finished) is called after each statement.
+    Statements that fail to render are listed in errors.txt inside the ZIP.
+    """
+    total = count_statement_buyers(event_ids)
+    sink = _ChunkSink()
+    done, failed, names = 0, [], set()
+    start = time.perf_counter()
+    if progress:
+        progress(0, total, False)
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for filename, data in render_statements(iter_buyer_statements(event_ids, title), total, workers):
+            done += 1
+            if data is None:
+                failed.append(filename)
+            else:
+                while filename in names: # Two buyers with the same barcode and name
+                    filename = filename[:-4] + '_.pdf'
+                names.add(filename)
+                archive.writestr(filename, data)
+                yield sink.take()
+            if progress:
+                progress(done, total, False)
+        if failed:
+            archive.writestr('errors.txt', 'Statements that could not be generated:\n' + '\n'.join(failed) + '\n')
+    yield sink.take()
+    if progress:
+        progress(done, total, True)
+    logger.info(f"Buyer statements '{title}': {done - len(failed)} PDFs, {len(failed)} failed, "
+                f"{time.perf_counter() - start:.1f} s.")
+
+
+# --- Progress of web downloads (per worker process) ---
+
+_PROGRESS_TTL = 3600 # Seconds a finished job stays visible
+_progress = {} # token -> {'done', 'total', 'finished', 'updated'}
+_progress_lock = threading.Lock()
+
+
+def progress_tracker(token: str):
+    """A progress callback for iter_statements_zip that records the job under token (None: no tracking)."""
+    if not token:
+        return None
+    now = time.time()
+    with _progress_lock:
+        for key in [key for key, job in _progress.items() if now - job['updated'] > _PROGRESS_TTL]:
+            del _progress[key]
+
+    def progress(done: int, total: int, finished: bool):
+        with _progress_lock:
+            _progress[token] = {'done': done, 'total': total, 'finished': finished, 'updated': time.time()}
+    return progress
+
+
+def statement_progress(token: str):
+    """{'done', 'total', 'finished'} of a download started in this process, or None."""
+    with _progress_lock:
+        job = _progress.get(token)
+        return {key: job[key] for key in ('done', 'total', 'finished')} if job else None
@@ -0,0 +1,166 @@
+# file: app/utils/synthetic_data.py
+# Synthetic buyers, items, events and purchases for benchmarks and load tests
+# (used by `flask seed-synthetic` and `flask bench-hot-paths`). Rows are
+# written with batched Core INSERTs (~1M purchases in about a minute).
+import logging
+import random
+from collections import namedtuple
+from datetime import timedelta
+from itertools import accumulate
+from sqlalchemy import Integer, cast, func, insert, select
+from app.models import Event, Buyer, Item, Purchase
+from app.utils.event_utils import plan_season_events
+
+logger = logging.getLogger(__name__)
+
+SeedCounts = namedtuple('SeedCounts', ['events', 'buyers', 'items', 'purchases'])
+
+# Rows per executemany batch
+BATCH_SIZE = 20000
+
+FIRST_NAMES = (
+    'אברהם', 'יצחק', 'יעקב', 'משה', 'אהרן', 'דוד', 'שלמה', 'יוסף', 'בנימין', 'שמואל',
+    'אליהו', 'חיים', 'מרדכי', 'מנחם', 'ישראל', 'נחום', 'צבי', 'שמעון', 'לוי', 'יהודה',
+    'ראובן', 'גד', 'נפתלי', 'זבולון', 'אשר', 'יששכר', 'אפרים', 'מנשה', 'עזרא', 'נחמיה',
+    'דניאל', 'עמרם', 'פנחס', 'אלעזר', 'איתמר', 'יהושע', 'כלב', 'עובדיה', 'מיכאל', 'רפאל',
+)
+LAST_NAMES = (
+    'כהן', 'לוי', 'מזרחי', 'פרץ', 'ביטון', 'דהן', 'אברהמי', 'פרידמן', 'שפירא', 'גולדברג',
+    'רוזנברג', 'כץ', 'אזולאי', 'עמר', 'אוחיון', 'חדד', 'גבאי', 'יוסף', 'שטרן', 'ברגר',
+    'וייס', 'הלוי', 'אלמוג', 'בן דוד', 'שלום', 'סעדה', 'טננבאום', 'קליין', 'זילברמן', 'מלכה',
+    'נחמני', 'רבינוביץ', 'אשכנזי', 'ספרדי', 'תימני', 'גרוס', 'הורוביץ', 'לנדאו', 'מרגלית', 'ששון',
+)
+# (honor, is_unique, price weight): a unique honor is sold once per event;
+# honors weighted 2+ are pledged at that multiple of the usual amounts
+HONORS = (
+    ('פתיחת הארון', False, 1.0), ('הוצאה והכנסה', False, 0.8), ('כהן', False, 1.0),
+    ('לוי', False, 0.9), ('שלישי', False, 1.2), ('רביעי', False, 0.9), ('חמישי', False, 0.9),
+    ('שישי', False, 1.1), ('שביעי', False, 1.0), ('אחרון', False, 0.9), ('מפטיר', True, 2.0),
+    ('הגבהה', False, 0.8), ('גלילה', False, 0.6), ('אשרי', False, 0.5), ('ספר שני', False, 1.2),
+    ('חתן תורה', True, 6.0), ('חתן בראשית', True, 5.0), ('כל הנערים', True, 3.0),
+    ('קריאת מגילה', True, 2.5), ('שליח ציבור', False, 1.5),
+)
+PRAYERS = ('שחרית', 'מוסף', 'מנחה', 'ערבית', 'נעילה')
+# Pledges cluster on multiples of chai (18) and round numbers
+PRICES = (10, 18, 26, 36, 50, 54, 72, 100, 101, 118, 180, 200, 250, 360, 500, 1000, 1800)
+PRICE_WEIGHTS = (6, 25, 5, 18, 6, 7, 5, 12, 4, 3, 6, 3, 2, 3, 2, 1, 0.5)
+
+
+def _barcode_start(conn, model, prefix: str, starting_num: int) -> int:
+    """First free number after the highest existing barcode (like generate_next_barcode_id)."""
+    max_num = conn.execute(
+        select(func.max(cast(func.substr(model.barcode_id, len(prefix) + 1), Integer)))
+        .where(model.barcode_id.like(f'{prefix}%'))
+    ).scalar()
+    return max_num + 1 if max_num is not None else starting_num
+
+
+def _buyer_names(rng, count: int):
+    """Distinct Hebrew names: first name, father's name and family name (numbered on a clash)."""
+    names, seen = [], set()
+    for i in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} בן {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if name in seen:
+            name = f"{name} {i}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _item_rows(count: int, start_num: int):
+    rows = []
+    for i in range(count):
+        honor, is_unique, weight = HONORS[i % len(HONORS)]
+        prayer = PRAYERS[(i // len(HONORS)) % len(PRAYERS)]
+        round_no = i // (len(HONORS) * len(PRAYERS))
+        name = f"{honor} - {prayer}" + (f" {round_no + 1}" if round_no else '')
+        rows.append({'name': name, 'barcode_id': f'I{start_num + i}', 'is_unique': is_unique,
+                     '_weight': weight})
+    return rows
+
+
+def _event_plans(count: int, first_year: int):
+    plans, year = [], first_year
+    while len(plans) < count:
+        plans.extend(plan_season_events(year))
+        year += 1
+    return plans[:count]
+
+
+def seed_synthetic(engine, events: int = 60, buyers: int = 400, items: int = 80,
+                   purchases: int = 20000, first_year: int = 5780, seed: int = 5786) -> SeedCounts:
+    """
+    Appends synthetic rows to the database behind engine: the Shabbat and
+    holiday events of consecutive Hebrew years from first_year, buyers with
+    Hebrew names, honors as items and purchases with a pledge-like price
+    distribution. Unique items are sold at most once per event. New barcodes
+    continue after the highest existing ones.
+    """
+    rng = random.Random(seed)
+    with engine.begin() as conn:
+        buyer_start = _barcode_start(conn, Buyer, 'B', 1000)
+        item_start = _barcode_start(conn, Item, 'I', 5000)
+
+        plans = _event_plans(events, first_year)
+        first_event_id = (conn.execute(select(func.max(Event.id))).scalar() or 0) + 1
+        conn.execute(insert(Event), [
+            {'id': first_event_id + i, 'event_name': p.event_name, 'gregorian_date': p.gregorian_date,
+             'hebrew_date': p.hebrew_date, 'details': p.details}
+            for i, p in enumerate(plans)
+        ])
+
+        first_buyer_id = (conn.execute(select(func.max(Buyer.id))).scalar() or 0) + 1
+        conn.execute(insert(Buyer), [
+            {'id': first_buyer_id + i, 'name': name, 'barcode_id': f'B{buyer_start + i}'}
+            for i, name in enumerate(_buyer_names(rng, buyers))
+        ])
+
+        first_item_id = (conn.execute(select(func.max(Item.id))).scalar() or 0) + 1
+        item_rows = _item_rows(items, item_start)
+        weights = [row.pop('_weight') for row in item_rows]
+        conn.execute(insert(Item), [dict(row, id=first_item_id + i) for i, row in enumerate(item_rows)])
+
+        # A few regulars buy most honors: skew buyer choice towards low indexes
+        buyer_ids = range(first_buyer_id, first_buyer_id + buyers)
+        # (cumulative weights, so each draw is a bisect rather than a pass over the list)
+        buyer_weights = list(accumulate(1.0 / (1 + i / 25) for i in range(buyers)))
+        item_ids = list(range(first_item_id, first_item_id + items))
+        item_weights = list(accumulate(1.0 / w for w in weights)) # Pricey honors are bought less often
+        price_weights = list(accumulate(PRICE_WEIGHTS))
+        unique_items = {first_item_id + i for i, row in enumerate(item_rows) if row['is_unique']}
+        fallback_item = next((i for i in item_ids if i not in unique_items), None)
+        sold_unique = set()
+
+        batch, written = [], 0
+        for _ in range(purchases):
+            plan_index = rng.randrange(len(plans))
+            item_id = rng.choices(item_ids, cum_weights=item_weights)[0]
+            event_id = first_event_id + plan_index
+            if item_id in unique_items:
+                if (event_id, item_id) not in sold_unique:
+                    sold_unique.add((event_id, item_id))
+                elif fallback_item is None:
+                    continue
+                else:
+                    item_id = fallback_item # Already sold at this event
+            price = rng.choices(PRICES, cum_weights=price_weights)[0]
+            weight = weights[item_id - first_item_id]
+            if weight >= 2:
+                price *= round(weight)
+            batch.append({
+                'event_id': event_id, 'buyer_id': rng.choices(buyer_ids, cum_weights=buyer_weights)[0],
+                'item_id': item_id, 'quantity': 1, 'total_price': float(price),
+                'timestamp': plans[plan_index].gregorian_date + timedelta(hours=8, seconds=rng.randrange(4 * 3600)),
+                'is_manual_entry': rng.random() < 0.02,
+            })
+            if len(batch) >= BATCH_SIZE:
+                conn.execute(insert(Purchase), batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Purchase), batch)
+            written += len(batch)
+        conn.exec_driver_sql('ANALYZE')
+
+    logger.info(f"Seeded {len(plans)} events, {buyers} buyers, {items} items, {written} purchases.")
+    return SeedCounts(len(plans), buyers, items, written)
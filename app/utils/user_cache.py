@@ -0,0 +1,130 @@
+# file: app/utils/user_cache.py
+# TTL cache behind Flask-Login's user_loader. Scanner stations send a request
+# per barcode; with the cache, login_required/admin_required on those requests
+# don't query the users table. Entries are plain snapshots (not ORM objects,
+# which would be detached and expired across requests), keyed by user id and
+# Flask-Login session id, and dropped when a user's password or role changes,
+# the user is deleted or logs out. Each worker process has its own cache, so a
+# change made in another worker is picked up within USER_CACHE_TTL seconds.
+import threading
+import time
+from flask import current_app, session
+from flask_login import UserMixin, user_logged_out
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.models import User
+
+# Bound on cached sessions; expired entries are evicted first
+MAX_ENTRIES = 1024
+
+_cache = {} # (user_id, session_id) -> (expires_at, SessionUser)
+_cache_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'expired': 0, 'invalidations': 0}
+
+
+class SessionUser(UserMixin):
+    """The fields requests need from the logged-in user (current_user)."""
+    __slots__ = ('id', 'username', 'is_admin')
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
+
+def load_cached_user(user_id: int):
+    """Returns the SessionUser for user_id, from the cache when fresh. None if the user doesn't exist."""
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+    key = (user_id, session.get('_id'))
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            _counters['hits'] += 1
+            return entry[1]
+        _counters['expired' if entry else 'misses'] += 1
+
+    row = db.session.execute(
+        select(User.id, User.username, User.is_admin).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    user = SessionUser(*row)
+    if ttl > 0:
+        with _cache_lock:
+            if len(_cache) >= MAX_ENTRIES:
+                _evict(now)
+            _cache[key] = (now + ttl, user)
+    return user
+
+
+def _evict(now: float):
+    """Drops expired entries, or the oldest half if none have expired (lock held)."""
+    expired = [key for key, (expires_at, _) in _cache.items() if expires_at <= now]
+    if not expired:
+        expired = sorted(_cache, key=lambda key: _cache[key][0])[:len(_cache) // 2]
+    for key in expired:
+        del _cache[key]
+
+
+def invalidate_user(user_id: int = None):
+    """Drops the cached sessions of one user, or of all users."""
+    with _cache_lock:
+        keys = list(_cache) if user_id is None else [key for key in _cache if key[0] == user_id]
+        for key in keys:
+            del _cache[key]
+        _counters['invalidations'] += 1
+
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        stats = dict(_counters, entries=len(_cache))
+    lookups = stats['hits'] + stats['misses'] + stats['expired']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    return stats
+
+
+# --- Invalidation ---
+
+def _pending(target):
+    """Remembers a changed user so the cache is dropped again once the change is committed."""
+    sess = object_session(target)
+    if sess is not None and target.id is not None:
+        sess.info.setdefault('user_cache_invalidate', set()).add(target.id)
+
+
+@event.listens_for(User.password_hash, 'set')
+@event.listens_for(User.is_admin, 'set')
+@event.listens_for(User.username, 'set')
+def _user_changed(target, value, oldvalue, initiator):
+    if target.id is not None:
+        invalidate_user(target.id)
+        _pending(target)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(sess):
+    for user_id in sess.info.pop('user_cache_invalidate', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(sess):
+    sess.info.pop('user_cache_invalidate', None)
+
+
+def _logged_out(sender, user=None, **extra):
+    if user is not None and getattr(user, 'id', None) is not None:
+        invalidate_user(user.id)
+
+
+user_logged_out.connect(_logged_out)
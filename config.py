@@ -13,4 +13,51 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     # --- Load the API Key ---
-    ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
\ No newline at end of file
+    ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+
+    # --- Hebrew calendar table span (Hebrew years, inclusive) ---
+    HEBREW_CALENDAR_FIRST_YEAR = int(os.environ.get('HEBREW_CALENDAR_FIRST_YEAR', 5780))
+    HEBREW_CALENDAR_LAST_YEAR = int(os.environ.get('HEBREW_CALENDAR_LAST_YEAR', 5800))
+
+    # --- Ledger CSVs written before an event is deleted ---
+    EVENT_ARCHIVE_DIR = os.environ.get('EVENT_ARCHIVE_DIR') or os.path.join(basedir, 'archives')
+
+    # --- Per-Hebrew-year purchase archives (see `flask archive-year`) ---
+    PURCHASE_ARCHIVE_DIR = os.environ.get('PURCHASE_ARCHIVE_DIR') or os.path.join(basedir, 'archives', 'purchases')
+
+    # --- SQLite engine profile (see app/utils/db_utils.py) ---
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', '1') != '0' # WAL, pragmas, writer lock, reader engine
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL') # Safe with WAL; FULL for extra durability
+    SQLITE_READER_POOL_SIZE = int(os.environ.get('SQLITE_READER_POOL_SIZE', 4))
+
+    # --- Per-request SQL profiler (see /admin/sql_profile) ---
+    SQL_PROFILER = os.environ.get('SQL_PROFILER', '0') == '1'
+    SQL_PROFILER_SLOW_MS = float(os.environ.get('SQL_PROFILER_SLOW_MS', 250)) # Log requests spending this long in SQL
+    SQL_PROFILER_MAX_QUERIES = int(os.environ.get('SQL_PROFILER_MAX_QUERIES', 25)) # ...or running this many queries
+    SQL_PROFILER_N_PLUS_ONE = int(os.environ.get('SQL_PROFILER_N_PLUS_ONE', 5)) # Same statement this often = N+1
+
+    # --- Logged-in user cache (see app/utils/user_cache.py) ---
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60)) # Seconds; 0 disables
+
+    # --- Camera scanner ---
+    # Part of the camera picture that is decoded: x, y, width, height as fractions of the frame
+    SCANNER_ROI = os.environ.get('SCANNER_ROI', '0,0.2,1,0.6')
+    # Signs composite CARD: barcodes (see app/utils/card_codes.py); changing it invalidates printed cards
+    CARD_SIGNING_KEY = os.environ.get('CARD_SIGNING_KEY') or SECRET_KEY
+
+    # --- Duplicate scan suppression (see app/utils/scan_dedupe.py) ---
+    # A station's repeat of the same barcode within this many ms is ignored; 0 disables a type
+    SCAN_DUPLICATE_WINDOW_MS = {
+        'BUYER': int(os.environ.get('SCAN_DUPLICATE_BUYER_MS', 1500)),
+        'ITEM': int(os.environ.get('SCAN_DUPLICATE_ITEM_MS', 1500)),
+        'PRICE': int(os.environ.get('SCAN_DUPLICATE_PRICE_MS', 600)), # Short: price cards are rescanned on purpose
+        'CARD': int(os.environ.get('SCAN_DUPLICATE_CARD_MS', 1500)),
+    }
+
+    # --- Live auctions (see app/utils/auction_book.py) ---
+    AUCTION_MIN_INCREMENT = float(os.environ.get('AUCTION_MIN_INCREMENT', 1)) # A bid must beat the high bid by this much
+    AUCTION_FLUSH_MS = int(os.environ.get('AUCTION_FLUSH_MS', 250)) # How often accepted bids are written
+
+    # --- Year-end buyer statements (see app/utils/statement_utils.py) ---
+    STATEMENT_WORKERS = int(os.environ.get('STATEMENT_WORKERS', 0)) # PDF rendering processes, 0 = one per CPU
@@ -0,0 +1,68 @@
+"""Add purchase archive tables
+
+Revision ID: 7c1f4e2a9b31
+Revises: 20323f22464e
+Create Date: 2026-10-19 19:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1f4e2a9b31'
+down_revision = '20323f22464e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('purchase_archives',
+    sa.Column('hebrew_year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('purchase_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hebrew_year')
+    )
+    op.create_table('archived_buyer_totals',
+    sa.Column('event_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('buyer_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('hebrew_year', sa.Integer(), nullable=False),
+    sa.Column('purchase_count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.PrimaryKeyConstraint('event_id', 'buyer_id')
+    )
+    with op.batch_alter_table('archived_buyer_totals', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_buyer_totals_buyer_id'), ['buyer_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_buyer_totals_hebrew_year'), ['hebrew_year'], unique=False)
+
+    op.create_table('archived_item_totals',
+    sa.Column('event_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('item_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('hebrew_year', sa.Integer(), nullable=False),
+    sa.Column('purchase_count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.ForeignKeyConstraint(['item_id'], ['items.id'], ),
+    sa.PrimaryKeyConstraint('event_id', 'item_id')
+    )
+    with op.batch_alter_table('archived_item_totals', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_item_totals_hebrew_year'), ['hebrew_year'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_item_totals_item_id'), ['item_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('archived_item_totals', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_item_totals_item_id'))
+        batch_op.drop_index(batch_op.f('ix_archived_item_totals_hebrew_year'))
+
+    op.drop_table('archived_item_totals')
+    with op.batch_alter_table('archived_buyer_totals', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_buyer_totals_hebrew_year'))
+        batch_op.drop_index(batch_op.f('ix_archived_buyer_totals_buyer_id'))
+
+    op.drop_table('archived_buyer_totals')
+    op.drop_table('purchase_archives')
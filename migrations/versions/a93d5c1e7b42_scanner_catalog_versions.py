@@ -0,0 +1,46 @@
+"""Scanner catalog versions: buyer/item updated_at and catalog tombstones
+
+Revision ID: a93d5c1e7b42
+Revises: e5f2a7c3d914
+Create Date: 2026-10-19 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93d5c1e7b42'
+down_revision = 'e5f2a7c3d914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('buyers', 'items'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+            batch_op.create_index(batch_op.f(f'ix_{table}_updated_at'), ['updated_at'], unique=False)
+        # Existing rows count as changed now, so every scanner reloads its catalog once
+        op.execute(sa.text(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP"))
+
+    op.create_table('catalog_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('barcode_id', sa.String(length=50), nullable=False),
+    sa.Column('removed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('catalog_tombstones', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_catalog_tombstones_removed_at'), ['removed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('catalog_tombstones', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_catalog_tombstones_removed_at'))
+    op.drop_table('catalog_tombstones')
+
+    for table in ('items', 'buyers'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_updated_at'))
+            batch_op.drop_column('updated_at')
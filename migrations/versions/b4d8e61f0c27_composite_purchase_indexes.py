@@ -0,0 +1,66 @@
+"""Composite purchase indexes, event date index, unique item barcodes, lower(name) indexes
+
+Revision ID: b4d8e61f0c27
+Revises: 7c1f4e2a9b31
+Create Date: 2026-10-19 20:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d8e61f0c27'
+down_revision = '7c1f4e2a9b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        # Single-column indexes are covered by the leading column of a composite one
+        batch_op.drop_index('ix_purchases_timestamp')
+        batch_op.drop_index('ix_purchases_item_id')
+        batch_op.drop_index('ix_purchases_event_id')
+        batch_op.drop_index('ix_purchases_buyer_id')
+        batch_op.create_index('ix_purchases_event_timestamp', ['event_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_purchases_event_item_price', ['event_id', 'item_id', 'total_price'], unique=False)
+        batch_op.create_index('ix_purchases_event_buyer_price', ['event_id', 'buyer_id', 'total_price'], unique=False)
+        batch_op.create_index('ix_purchases_buyer_timestamp', ['buyer_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_purchases_item_timestamp', ['item_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        # The model declares item barcodes unique; the initial migration indexed them non-unique
+        batch_op.drop_index('ix_items_barcode_id')
+        batch_op.create_index('ix_items_barcode_id', ['barcode_id'], unique=True)
+
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_events_gregorian_date'), ['gregorian_date'], unique=False)
+
+    op.create_index('ix_buyers_name_lower', 'buyers', [sa.text('lower(name)')], unique=False)
+    op.create_index('ix_items_name_lower', 'items', [sa.text('lower(name)')], unique=False)
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    # Later downgrades rebuild items/buyers in batch mode, which drops these expression indexes
+    op.execute('DROP INDEX IF EXISTS ix_items_name_lower')
+    op.execute('DROP INDEX IF EXISTS ix_buyers_name_lower')
+
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_events_gregorian_date'))
+
+    with op.batch_alter_table('items', schema=None) as batch_op:
+        batch_op.drop_index('ix_items_barcode_id')
+        batch_op.create_index('ix_items_barcode_id', ['barcode_id'], unique=False)
+
+    with op.batch_alter_table('purchases', schema=None) as batch_op:
+        batch_op.drop_index('ix_purchases_item_timestamp')
+        batch_op.drop_index('ix_purchases_buyer_timestamp')
+        batch_op.drop_index('ix_purchases_event_buyer_price')
+        batch_op.drop_index('ix_purchases_event_item_price')
+        batch_op.drop_index('ix_purchases_event_timestamp')
+        batch_op.create_index('ix_purchases_buyer_id', ['buyer_id'], unique=False)
+        batch_op.create_index('ix_purchases_event_id', ['event_id'], unique=False)
+        batch_op.create_index('ix_purchases_item_id', ['item_id'], unique=False)
+        batch_op.create_index('ix_purchases_timestamp', ['timestamp'], unique=False)
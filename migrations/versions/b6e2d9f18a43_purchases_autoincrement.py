@@ -0,0 +1,35 @@
+"""Never reuse purchase ids (AUTOINCREMENT) and unlink payments from deleted purchases
+
+Revision ID: b6e2d9f18a43
+Revises: f3c9a2d57e18
+Create Date: 2026-10-21 14:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d9f18a43'
+down_revision = 'f3c9a2d57e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Payments and sold lots of purchases deleted before this revision point at ids
+    # that a new purchase could take; they become payments on account
+    op.execute('UPDATE payments SET purchase_id = NULL '
+               'WHERE purchase_id IS NOT NULL AND purchase_id NOT IN (SELECT id FROM purchases)')
+    op.execute('UPDATE auction_lots SET purchase_id = NULL '
+               'WHERE purchase_id IS NOT NULL AND purchase_id NOT IN (SELECT id FROM purchases)')
+    # Rebuilds the table; SQLite starts its sequence at the largest id copied
+    with op.batch_alter_table('purchases', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+
+def downgrade():
+    with op.batch_alter_table('purchases', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
@@ -0,0 +1,37 @@
+"""Never reuse buyer ids (AUTOINCREMENT), so a buyer merge can always be undone
+
+Revision ID: c5a7e3f92b16
+Revises: b6e2d9f18a43
+Create Date: 2026-10-22 10:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e3f92b16'
+down_revision = 'b6e2d9f18a43'
+branch_labels = None
+depends_on = None
+
+
+def _rebuild_buyers(autoincrement: bool):
+    # Batch mode can't reflect the expression index, so it is dropped and recreated around the copy
+    op.execute('DROP INDEX IF EXISTS ix_buyers_name_lower')
+    with op.batch_alter_table('buyers', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+    op.create_index('ix_buyers_name_lower', 'buyers', [sa.text('lower(name)')], unique=False)
+
+
+def upgrade():
+    # Rebuilds the table; SQLite starts its sequence at the largest id copied
+    _rebuild_buyers(True)
+    # Buyers merged away (and still undoable) may have held larger ids than any left
+    op.execute("UPDATE sqlite_sequence SET seq = (SELECT max(old_buyer_id) FROM buyer_aliases) "
+               "WHERE name = 'buyers' AND seq < (SELECT max(old_buyer_id) FROM buyer_aliases)")
+
+
+def downgrade():
+    _rebuild_buyers(False)
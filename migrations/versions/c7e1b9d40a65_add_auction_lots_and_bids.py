@@ -0,0 +1,62 @@
+"""Add auction lots and bids
+
+Revision ID: c7e1b9d40a65
+Revises: a93d5c1e7b42
+Create Date: 2026-10-19 23:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e1b9d40a65'
+down_revision = 'a93d5c1e7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('auction_lots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('high_bid', sa.Float(), nullable=True),
+    sa.Column('high_bidder_id', sa.Integer(), nullable=True),
+    sa.Column('purchase_id', sa.Integer(), nullable=True),
+    sa.Column('opened_at', sa.DateTime(), nullable=True),
+    sa.Column('closed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.ForeignKeyConstraint(['high_bidder_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['item_id'], ['items.id'], ),
+    sa.ForeignKeyConstraint(['purchase_id'], ['purchases.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('auction_lots', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_auction_lots_event_id'), ['event_id'], unique=False)
+
+    op.create_table('auction_bids',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('placed_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['lot_id'], ['auction_lots.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('auction_bids', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_auction_bids_lot_id'), ['lot_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('auction_bids', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_auction_bids_lot_id'))
+    op.drop_table('auction_bids')
+
+    with op.batch_alter_table('auction_lots', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_auction_lots_event_id'))
+    op.drop_table('auction_lots')
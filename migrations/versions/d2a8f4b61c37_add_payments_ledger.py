@@ -0,0 +1,125 @@
+"""Add payments ledger, buyer balances, bank statement imports and buyer name keys
+
+Revision ID: d2a8f4b61c37
+Revises: c7e1b9d40a65
+Create Date: 2026-10-20 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a8f4b61c37'
+down_revision = 'c7e1b9d40a65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in by the app on first use (app/utils/name_keys.py)
+    with op.batch_alter_table('buyers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_key', sa.String(length=120), nullable=True))
+        batch_op.create_index(batch_op.f('ix_buyers_name_key'), ['name_key'], unique=False)
+
+    op.create_table('bank_imports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('imported_at', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('line_count', sa.Integer(), nullable=False),
+    sa.Column('matched_count', sa.Integer(), nullable=False),
+    sa.Column('review_count', sa.Integer(), nullable=False),
+    sa.Column('duplicate_count', sa.Integer(), nullable=False),
+    sa.Column('ignored_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    op.create_table('payments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('purchase_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('paid_on', sa.Date(), nullable=False),
+    sa.Column('method', sa.String(length=20), nullable=False),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('payer_name', sa.String(length=200), nullable=True),
+    sa.Column('payer_key', sa.String(length=200), nullable=True),
+    sa.Column('notes', sa.String(length=300), nullable=True),
+    sa.Column('bank_import_id', sa.Integer(), nullable=True),
+    sa.Column('fingerprint', sa.String(length=40), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['bank_import_id'], ['bank_imports.id'], ),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['purchase_id'], ['purchases.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('fingerprint')
+    )
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.create_index('ix_payments_buyer_paid_on', ['buyer_id', 'paid_on'], unique=False)
+        batch_op.create_index(batch_op.f('ix_payments_purchase_id'), ['purchase_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_payments_payer_key'), ['payer_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_payments_bank_import_id'), ['bank_import_id'], unique=False)
+
+    op.create_table('buyer_balances',
+    sa.Column('buyer_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('pledged', sa.Float(), nullable=False),
+    sa.Column('paid', sa.Float(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.PrimaryKeyConstraint('buyer_id')
+    )
+    with op.batch_alter_table('buyer_balances', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_buyer_balances_balance'), ['balance'], unique=False)
+
+    op.create_table('bank_import_lines',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('import_id', sa.Integer(), nullable=False),
+    sa.Column('line_no', sa.Integer(), nullable=False),
+    sa.Column('paid_on', sa.Date(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=True),
+    sa.Column('payer_name', sa.String(length=200), nullable=True),
+    sa.Column('reference', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.String(length=300), nullable=True),
+    sa.Column('fingerprint', sa.String(length=40), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('match_rule', sa.String(length=10), nullable=True),
+    sa.Column('candidates', sa.String(length=200), nullable=True),
+    sa.Column('buyer_id', sa.Integer(), nullable=True),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['import_id'], ['bank_imports.id'], ),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('bank_import_lines', schema=None) as batch_op:
+        batch_op.create_index('ix_bank_import_lines_import_status', ['import_id', 'status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_bank_import_lines_fingerprint'), ['fingerprint'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bank_import_lines', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_bank_import_lines_fingerprint'))
+        batch_op.drop_index('ix_bank_import_lines_import_status')
+    op.drop_table('bank_import_lines')
+
+    with op.batch_alter_table('buyer_balances', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_buyer_balances_balance'))
+    op.drop_table('buyer_balances')
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payments_bank_import_id'))
+        batch_op.drop_index(batch_op.f('ix_payments_payer_key'))
+        batch_op.drop_index(batch_op.f('ix_payments_purchase_id'))
+        batch_op.drop_index('ix_payments_buyer_paid_on')
+    op.drop_table('payments')
+
+    op.drop_table('bank_imports')
+
+    with op.batch_alter_table('buyers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_buyers_name_key'))
+        batch_op.drop_column('name_key')
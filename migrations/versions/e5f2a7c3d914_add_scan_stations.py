@@ -0,0 +1,31 @@
+"""Add scan stations for offline scanner replay
+
+Revision ID: e5f2a7c3d914
+Revises: b4d8e61f0c27
+Create Date: 2026-10-19 21:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f2a7c3d914'
+down_revision = 'b4d8e61f0c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scan_stations',
+    sa.Column('station_id', sa.String(length=64), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=True),
+    sa.Column('last_seq', sa.Integer(), nullable=False),
+    sa.Column('state', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('station_id')
+    )
+
+
+def downgrade():
+    op.drop_table('scan_stations')
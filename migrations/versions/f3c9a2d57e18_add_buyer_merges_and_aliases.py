@@ -0,0 +1,65 @@
+"""Add buyer merges and buyer barcode aliases
+
+Revision ID: f3c9a2d57e18
+Revises: d2a8f4b61c37
+Create Date: 2026-10-21 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9a2d57e18'
+down_revision = 'd2a8f4b61c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('buyer_merges',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('target_name', sa.String(length=120), nullable=False),
+    sa.Column('source_summary', sa.String(length=500), nullable=False),
+    sa.Column('purchase_count', sa.Integer(), nullable=False),
+    sa.Column('undo_data', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('merged_at', sa.DateTime(), nullable=True),
+    sa.Column('undone_at', sa.DateTime(), nullable=True),
+    sa.Column('undone_by_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['target_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['undone_by_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('buyer_merges', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_buyer_merges_merged_at'), ['merged_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_buyer_merges_target_id'), ['target_id'], unique=False)
+
+    op.create_table('buyer_aliases',
+    sa.Column('barcode_id', sa.String(length=50), nullable=False),
+    sa.Column('buyer_id', sa.Integer(), nullable=False),
+    sa.Column('old_buyer_id', sa.Integer(), nullable=False),
+    sa.Column('merge_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['buyer_id'], ['buyers.id'], ),
+    sa.ForeignKeyConstraint(['merge_id'], ['buyer_merges.id'], ),
+    sa.PrimaryKeyConstraint('barcode_id')
+    )
+    with op.batch_alter_table('buyer_aliases', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_buyer_aliases_buyer_id'), ['buyer_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_buyer_aliases_merge_id'), ['merge_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_buyer_aliases_old_buyer_id'), ['old_buyer_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('buyer_aliases', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_buyer_aliases_old_buyer_id'))
+        batch_op.drop_index(batch_op.f('ix_buyer_aliases_merge_id'))
+        batch_op.drop_index(batch_op.f('ix_buyer_aliases_buyer_id'))
+    op.drop_table('buyer_aliases')
+
+    with op.batch_alter_table('buyer_merges', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_buyer_merges_target_id'))
+        batch_op.drop_index(batch_op.f('ix_buyer_merges_merged_at'))
+    op.drop_table('buyer_merges')